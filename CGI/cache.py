@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+"""
+On-disk cache used by the validator to keep work done on a file for the next time the same
+file is uploaded.
+
+Entries are pickled to one file each in the cache directory, named by their key. Reading an
+entry marks it as used; once the entries take more than 'maxBytes' the least recently used
+are removed. Entries are written to a temporary file and renamed into place, so several
+processes can share a directory without reading half written entries.
+
+Classes:
+
+- 'DiskCache': pickled values stored in a directory, evicted least recently used first.
+- 'MemoryCache': the most recently used values of a cache, kept in memory.
+
+Functions:
+
+- 'fileDigest()': returns the SHA-256 of the contents of a file.
+"""
+
+import os
+import time
+import errno
+import hashlib
+import tempfile
+import threading
+import cPickle as pickle
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+SUFFIX = ".pickle"
+
+class DiskCache(object):
+	"""
+	Stores pickled values in a directory, one file per key. The modification time of a file
+	is the last time its entry was used.
+
+	Parameters:
+	-'directory': directory entries are kept in, created if it does not exist.
+	-'maxBytes': total size the entries may take before the least recently used are removed.
+	"""
+
+	def __init__(self, directory, maxBytes=DEFAULT_MAX_BYTES):
+		self.directory = directory
+		self.maxBytes = maxBytes
+		try:
+			os.makedirs(directory)
+		except OSError as er:
+			if er.errno != errno.EEXIST:
+				raise
+
+	def __contains__(self, key):
+		return os.path.exists(self._path(key))
+
+	def __len__(self):
+		return len(self._entries())
+
+	def get(self, key, default=None):
+		"""
+		Returns the value stored under 'key', or 'default' if there is none. Entries that
+		can not be read are removed.
+		"""
+		path = self._path(key)
+		try:
+			with open(path, "rb") as f1:
+				value = pickle.load(f1)
+		except (IOError, OSError):
+			return default
+		except Exception: ## truncated or from an older version of the validator
+			self._remove(path)
+			return default
+
+		self._touch(path)
+		return value
+
+	def put(self, key, value):
+		"""
+		Stores 'value' under 'key', replacing any value already stored, then removes the
+		least recently used entries until the cache fits in 'maxBytes'.
+		"""
+		handle, temp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+		try:
+			with os.fdopen(handle, "wb") as f1:
+				pickle.dump(value, f1, pickle.HIGHEST_PROTOCOL)
+			os.rename(temp, self._path(key))
+		except:
+			self._remove(temp)
+			raise
+		self._touch(self._path(key))
+		self.evict()
+
+	def evict(self):
+		"""
+		Removes the least recently used entries until the cache fits in 'maxBytes'.
+		"""
+		entries = self._entries()
+		total = sum([size for used, size, path in entries])
+		for used, size, path in sorted(entries):
+			if total <= self.maxBytes:
+				break
+			self._remove(path)
+			total -= size
+
+	def clear(self):
+		"""
+		Removes every entry.
+		"""
+		for used, size, path in self._entries():
+			self._remove(path)
+
+	def _path(self, key):
+		return os.path.join(self.directory, key + SUFFIX)
+
+	def _entries(self):
+		entries = []
+		for name in os.listdir(self.directory):
+			if not name.endswith(SUFFIX):
+				continue
+			path = os.path.join(self.directory, name)
+			try:
+				stat = os.stat(path)
+			except OSError: ## removed by another process
+				continue
+			entries.append((stat.st_mtime, stat.st_size, path))
+		return entries
+
+	def _touch(self, path):
+		try:
+			now = time.time()
+			os.utime(path, (now, now))
+		except OSError:
+			pass
+
+	def _remove(self, path):
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+
+class MemoryCache(object):
+	"""
+	Keeps the most recently used values in memory, in front of another cache. Values read
+	from the other cache are kept in memory too, so a long running process only unpickles
+	an entry the first time it is used. Has the same get() and put() as DiskCache, and can
+	be used from several threads at once.
+
+	Parameters:
+	-'maxEntries': number of values kept in memory.
+	-'backing': a DiskCache values are also stored in and read from, or None.
+	"""
+
+	def __init__(self, maxEntries=8, backing=None):
+		self.maxEntries = maxEntries
+		self.backing = backing
+		self._values = OrderedDict()	## key -> value, least recently used first
+		self._lock = threading.Lock()
+
+	def __contains__(self, key):
+		with self._lock:
+			if key in self._values:
+				return True
+		return self.backing is not None and key in self.backing
+
+	def __len__(self):
+		return len(self._values)
+
+	def get(self, key, default=None):
+		with self._lock:
+			if key in self._values:
+				value = self._values.pop(key)
+				self._values[key] = value ## now the most recently used
+				return value
+		if self.backing is None:
+			return default
+		value = self.backing.get(key) ## read outside the lock, other threads need not wait on the disk
+		if value is None:
+			return default
+		self._keep(key, value)
+		return value
+
+	def put(self, key, value):
+		self._keep(key, value)
+		if self.backing is not None:
+			self.backing.put(key, value)
+
+	def clear(self):
+		with self._lock:
+			self._values.clear()
+
+	def _keep(self, key, value):
+		with self._lock:
+			self._values.pop(key, None)
+			self._values[key] = value
+			while len(self._values) > self.maxEntries:
+				self._values.popitem(last=False)
+
+"""
+Returns the SHA-256 of the contents of a file as a hex string.
+
+Parameters:
+-'path': the file.
+"""
+def fileDigest(path, blockSize=1024*1024):
+	digest = hashlib.sha256()
+	with open(path, "rb") as f1:
+		block = f1.read(blockSize)
+		while block:
+			digest.update(block)
+			block = f1.read(blockSize)
+	return digest.hexdigest()
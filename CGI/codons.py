@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+"""
+Codon tables used by the validator to translate genes.
+
+Tables are built once, when the module is imported, for every genetic code in
+'GENETIC_CODES'. Codes are numbered as in the NCBI list of genetic codes:
+
+- 1: standard code.
+- 4: mold, protozoan and Mycoplasma/Spiroplasma code (TGA codes for W).
+- 11: bacterial, archaeal and plant plastid code (the default, phages use their host's code).
+
+Genes are checked against a CodonIndex: the positions of every start and stop codon of a
+genome, found once per genome instead of translating each gene.
+
+Classes:
+
+- 'CodonIndex': start and stop codon positions of a genome, by strand and frame.
+
+Functions:
+
+- 'translate()': translates a nucleotide sequence into a protein sequence.
+- 'codonTable()': returns the codon to amino acid dictionary for a genetic code.
+- 'reverseComplement()': returns the reverse complement of a nucleotide sequence.
+- 'codonIndex()': returns the CodonIndex of a genome, reusing the ones built recently.
+- 'rememberIndex()': sets the CodonIndex codonIndex() returns for a genome.
+"""
+
+import re
+import string
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+BASES = "TCAG"
+
+## amino acids for each codon, codons ordered TTT, TTC, TTA, TTG, TCT, ... GGG
+GENETIC_CODES = {
+	1: "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+	4: "FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+	11: "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG",
+}
+
+DEFAULT_CODE = 11
+
+START_CODONS = ("ATG", "GTG", "TTG")
+
+CODONS = [a + b + c for a in BASES for b in BASES for c in BASES]
+
+_tables = dict()
+for _code, _aminoAcids in GENETIC_CODES.items():
+	_tables[_code] = dict(zip(CODONS, _aminoAcids))
+
+"""
+Returns the dictionary of codons paired with the amino acid they translate for.
+
+Parameters:
+-'code': number of the genetic code, must be a key of 'GENETIC_CODES'.
+"""
+def codonTable(code=DEFAULT_CODE):
+	try:
+		return _tables[code]
+	except KeyError:
+		raise ValueError("unknown genetic code: " + str(code))
+
+"""
+Translates a nucleotide sequence into a protein sequence. The sequence is cut into codons
+and each codon is looked up in the precomputed table for the genetic code, any bases left
+over after the last full codon are ignored.
+
+Raises KeyError if a codon contains anything other than A, C, G or T (either case).
+
+Parameters:
+-'nucSeq': string of nucleotides.
+-'code': number of the genetic code to translate with.
+
+Output:
+-'protSeq': string of proteins.
+"""
+def translate(nucSeq, code=DEFAULT_CODE):
+	table = codonTable(code)
+	nucSeq = nucSeq.upper()
+	return ''.join([table[nucSeq[i:i+3]] for i in xrange(0, len(nucSeq) - 2, 3)])
+
+_complement = string.maketrans("ACGTNacgtn", "TGCANtgcan")
+
+"""
+Returns the reverse complement of a nucleotide sequence. Characters other than A, C, G, T
+and N (either case) are left as they are.
+
+Parameters:
+-'nucSeq': string of nucleotides.
+"""
+def reverseComplement(nucSeq):
+	return nucSeq.translate(_complement)[::-1]
+
+class CodonIndex(object):
+	"""
+	Sorted arrays of the positions of every start and stop codon of a genome, one array per
+	strand and frame, plus the positions of any base that is not A, C, G or T. With these a
+	gene's codons can be checked with a few binary searches instead of translating it.
+
+	Positions are 0-based and counted 5' to 3' along their own strand, so on the '-' strand
+	position 0 is the last base of the genome. span() converts gene coordinates to these
+	positions and toGenome() converts them back.
+	"""
+
+	def __init__(self, Seq, code=DEFAULT_CODE):
+		table = codonTable(code)
+		stops = [codon for codon in CODONS if table[codon] == "*"]
+		Seq = Seq.upper()
+		rcSeq = reverseComplement(Seq)
+
+		self.code = code
+		self.length = len(Seq)
+		self.stops = {"+": _framePositions(Seq, stops), "-": _framePositions(rcSeq, stops)}
+		self.starts = {"+": _framePositions(Seq, START_CODONS), "-": _framePositions(rcSeq, START_CODONS)}
+		self.unknown = array('l', [m.start() for m in re.finditer("[^ACGT]", Seq)])
+
+	def span(self, coord1, coord2, strand="+"):
+		"""
+		Returns the (first, last) positions a gene covers on its strand, last not included.
+		Coordinates outside the genome are clipped to it.
+
+		Parameters:
+		-'coord1': start coordinate of gene.
+		-'coord2': second coordinate of gene.
+		-'strand': '+' or '-', anything else is read as '+'.
+		"""
+		if strand == "-":
+			return max(self.length - coord2, 0), max(self.length - max(coord1, 1) + 1, 0)
+		return min(max(coord1, 1) - 1, self.length), max(min(coord2, self.length), 0)
+
+	def toGenome(self, position, strand="+"):
+		"""
+		Returns the coordinate (1-based, as in a gff file) of the base at a position on a
+		strand.
+
+		Parameters:
+		-'position': position on the strand.
+		-'strand': '+' or '-'.
+		"""
+		if strand == "-":
+			return self.length - position
+		return position + 1
+
+	def isStart(self, position, strand="+"):
+		"""
+		Returns True if a start codon begins at a position on a strand.
+		"""
+		return _contains(self.starts[_strand(strand)][position % 3], position)
+
+	def isStop(self, position, strand="+"):
+		"""
+		Returns True if a stop codon begins at a position on a strand.
+		"""
+		return _contains(self.stops[_strand(strand)][position % 3], position)
+
+	def stopsBetween(self, first, last, strand="+"):
+		"""
+		Returns the positions of the stop codons in the same frame as 'first' that begin at
+		or after 'first' and before 'last'.
+		"""
+		frame = self.stops[_strand(strand)][first % 3]
+		return frame[bisect_left(frame, first):bisect_left(frame, last)]
+
+	def nextStop(self, position, strand="+"):
+		"""
+		Returns the position of the first stop codon in frame at or after a position, None
+		if there is none before the end of the strand.
+		"""
+		frame = self.stops[_strand(strand)][position % 3]
+		i = bisect_left(frame, position)
+		if i < len(frame):
+			return frame[i]
+		return None
+
+	def nearestStart(self, position, strand="+"):
+		"""
+		Returns the position of the start codon in frame closest to a position without an
+		in frame stop codon between them, None if there is none.
+		"""
+		strand = _strand(strand)
+		frame = position % 3
+		stops = self.stops[strand][frame]
+		starts = self.starts[strand][frame]
+
+		i = bisect_left(stops, position)
+		lowest = -1
+		if i > 0:
+			lowest = stops[i-1]
+		highest = self.length
+		if i < len(stops):
+			highest = stops[i]
+
+		candidates = []
+		j = bisect_left(starts, position)
+		if j > 0 and starts[j-1] > lowest:
+			candidates.append(starts[j-1])
+		if j < len(starts) and starts[j] < highest:
+			candidates.append(starts[j])
+		if not candidates:
+			return None
+		return min(candidates, key=lambda start: abs(start - position))
+
+	def hasUnknown(self, first, last, strand="+"):
+		"""
+		Returns True if any base from 'first' up to (not including) 'last' on a strand is
+		not A, C, G or T.
+		"""
+		if strand == "-":
+			first, last = self.length - last, self.length - first
+		i = bisect_left(self.unknown, first)
+		return i < len(self.unknown) and self.unknown[i] < last
+
+MAX_INDEXES = 16	## CodonIndexes kept by codonIndex(), enough for every contig of a phage
+
+_indexCache = OrderedDict()	## (code, length, hash) -> (genome, CodonIndex), oldest first
+
+"""
+Returns the CodonIndex of a genome. The last MAX_INDEXES indexes built are kept and
+returned again while the same genome and genetic code are asked for, so checking a file's
+genes one at a time, or the genes of each contig of a file in turn, only builds each once.
+An index is only returned for a genome equal to the one it was built from, so two genomes
+with the same hash() do not share one.
+
+Parameters:
+-'Seq': string nucleotide sequence.
+-'code': number of the genetic code.
+"""
+def codonIndex(Seq, code=DEFAULT_CODE):
+	kept = _indexCache.get((code, len(Seq), hash(Seq)))
+	if kept is not None and (kept[0] is Seq or kept[0] == Seq):
+		return kept[1]
+	index = CodonIndex(Seq, code)
+	rememberIndex(Seq, index, keep=True)
+	return index
+
+"""
+Makes 'index' the CodonIndex codonIndex() returns for a genome, for an index that was built
+earlier and kept elsewhere (see cache.py).
+
+Parameters:
+-'Seq': string nucleotide sequence the index was built from.
+-'index': the CodonIndex of 'Seq'.
+-'keep': True to keep the indexes remembered before (the last MAX_INDEXES), as for the
+				other sequences of the same .fasta file.
+"""
+def rememberIndex(Seq, index, keep=False):
+	if not keep:
+		_indexCache.clear()
+	key = (index.code, len(Seq), hash(Seq))
+	_indexCache.pop(key, None)
+	_indexCache[key] = (Seq, index)
+	while len(_indexCache) > MAX_INDEXES:
+		_indexCache.popitem(last=False)
+
+def _strand(strand):
+	if strand == "-":
+		return "-"
+	return "+"
+
+def _contains(positions, position):
+	i = bisect_left(positions, position)
+	return i < len(positions) and positions[i] == position
+
+def _framePositions(Seq, codons):
+	frames = (array('l'), array('l'), array('l'))
+	for m in re.finditer("(?=" + "|".join(codons) + ")", Seq):
+		frames[m.start() % 3].append(m.start())
+	return frames
@@ -12,17 +12,36 @@ Exception classes:
 - 'Format Error': catches errors dealing with line format.
 - 'Line Error': catches errors dealing with individuel components of a line.
 - 'Biology Error': catches errors dealing with the described genes.
+
+Classes for reporting:
+
+- 'ErrorRecord': one error found, with its line, column, code, severity and message.
+- 'ErrorCollector': the errors found in one validation run.
+
+Functions:
+
+- 'errorMessage()': returns the message of an error code.
+- 'errorKind()': returns the kind of error a code is.
 """
 
+import threading
+from array import array
+from collections import namedtuple
+
 class ValidationError(Exception):
+	"""
+	The messages of each class are in its class level dictionary '_dict', built once when
+	the module is imported and shared by every exception raised (see also CATALOG).
+	"""
+
+	_dict = {
+		'0000': "Usage Error: code not used. Use printDict() to see dictionary of errors",
+		'1000': "Validation Error: unknown",
+	}
+
 	def __init__(self, code, message = ""):
         
-		_dict = dict()
-		_dict['0000'] = "Usage Error: code not used. Use printDict() to see dictionary of errors"
-		_dict['1000'] = "Validation Error: unknown"
-        
 		self.code = str(code)
-		self._dict = _dict
 		self.message = message
         
 		super(ValidationError, self).__init__(code, message)
@@ -32,56 +51,279 @@ class ValidationError(Exception):
 			print k + ":  " + v
             
 	def returnError(self):
-		try:
-			return self._dict[self.code]
-		except:
-			return self._dict['0000']
+		return self._dict.get(self.code, self._dict['0000'])
 
 
 class FormatError(ValidationError):
-	def __init__(self, code, message = ""):
-        
-		super(FormatError, self).__init__(code, message)
-        
-		self._dict['0100'] = "Format Error: unknown."
-		self._dict['0200'] = "Format Error: lines merged."
-		self._dict['0300'] = "Format Error: tab deliminated."
-		self._dict['0400'] = "Format Error: multiple contigs. There should only be one contig line per file."
-		self._dict['0500'] = "Format Error: each set of coordinates must have a line for each type. Types are seen at the third component. Default types are [gene, mRNA, exon]"
-		self._dict['0600'] = "Format Error: ensure only one sequence in fasta file."
+
+	_dict = dict(ValidationError._dict)
+	_dict.update({
+		'0100': "Format Error: unknown.",
+		'0200': "Format Error: lines merged.",
+		'0300': "Format Error: tab deliminated.",
+		'0400': "Format Error: multiple contigs. There should only be one contig line per sequence.",
+		'0500': "Format Error: each set of coordinates must have a line for each type. Types are seen at the third component. Default types are [gene, mRNA, exon]",
+		'0600': "Format Error: ensure only one sequence in fasta file.",
+		'0700': "Format Error: unable to read fasta file.",
+		'0800': "Format Error: two sequences in the fasta file have the same name.",
+	})
         
 
 class LineError(ValidationError):
-	def __init__(self, code, message = ""):
-        
-		super(LineError, self).__init__(code, message)
-
-		self._dict['0001'] = "Line Error: unknown"
-		self._dict['0002'] = "Line Error: 1st component = restrict characters used to a-Z/0-9/./=/;"
-		self._dict['0003'] = "Line Error: 2nd component = restrict characters used to a-Z/0-9/./=/;"
-		self._dict['0004'] = "Line Error: 3rd component = type not found in types. Default is [gene, mRNA, exon]."
-		self._dict['0005'] = "Line Error: 4th component = 1st coordinate must be positive."
-		self._dict['0006'] = "Line Error: 5th component = 2nd coordinate must be greater than the 1st coordinate."
-		self._dict['0007'] = "Line Error: 6th component = must be a number or '.'"
-		self._dict['0008'] = "Line Error: 7th component = must be '+' or '-'"
-		self._dict['0009'] = "Line Error: 8th component = must be '.'"
-		self._dict['0011'] = "Line Error: 9th component = restrict characters used to a-Z/0-9/./=/;"
-		self._dict['0012'] = "Line Error: 9th component = ID already used. Each ID must be unique."
-		self._dict['0013'] = "Line Error: 9th component = must have an ID and a name"
-		self._dict['0021'] = "Line Error: 9th component = bad sort or a gene does not have a line for each type. Default types are [gene, mRNA, exon]."
-		self._dict['0022'] = "Line Error: 9th component = restrict characters used to a-Z/0-9/./=/;"
-		self._dict['0023'] = "Line Error: 9th component = ID already used. Each ID must be unique."
-		self._dict['0024'] = "Line Error: 9th component = last type, must at least have a Parent."
-		self._dict['0025'] = "Line Error: 9th component = must have an ID and a Parent."
+
+	_dict = dict(ValidationError._dict)
+	_dict.update({
+		'0001': "Line Error: unknown",
+		'0002': "Line Error: 1st component = restrict characters used to a-Z/0-9/./=/;",
+		'0003': "Line Error: 2nd component = restrict characters used to a-Z/0-9/./=/;",
+		'0004': "Line Error: 3rd component = type not found in types. Default is [gene, mRNA, exon].",
+		'0005': "Line Error: 4th component = 1st coordinate must be positive.",
+		'0006': "Line Error: 5th component = 2nd coordinate must be greater than the 1st coordinate.",
+		'0007': "Line Error: 6th component = must be a number or '.'",
+		'0008': "Line Error: 7th component = must be '+' or '-'",
+		'0009': "Line Error: 8th component = must be '.'",
+		'0011': "Line Error: 9th component = restrict characters used to a-Z/0-9/./=/;",
+		'0012': "Line Error: 9th component = ID already used. Each ID must be unique.",
+		'0013': "Line Error: 9th component = must have an ID and a name",
+		'0014': "Line Error: 1st component = sequence not found in the fasta file. The 1st component must be the name of a sequence.",
+		'0021': "Line Error: 9th component = bad sort or a gene does not have a line for each type. Default types are [gene, mRNA, exon].",
+		'0022': "Line Error: 9th component = restrict characters used to a-Z/0-9/./=/;",
+		'0023': "Line Error: 9th component = ID already used. Each ID must be unique.",
+		'0024': "Line Error: 9th component = last type, must at least have a Parent.",
+		'0025': "Line Error: 9th component = must have an ID and a Parent.",
+		'0026': "Line Error: 9th component = Parent not found. Each Parent must be the ID of another line.",
+		'0027': "Line Error: 9th component = no line of the next type names this ID as its Parent. Default types are [gene, mRNA, exon].",
+		'0028': "Line Error: 9th component = Parent is not of the type just above this one. Default types are [gene, mRNA, exon].",
+		'0029': "Line Error: 9th component = coordinates are not within the coordinates of the Parent.",
+		'0031': "Line Error: 9th component = Parent loop. Following the Parents of this line leads back to it.",
+	})
         
         
+## component of the line each Line Error is about
+COLUMNS = {'0002': 1, '0003': 2, '0004': 3, '0005': 4, '0006': 5, '0007': 6, '0008': 7, '0009': 8, '0014': 1,
+	'0011': 9, '0012': 9, '0013': 9, '0021': 9, '0022': 9, '0023': 9, '0024': 9, '0025': 9, '0026': 9,
+	'0027': 9, '0028': 9, '0029': 9, '0031': 9}
+
 class BiologyError(ValidationError):
-	def __init__(self, code, message = ""):
-        
-		super(BiologyError, self).__init__(code, message)
-        
-		self._dict['0010'] = "Biology Error: unknown"
-		self._dict['0020'] = "Biology Error: Incorrect start codon. Must start with M"
-		self._dict['0030'] = "Biology Error: No stop codon detected."
-		self._dict['0040'] = "Biology Error: Internal stop codons"
-		self._dict['0050'] = "Biology Error: total nucleotide count not divisible by three."    
\ No newline at end of file
+
+	_dict = dict(ValidationError._dict)
+	_dict.update({
+		'0010': "Biology Error: unknown",
+		'0020': "Biology Error: Incorrect start codon. Must start with M",
+		'0030': "Biology Error: No stop codon detected.",
+		'0040': "Biology Error: Internal stop codons",
+		'0050': "Biology Error: total nucleotide count not divisible by three.",
+		'0060': "Biology Warning: genes on the same strand overlap by more than a few bases.",
+		'0070': "Biology Error: gene annotated twice, another gene has the same coordinates and strand.",
+		'0080': "Biology Warning: long stretch of the genome without a gene.",
+	})
+
+## every code of every class paired with its message, and with the kind of error it is
+CATALOG = dict()
+_kinds = dict()
+for _kind, _errorClass in (('Validation', ValidationError), ('Format', FormatError), ('Line', LineError), ('Biology', BiologyError)):
+	for _code, _message in _errorClass._dict.iteritems():
+		if _code not in CATALOG:
+			CATALOG[_code] = _message
+			_kinds[_code] = _kind
+
+"""
+Returns the message of an error code, as returnError() of its exception class would.
+"""
+def errorMessage(code):
+	return CATALOG.get(code, CATALOG['0000'])
+
+SEVERITIES = ('error', 'warning')
+
+class ErrorRecord(namedtuple('ErrorRecord', 'line column code severity message coordinate')):
+	"""
+	One error found by the validator.
+
+	- 'line': line number the error is about, or None.
+	- 'column': component of the line (1 to 9) the error is about, or None.
+	- 'code': code of the error in the dictionaries of the exception classes above.
+	- 'severity': one of SEVERITIES.
+	- 'message': text of the error, without the line number.
+	- 'coordinate': start coordinate of the set of lines the error is about, or None.
+	"""
+	__slots__ = ()
+
+	def kind(self):
+		"""
+		Returns 'Format', 'Line', 'Biology' or 'Validation', the class the code belongs to.
+		"""
+		return errorKind(self.code)
+
+	def __str__(self):
+		if self.coordinate is not None:
+			return "Coordinate " + self.coordinate + " " + self.message
+		if self.line is not None:
+			return "[" + str(self.line) + "] " + self.message
+		return self.message
+
+class ErrorCollector(object):
+	"""
+	Errors found in one validation run, in the order they were found. Every run gets its
+	own collector, so runs in different threads do not share any state; a collector can
+	also be added to from several threads at once.
+
+	Records are kept column-wise (line numbers and columns in arrays, codes interned) and
+	built as ErrorRecords when read.
+
+	The collector also indexes the raw line of the gff file each error is about, given
+	when the error is added or attached to it afterwards, so a report can show the line
+	next to the error without searching the file for it (see source()).
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._lines = array('l')		## -1 for no line
+		self._columns = array('b')		## 0 for no column
+		self._codes = []
+		self._severities = array('b')	## index in SEVERITIES
+		self._messages = []
+		self._coordinates = []
+		self._sources = dict()		## position of a record -> raw line it is about
+
+	def __len__(self):
+		return len(self._codes)
+
+	def __iter__(self):
+		return self.records()
+
+	def __getitem__(self, i):
+		line = self._lines[i]
+		if line < 0:
+			line = None
+		return ErrorRecord(line, self._columns[i] or None, self._codes[i], SEVERITIES[self._severities[i]], self._messages[i], self._coordinates[i])
+
+	def add(self, code, message, line=None, column=None, severity='error', coordinate=None, source=None):
+		"""
+		Adds an error.
+
+		Parameters:
+		-'code': code of the error.
+		-'message': text of the error, without the line number.
+		-'line', 'column', 'severity', 'coordinate': see ErrorRecord. The column of a Line
+				Error is taken from COLUMNS when not given.
+		-'source': raw line of the gff file the error is about, or None.
+		"""
+		if line is None:
+			line = -1
+		if column is None:
+			column = COLUMNS.get(code)
+		with self._lock:
+			self._lines.append(line)
+			self._columns.append(column or 0)
+			self._codes.append(intern(code))
+			self._severities.append(SEVERITIES.index(severity))
+			self._messages.append(message)
+			self._coordinates.append(coordinate)
+			if source is not None:
+				self._sources[len(self._codes) - 1] = source
+
+	def emit(self, code, line=None, detail="", column=None, coordinate=None, source=None):
+		"""
+		Adds an error with the message of its code in CATALOG, followed by 'detail'. Lets
+		checkers report an error without raising and catching an exception for it.
+		"""
+		self.add(code, CATALOG.get(code, CATALOG['0000']) + detail, line, column, 'error', coordinate, source)
+
+	def attach(self, start, source, end=None):
+		"""
+		Sets 'source' as the raw line of the records from position 'start' up to 'end' (or
+		the last record) that do not have one yet.
+		"""
+		if start >= len(self._codes):
+			return
+		with self._lock:
+			if end is None:
+				end = len(self._codes)
+			for i in xrange(start, end):
+				self._sources.setdefault(i, source)
+
+	def source(self, i):
+		"""
+		Returns the raw line the record at position 'i' is about, or None.
+		"""
+		return self._sources.get(i)
+
+	def __getstate__(self):
+		state = dict(self.__dict__)
+		del state['_lock'] ## collectors are pickled to send them between processes
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._lock = threading.Lock()
+
+	def merge(self, other):
+		"""
+		Adds the records of another ErrorCollector, with the lines attached to them.
+		"""
+		for i, record in enumerate(other):
+			self.add(record.code, record.message, record.line, record.column, record.severity, record.coordinate, other.source(i))
+
+	def extend(self, records):
+		"""
+		Adds ErrorRecords, such as the ones read from another collector.
+		"""
+		for record in records:
+			self.add(record.code, record.message, record.line, record.column, record.severity, record.coordinate)
+
+	def records(self, start=0):
+		"""
+		Returns the records from position 'start' on, in the order they were added.
+		"""
+		for i in xrange(start, len(self)):
+			yield self[i]
+
+	def truncate(self, size):
+		"""
+		Removes the records added after the first 'size'.
+		"""
+		with self._lock:
+			del self._lines[size:]
+			del self._columns[size:]
+			del self._codes[size:]
+			del self._severities[size:]
+			del self._messages[size:]
+			del self._coordinates[size:]
+			for i in [i for i in self._sources if i >= size]:
+				del self._sources[i]
+
+	def lines(self):
+		"""
+		Returns the errors as the lines written to the errors file.
+		"""
+		return [str(record) for record in self.records()]
+
+	def counts(self, severity=None):
+		"""
+		Returns a dictionary of each kind of error (see ErrorRecord.kind()) paired with the
+		number of errors of that kind, counting only those of 'severity' if given.
+		"""
+		counts = dict()
+		for i, code in enumerate(self._codes):
+			if severity is not None and SEVERITIES[self._severities[i]] != severity:
+				continue
+			kind = errorKind(code)
+			counts[kind] = counts.get(kind, 0) + 1
+		return counts
+
+	def codes(self):
+		"""
+		Returns a dictionary of each error code found paired with the number of errors with
+		that code.
+		"""
+		codes = dict()
+		for code in self._codes:
+			codes[code] = codes.get(code, 0) + 1
+		return codes
+
+"""
+Returns 'Format', 'Line', 'Biology' or 'Validation', the exception class an error code
+belongs to.
+"""
+def errorKind(code):
+	return _kinds.get(code, 'Validation')
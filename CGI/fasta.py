@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+"""
+Reader for .fasta files used by the validator.
+
+The file is memory-mapped and indexed the way samtools faidx indexes a file: for every
+record the offset of its first base, its length and its line layout. A slice of a record is
+then read straight from the mapped file without reading the rest of it.
+
+Classes:
+
+- 'FastaFile': an indexed, memory-mapped .fasta file.
+- 'PackedSequence': a nucleotide sequence stored at 2 bits per base.
+"""
+
+import mmap
+import re
+
+class FastaFile(object):
+	"""
+	Opens and indexes a .fasta file. Records are looked up by name, the first word of their
+	header line. Sequence lines found before any header belong to a record named "". The
+	names of records found again after a record of the same name are kept in 'duplicates',
+	and the first record of that name is the one read.
+
+	Raises IOError if the file can not be opened.
+
+	Parameters:
+	-'fasta_File': path of the .fasta file.
+	"""
+
+	def __init__(self, fasta_File):
+		self._file = open(fasta_File, "rb")
+		self._map = None
+		self._records = dict()	## name -> (offset, length, lineBases, lineWidth, end)
+		self._names = []
+		self.duplicates = []
+
+		try:
+			self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+		except ValueError:
+			return ## empty file, no records
+		self._index()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+		return False
+
+	def close(self):
+		if self._map is not None:
+			self._map.close()
+			self._map = None
+		self._file.close()
+
+	def names(self):
+		"""
+		Returns the names of the records, in the order they appear in the file.
+		"""
+		return list(self._names)
+
+	def length(self, name):
+		"""
+		Returns the number of bases in a record.
+		"""
+		return self._records[name][1]
+
+	def sequence(self, name):
+		"""
+		Returns the whole sequence of a record as a string.
+		"""
+		return self.fetch(name, 1, self.length(name))
+
+	def fetch(self, name, start, end):
+		"""
+		Returns the bases of a record from 'start' to 'end' (1-based, both included, as in a
+		gff file). Coordinates outside the record are clipped to it.
+
+		Parameters:
+		-'name': name of the record.
+		-'start': first base.
+		-'end': last base.
+		"""
+		offset, length, lineBases, lineWidth, recordEnd = self._records[name]
+		start = max(start, 1) - 1
+		end = min(end, length)
+		if end <= start:
+			return ""
+		if lineBases is None: ## uneven lines, the offsets can not be computed
+			return re.sub(r"\s", "", self._map[offset:recordEnd])[start:end]
+
+		first = offset + (start // lineBases) * lineWidth + start % lineBases
+		last = offset + ((end - 1) // lineBases) * lineWidth + (end - 1) % lineBases + 1
+		chunk = self._map[first:last]
+		if lineWidth > lineBases:
+			chunk = chunk.replace("\r", "").replace("\n", "")
+		return chunk
+
+	def _index(self):
+		mm = self._map
+		size = len(mm)
+		position = 0
+		name = ""
+		if size and mm[0] == ">":
+			name = None
+
+		while position < size:
+			if name is None: ## at a header line
+				eol = mm.find("\n", position)
+				if eol < 0:
+					eol = size
+				words = mm[position+1:eol].split()
+				name = ""
+				if words:
+					name = words[0]
+				position = eol + 1
+
+			header = mm.find("\n>", max(position - 1, 0))
+			if header < 0:
+				recordEnd = size
+			else:
+				recordEnd = header + 1
+			self._addRecord(name, position, recordEnd)
+
+			position = recordEnd
+			name = None
+
+	def _addRecord(self, name, offset, recordEnd):
+		mm = self._map
+		lines = [] ## (bases, width, no whitespace besides the line end) of each line
+
+		position = offset
+		while position < recordEnd:
+			eol = mm.find("\n", position, recordEnd)
+			if eol < 0:
+				eol = recordEnd
+				width = eol - position
+			else:
+				width = eol - position + 1
+			content = mm[position:eol]
+			bases = len(content.rstrip())
+			lines.append((bases, width, len(content.rstrip("\r")) == bases))
+			position = eol + 1
+
+		while lines and lines[-1][0] == 0:
+			lines.pop()
+		length = sum([line[0] for line in lines])
+
+		## the offset of a base can be computed when every line but the last has the same
+		## length and nothing but bases and the line end on it
+		lineBases = None
+		lineWidth = None
+		if lines:
+			lineBases, lineWidth = lines[0][0], lines[0][1]
+			for bases, width, clean in lines[:-1]:
+				if bases != lineBases or width != lineWidth or not clean:
+					lineBases = None
+					break
+			if not lines[-1][2] or lines[-1][0] > lines[0][0]:
+				lineBases = None
+
+		if name in self._records:
+			self.duplicates.append(name)
+			return
+		self._names.append(name)
+		self._records[name] = (offset, length, lineBases, lineWidth, recordEnd)
+
+
+_packCodes = dict()
+_unpackCodes = []
+for _byte in range(256):
+	_bases = "".join(["ACGT"[(_byte >> shift) & 3] for shift in (6, 4, 2, 0)])
+	_packCodes[_bases] = chr(_byte)
+	_unpackCodes.append(_bases)
+
+class PackedSequence(object):
+	"""
+	A nucleotide sequence stored at 2 bits per base, four bases to a byte. Bases other than
+	A, C, G and T are kept separately as runs, so the sequence unpacks exactly (upper case).
+
+	Parameters:
+	-'Seq': string nucleotide sequence.
+	"""
+
+	def __init__(self, Seq):
+		Seq = Seq.upper()
+		self.length = len(Seq)
+		self.unknown = [(m.start(), m.group()) for m in re.finditer("[^ACGT]+", Seq)]
+
+		if self.unknown:
+			Seq = re.sub("[^ACGT]", "A", Seq)
+		Seq += "A" * (-len(Seq) % 4)
+		self.packed = "".join(map(_packCodes.__getitem__, re.findall("....", Seq)))
+
+	def __len__(self):
+		return self.length
+
+	def __str__(self):
+		return self.fetch(1, self.length)
+
+	def fetch(self, start, end):
+		"""
+		Returns the bases from 'start' to 'end' (1-based, both included). Coordinates outside
+		the sequence are clipped to it.
+		"""
+		start = max(start, 1) - 1
+		end = min(end, self.length)
+		if end <= start:
+			return ""
+
+		bases = "".join(map(_unpackCodes.__getitem__, bytearray(self.packed[start // 4:(end + 3) // 4])))
+		bases = bases[start % 4:start % 4 + end - start]
+		for position, run in self.unknown:
+			if position < end and position + len(run) > start:
+				lo = max(position, start)
+				hi = min(position + len(run), end)
+				bases = bases[:lo-start] + run[lo-position:hi-position] + bases[hi-start:]
+		return bases
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+"""
+Table of the lines of a gff file, parsed once and kept column-wise so sorting, checking,
+the gene checks and writing the sorted file all read the same parsed values instead of
+splitting each line again.
+
+Classes:
+
+- 'FeatureTable': the lines of a gff file, one row per line.
+"""
+
+import re
+import sys
+from array import array
+
+## a line whose 1st to 8th components are all well formed, in one match: characters of the
+## 1st and 2nd as in charCheck(), plain numbers for the coordinates, a number or '.' for the
+## score, a strand and '.'. Lines it does not match are checked one component at a time.
+LINE_PATTERN = re.compile(r"([a-zA-Z0-9.=;]*)\t([a-zA-Z0-9.=;]*)\t([^\t]*)\t([0-9]+)\t([0-9]+)\t(?:\.|-?[0-9]+)\t([+-])\t\.\t([^\t]*)$")
+
+CONTIG = -1		## type code of a contig line
+UNKNOWN = -2	## type code of a type not in the hierarchy, or of a line without 9 components
+
+NO_COORDINATE = sys.maxint	## stored for a coordinate that is not an integer, so it sorts last
+
+class FeatureTable(object):
+	"""
+	The lines of a gff file, one row per line in the order they were read, so a row number
+	is also the line number in the file (starting at 0).
+
+	Every line is kept as read, for the sorted file and the errors file. Its components are
+	kept column-wise: the type as its position in the type hierarchy, the coordinates and
+	strand in arrays, the 1st and 2nd components interned (they repeat from line to line), and
+	the 9th component as its offset in the line.
+
+	Rows of lines LINE_PATTERN matches, with a type in the hierarchy, are marked well formed:
+	their 1st to 8th components need no further checking.
+
+	A row number identifies its line for good: lines sharing a type and start coordinate
+	(genes overlapping on opposite strands, for one) are separate rows.
+
+	Parameters:
+	-'types': the type hierarchy.
+	"""
+
+	def __init__(self, types=['gene','mRNA','exon']):
+		self.types = types
+		self._codes = dict([(type, code) for code, type in enumerate(types)])
+		self._codes['contig'] = CONTIG
+		self.lines = []
+		self.widths = array('b')		## number of components, at most 127
+		self.seqids = []
+		self.sources = []
+		self.typeCodes = array('b')		## position in 'types', CONTIG or UNKNOWN
+		self.starts = array('l')
+		self.ends = array('l')
+		self.strands = array('c')
+		self.attributes = array('l')	## offset of the 9th component in the line
+		self.wellFormed = array('b')
+
+	def __len__(self):
+		return len(self.lines)
+
+	def __getitem__(self, row):
+		return self.lines[row]
+
+	def append(self, line):
+		"""
+		Parses a line of the gff file and adds it as the next row. Lines without 9
+		components are added too, with only their line and width kept.
+
+		Output:
+		-'row': the row of the line.
+		"""
+		row = len(self.lines)
+		stripped = line.strip()
+		lead = len(line) - len(line.lstrip())
+		fields = LINE_PATTERN.match(stripped)
+		if fields is not None:
+			seqid, source, type, start, end, strand, attributes = fields.groups()
+			width = 9
+			offset = lead + fields.start(7)
+		else:
+			theLine = stripped.split("\t")
+			width = len(theLine)
+			if width != 9:
+				self._add(line, min(width, 127), "", "", UNKNOWN, NO_COORDINATE, NO_COORDINATE, ".", len(line), False)
+				return row
+			seqid, source, type, start, end, strand = theLine[0], theLine[1], theLine[2], theLine[3], theLine[4], theLine[6]
+			offset = lead + len(stripped) - len(theLine[8])
+
+		code = self._codes.get(type, UNKNOWN)
+		self._add(line, width, seqid, source, code, toCoordinate(start), toCoordinate(end),
+				strand[:1] or ".", offset, fields is not None and code != UNKNOWN)
+		return row
+
+	def _add(self, line, width, seqid, source, code, coord1, coord2, strand, offset, wellFormed):
+		self.lines.append(line)
+		self.widths.append(width)
+		self.seqids.append(intern(seqid))
+		self.sources.append(intern(source))
+		self.typeCodes.append(code)
+		self.starts.append(coord1)
+		self.ends.append(coord2)
+		self.strands.append(strand)
+		self.attributes.append(offset)
+		self.wellFormed.append(wellFormed)
+
+	def typeName(self, row):
+		"""
+		Returns the type of a row, or None if it is not in the hierarchy.
+		"""
+		code = self.typeCodes[row]
+		if code == CONTIG:
+			return "contig"
+		if code == UNKNOWN:
+			return None
+		return self.types[code]
+
+	def attributeText(self, row):
+		"""
+		Returns the 9th component of a row.
+		"""
+		return self.lines[row][self.attributes[row]:].rstrip()
+
+	def partitions(self, rows):
+		"""
+		Returns (seqid, first, end) for each run of 'rows' sharing a 1st component, such as
+		the sequences of a sorted file: rows[first:end] are the rows of 'seqid'.
+		"""
+		spans = []
+		seqids = self.seqids
+		first = 0
+		for i in xrange(1, len(rows) + 1):
+			if i == len(rows) or seqids[rows[i]] != seqids[rows[first]]:
+				spans.append((seqids[rows[first]], first, i))
+				first = i
+		return spans
+
+	def sortedRows(self, rows):
+		"""
+		Returns 'rows' ordered by start coordinate, then type, then end coordinate. Rows
+		with the same key stay in the order they were read.
+		"""
+		starts, codes, ends = self.starts, self.typeCodes, self.ends
+		return sorted(rows, key=lambda row: (starts[row], codes[row], ends[row], row))
+
+"""
+Converts a coordinate to an integer that fits the coordinate arrays, or NO_COORDINATE if
+it is not an integer.
+"""
+def toCoordinate(text):
+	try:
+		return max(min(int(text), NO_COORDINATE), -NO_COORDINATE)
+	except ValueError:
+		return NO_COORDINATE
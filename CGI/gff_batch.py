@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+
+"""
+Command line validation of many gff files at once, for regrading a class's submissions.
+
+Genomes are read once, before the worker processes are started, and kept in a MemoryCache
+(see cache.py) the workers inherit, so every worker reuses the parsed genome and its codon
+index instead of reading the .fasta file again for each gff file.
+
+Functions:
+
+- 'cli()': reads the command line and runs batch().
+- 'batch()': validates gff files across a pool of worker processes.
+- 'readGenomeMap()': reads a file pairing gff file names with .fasta files.
+- 'findGff3()': lists the gff files given as files or directories.
+- 'summaryTable()': formats the results of batch() as a table.
+
+How to Use This Module
+======================
+
+python gff_batch.py --fasta Phabio.fasta --out-dir reports/ submissions/
+python gff_batch.py --genomes genomes.txt --workers 8 --out-dir reports/ submissions/*.gff3
+
+A genome map has one line per genome: a file name pattern (as in fnmatch, matched against
+the name of the gff file) and the .fasta file used for the gff files it matches, separated
+by whitespace. The first matching line is used. Lines starting with '#' are skipped.
+
+For each gff file the errors file <name>.errors.txt and the sorted file <name>.sorted.gff3
+are written to the output directory, with summary.tsv listing every file checked.
+"""
+
+import os
+import sys
+import glob
+import fnmatch
+import argparse
+import traceback
+import multiprocessing
+
+import gff_validator_drop as gff_validator
+from cache import MemoryCache
+from codons import GENETIC_CODES, DEFAULT_CODE
+from errors import FormatError
+
+DEFAULT_TYPES = ['gene','mRNA','exon']
+
+GFF_PATTERNS = ['*.gff', '*.gff3']
+
+KINDS = ['Format', 'Line', 'Biology', 'Validation']
+
+_genomes = None
+
+"""
+Validates gff files across a pool of worker processes and writes an errors file and a
+sorted file for each to 'outDir'.
+
+Parameters:
+-'gffFiles': list of (gff file, .fasta file) pairs.
+-'outDir': directory reports are written to, created if it does not exist.
+-'workers': number of worker processes, 0 validates in this process.
+-'options': keyword arguments passed to gff_validator_drop.main() (incLine, typeHier,
+				stream, geneticCode).
+
+Output:
+-'results': a dictionary for each gff file, in the order given, with the gff and .fasta
+				file, the report names, the number of errors of each kind in KINDS, the
+				number of 'warnings' (counted apart from the errors) and 'failed', the
+				traceback of a file the validator crashed on (or None).
+"""
+def batch(gffFiles, outDir, workers=0, **options):
+
+	global _genomes
+
+	if not os.path.isdir(outDir):
+		os.makedirs(outDir)
+
+	## read each genome once here, so forked workers inherit it
+	fastaFiles = sorted(set([fasta for gff, fasta in gffFiles]))
+	_genomes = MemoryCache(maxEntries=max(len(fastaFiles), 1))
+	for fasta in fastaFiles:
+		try:
+			gff_validator.loadGenomes(fasta, options.get('geneticCode', DEFAULT_CODE), _genomes)
+		except FormatError:
+			pass ## reported for every gff file that uses it
+
+	jobs = []
+	for (gff, fasta), name in zip(gffFiles, reportNames(gffFiles)):
+		jobs.append((gff, fasta, os.path.join(outDir, name + '.errors.txt'), os.path.join(outDir, name + '.sorted.gff3'), options))
+
+	if not workers:
+		return [validateOne(job) for job in jobs]
+	pool = multiprocessing.Pool(workers)
+	try:
+		return pool.map(validateOne, jobs, chunksize=1)
+	finally:
+		pool.close()
+		pool.join()
+
+"""
+Validates one gff file, run by the workers. Takes a single tuple so it can be mapped over.
+"""
+def validateOne(job):
+
+	gff, fasta, errorsPath, sortedPath, options = job
+	result = {'gff': gff, 'fasta': fasta, 'errorsFile': errorsPath, 'sortedFile': sortedPath, 'failed': None}
+	for kind in KINDS:
+		result[kind] = 0
+	result['warnings'] = 0
+
+	try:
+		with open(errorsPath, 'w') as newErrors:
+			with open(sortedPath, 'w') as newSorted:
+				errors = gff_validator.main(gff, fasta, newErrors, newSorted, cache=_genomes, **options)
+	except Exception:
+		result['failed'] = traceback.format_exc()
+		return result
+
+	result.update(errors.counts('error'))
+	result['warnings'] = sum(errors.counts('warning').values())
+	return result
+
+"""
+Returns a report file name (without extension) for each gff file, its name without the
+extension, numbered when several gff files have the same name.
+"""
+def reportNames(gffFiles):
+	names = []
+	used = dict()
+	for gff, fasta in gffFiles:
+		name = os.path.splitext(os.path.basename(gff))[0]
+		used[name] = used.get(name, 0) + 1
+		if used[name] > 1:
+			name = name + '_' + str(used[name])
+		names.append(name)
+	return names
+
+"""
+Lists the gff files in 'paths'. Directories are searched (not recursively) for files
+matching GFF_PATTERNS, files are listed as given.
+"""
+def findGff3(paths):
+	found = []
+	for path in paths:
+		if os.path.isdir(path):
+			matches = set()
+			for pattern in GFF_PATTERNS:
+				matches.update(glob.glob(os.path.join(path, pattern)))
+			found.extend(sorted(matches))
+		else:
+			found.append(path)
+	return found
+
+"""
+Reads a genome map. Relative .fasta paths are taken from the directory of the map.
+
+Raises ValueError on a line that is not a pattern and a path.
+
+Output:
+-'genomes': list of (pattern, .fasta file) pairs, in the order of the file.
+"""
+def readGenomeMap(mapFile):
+	genomes = []
+	base = os.path.dirname(os.path.abspath(mapFile))
+	with open(mapFile) as f1:
+		for lineCount, line in enumerate(f1):
+			line = line.strip()
+			if not line or line.startswith('#'):
+				continue
+			words = line.split()
+			if len(words) != 2:
+				raise ValueError("%s line %d: expected a file name pattern and a fasta file" % (mapFile, lineCount + 1))
+			genomes.append((words[0], os.path.join(base, words[1])))
+	return genomes
+
+"""
+Returns the .fasta file of the first pattern in 'genomes' matching the name of 'gff', or
+None if none does.
+"""
+def genomeFor(gff, genomes):
+	name = os.path.basename(gff)
+	for pattern, fasta in genomes:
+		if fnmatch.fnmatch(name, pattern):
+			return fasta
+	return None
+
+"""
+Formats the results of batch() as a tab delimited table with a header line. Warnings are
+listed in a column of their own and do not give a file the 'errors' status.
+"""
+def summaryTable(results):
+	lines = ["\t".join(['file', 'genome', 'errors'] + [kind.lower() for kind in KINDS] + ['warnings', 'status'])]
+	for result in results:
+		total = sum([result[kind] for kind in KINDS])
+		status = "ok"
+		if result['failed']:
+			status = "failed"
+		elif total:
+			status = "errors"
+		lines.append("\t".join([result['gff'], result['fasta'], str(total)] + [str(result[kind]) for kind in KINDS] + [str(result['warnings']), status]))
+	return "\n".join(lines) + "\n"
+
+"""
+Runs the command line. Returns the exit status: 0 if every file was validated, 1 if the
+validator failed on any of them, 2 for a usage error.
+"""
+def cli(argv):
+
+	parser = argparse.ArgumentParser(description="Validates many gff files against their genomes.")
+	parser.add_argument('gff', nargs='+', help="gff files, or directories of them")
+	genome = parser.add_mutually_exclusive_group(required=True)
+	genome.add_argument('--fasta', help=".fasta file used for every gff file")
+	genome.add_argument('--genomes', help="file pairing gff file name patterns with .fasta files")
+	parser.add_argument('--out-dir', default='.', help="directory reports are written to")
+	parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help="worker processes, 0 for none")
+	parser.add_argument('--types', default=",".join(DEFAULT_TYPES), help="type hierarchy, separated by commas")
+	parser.add_argument('--genetic-code', type=int, default=DEFAULT_CODE, choices=sorted(GENETIC_CODES))
+	parser.add_argument('--inc-line', action='store_true', help="include input lines in the errors files")
+	parser.add_argument('--stream', action='store_true', help="validate sorted files in one pass")
+	args = parser.parse_args(argv)
+
+	if args.fasta:
+		genomes = [('*', args.fasta)]
+	else:
+		try:
+			genomes = readGenomeMap(args.genomes)
+		except (IOError, ValueError) as er:
+			parser.error(str(er))
+
+	gffFiles = []
+	for gff in findGff3(args.gff):
+		fasta = genomeFor(gff, genomes)
+		if fasta is None:
+			print >> sys.stderr, "no genome for " + gff + ", skipped"
+			continue
+		gffFiles.append((gff, fasta))
+
+	results = batch(gffFiles, args.out_dir, args.workers, incLine=args.inc_line, typeHier=args.types.split(","),
+					stream=args.stream, geneticCode=args.genetic_code)
+
+	table = summaryTable(results)
+	with open(os.path.join(args.out_dir, 'summary.tsv'), 'w') as f1:
+		f1.write(table)
+	sys.stdout.write(table)
+
+	status = 0
+	for result in results:
+		if result['failed']:
+			print >> sys.stderr, result['gff'] + ":\n" + result['failed']
+			status = 1
+	return status
+
+if __name__ == "__main__":
+	sys.exit(cli(sys.argv[1:]))
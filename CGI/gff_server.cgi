@@ -0,0 +1,55 @@
+#!/usr/bin/python
+
+"""
+Shim for the validation server (see gff_server.py). Forwards the submission to the server
+and prints its answer, so the form keeps working from the cgi-bin while submissions are
+validated by the server's warm workers. If the server is not running the submission is
+validated in this process instead, the way save_file_drop.cgi does.
+
+The server is found at GFF_VALIDATOR_SERVER. The pages it returns are served from here,
+so it has to write its results where the web server serves them: start it with --out-dir
+$GFF_VALIDATOR_OUT and --results-url $GFF_VALIDATOR_OUT_URL (see gff_server.py).
+"""
+
+import os, sys, socket, urllib2, StringIO
+from wsgiref.handlers import CGIHandler
+
+SERVER_URL = os.environ.get('GFF_VALIDATOR_SERVER', 'http://localhost:8051')
+TIMEOUT = 60
+
+## directories of a submission validated in this process, as in save_file_drop.cgi
+TMP_DIR = os.environ.get('GFF_VALIDATOR_TMP', '/Library/WebServer/tmp/')
+OUT_DIR = os.environ.get('GFF_VALIDATOR_OUT', '/Library/WebServer/trash/')
+OUT_URL = os.environ.get('GFF_VALIDATOR_OUT_URL', 'http://localhost/trash/')
+CACHE_DIR = os.environ.get('GFF_VALIDATOR_CACHE', '/Library/WebServer/cache/')
+RESULTS_DIR = os.environ.get('GFF_VALIDATOR_RESULTS', os.path.join(CACHE_DIR, 'results'))
+
+def main():
+
+	length = int(os.environ.get('CONTENT_LENGTH') or 0)
+	body = sys.stdin.read(length)
+
+	headers = {}
+	if os.environ.get('CONTENT_TYPE'):
+		headers['Content-Type'] = os.environ['CONTENT_TYPE']
+	request = urllib2.Request(SERVER_URL + os.environ.get('PATH_INFO', '/'), body or None, headers)
+
+	try:
+		response = urllib2.urlopen(request, timeout=TIMEOUT)
+	except urllib2.HTTPError as er:
+		response = er
+	except (urllib2.URLError, socket.error):
+		runLocally(body)
+		return
+
+	sys.stdout.write('Status: %d %s\r\n' % (response.code, response.msg))
+	sys.stdout.write('Content-Type: %s\r\n\r\n' % response.info().get('Content-Type', 'text/html'))
+	sys.stdout.write(response.read())
+
+def runLocally(body):
+	import gff_server
+	app = gff_server.ValidationApp(OUT_DIR, workDir=TMP_DIR, cacheDir=CACHE_DIR, resultsUrl=OUT_URL, resultsDir=RESULTS_DIR)
+	sys.stdin = StringIO.StringIO(body)
+	CGIHandler().run(app)
+
+main()
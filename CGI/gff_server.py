@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+
+"""
+Long running validation server. Takes the same upload form as save_file_drop.cgi (see
+htdocs/gff_validator_drop.html) but is started once, so submissions are not slowed down by
+starting python and importing the validator for each of them.
+
+Uploads are validated by a pool of worker processes. Each worker keeps the genomes it has
+read in memory, in front of the on-disk cache shared by all of them (see cache.py), so a
+genome uploaded again is neither parsed nor searched for codons again. Each worker also
+keeps the results of the lines it has checked (see incremental.py), so a file submitted
+again with a few lines changed only has those lines checked again. A submission of files
+validated before with the same options is not validated at all when the server keeps the
+results of whole runs (see results.py).
+
+Every submission logs the seconds taken to save the upload and to validate it, and every
+run the seconds of each of its stages (see timing.py), to the file given with --log. The
+server also keeps metrics of the submissions, runs and caches, served at /metrics in the
+Prometheus text format (see metrics.py).
+
+Classes:
+
+- 'ValidationApp': the WSGI application.
+- 'ThreadingWSGIServer': a wsgiref server that answers each request in its own thread.
+
+Functions:
+
+- 'readForm()': reads the upload form.
+- 'validate()': validates one submission, run by the workers.
+- 'serve()': starts the server.
+
+How to Use This Module
+======================
+
+1. Start the server: python gff_server.py --port 8051 --workers 4
+2. Point the form at http://<host>:8051/ or keep it on save_file_drop.cgi and use the
+	gff_server.cgi shim, which forwards submissions to the server.
+	- behind the shim the pages are served by the web server, not this one, so their links
+	  have to point at files the web server serves: start this server with --out-dir set to
+	  the directory the web server serves results from (GFF_VALIDATOR_OUT) and --results-url
+	  set to its url (GFF_VALIDATOR_OUT_URL).
+"""
+
+import os
+import cgi
+import shutil
+import argparse
+import tempfile
+import time
+import errno
+import multiprocessing
+from SocketServer import ThreadingMixIn
+from wsgiref.simple_server import make_server, WSGIServer
+
+import gff_validator_drop as gff_validator
+from cache import DiskCache, MemoryCache
+from incremental import LineResults
+from results import ResultCache, cachedMain, resultFiles, RESULT_NAME
+from timing import StageTimer, logTo
+from metrics import validatorMetrics, observedMain, observeSubmission, observeRun, observeCache, CONTENT_TYPE
+from codons import GENETIC_CODES
+
+MAX_FILE_SIZE = 100000
+
+DEFAULT_TYPES = ['gene','mRNA','exon']
+
+DEFAULT_OUT_DIR = os.path.join(tempfile.gettempdir(), 'gff_validator_results')
+
+FORM_PAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'htdocs', 'gff_validator_drop.html')
+
+RESULT_PAGE = '''
+	<!DOCTYPE html>
+	<html>
+
+	<head>
+		<title>Validation Results</title>
+		<style type="text/css"></style>
+	</head>
+
+	<body>
+
+		<p><a href="{item_E}">Errors</a></p>
+
+		<p><a href="{item_S}">Sorted</a></p>
+
+	</body>
+	</html>
+	'''
+
+class FormError(Exception):
+	"""
+	A submission that can not be validated. Carries the HTTP status and the message shown.
+	"""
+
+	def __init__(self, status, message):
+		super(FormError, self).__init__(status, message)
+		self.status = status
+		self.message = message
+
+class ValidationApp(object):
+	"""
+	WSGI application serving the upload form, validating submissions and serving the
+	error and sorted files it wrote.
+
+	- GET /: the upload form.
+	- POST to any path: validates the submission and returns links to its results.
+	- GET <resultsUrl><name>: a result file, when 'resultsUrl' is a path on this server. Only
+			files named as resultFiles() names the errors and sorted files it writes are
+			served, so 'outDir' should be a directory of its own.
+	- GET /metrics: the metrics of the server (see metrics.py).
+
+	Parameters:
+	-'outDir': directory the error and sorted files are written to, created if it does not
+			exist.
+	-'workDir': directory each submission gets its own temporary directory in.
+	-'cacheDir': directory of the genome cache, or None not to keep genomes on disk.
+	-'workers': number of worker processes, 0 validates in the process answering the request.
+	-'resultsUrl': url the files in 'outDir' are found under.
+	-'resultsDir': directory of the results of earlier submissions (see results.py), or None
+			to validate every submission.
+	-'debug': True to write the seconds of each stage at the end of every errors file.
+	-'profileDir': directory the cProfile stats of every run are written to, or None.
+			Submissions are validated again when debugging or profiling, even if seen before.
+	"""
+
+	def __init__(self, outDir, workDir=None, cacheDir=None, workers=0, resultsUrl='/results/', resultsDir=None, debug=False, profileDir=None):
+		self.outDir = outDir
+		try:
+			os.makedirs(outDir)
+		except OSError as er:
+			if er.errno != errno.EEXIST:
+				raise
+		self.workDir = workDir
+		self.resultsUrl = resultsUrl
+		self.debug = debug
+		self.profileDir = profileDir
+		self.metrics = validatorMetrics()
+		self.results = None
+		if resultsDir is not None:
+			self.results = ResultCache(resultsDir)
+		self.pool = None
+		if workers:
+			self.pool = multiprocessing.Pool(workers, initWorker, (cacheDir,))
+		else:
+			initWorker(cacheDir)
+
+	def close(self):
+		if self.pool is not None:
+			self.pool.close()
+			self.pool.join()
+			self.pool = None
+
+	def __call__(self, environ, start_response):
+		method = environ.get('REQUEST_METHOD', 'GET')
+		path = environ.get('PATH_INFO', '/') or '/'
+
+		try:
+			if method == 'POST':
+				body = self.submit(environ)
+				contentType = 'text/html'
+			elif path == '/metrics':
+				body = self.renderMetrics()
+				contentType = CONTENT_TYPE
+			elif self.resultsUrl.startswith('/') and path.startswith(self.resultsUrl):
+				body = self.result(path[len(self.resultsUrl):])
+				contentType = 'text/plain'
+			elif path in ('/', '/' + os.path.basename(FORM_PAGE)):
+				body = open(FORM_PAGE).read().replace('action="http://localhost/cgi-bin/SaveFile.cgi"', 'action=""')
+				contentType = 'text/html'
+			else:
+				raise FormError('404 Not Found', 'ERROR: ' + path + ' not found')
+		except FormError as er:
+			start_response(er.status, [('Content-Type', 'text/plain')])
+			return [er.message]
+
+		start_response('200 OK', [('Content-Type', contentType), ('Content-Length', str(len(body)))])
+		return [body]
+
+	def submit(self, environ):
+		"""
+		Validates the submission in a request and returns the results page.
+		"""
+		begin = time.time()
+		outcome = 'failed'
+		sizes = dict()
+		self.metrics['gff_validator_submissions_in_progress'].inc()
+		try:
+			form = cgi.FieldStorage(fp=environ['wsgi.input'], environ=environ, keep_blank_values=True)
+			gffItem, seqItem, incLine, types, geneticCode = readForm(form)
+
+			timer = StageTimer()
+			workspace = tempfile.mkdtemp(prefix='gff_', dir=self.workDir)
+			try:
+				gffPath = os.path.join(workspace, 'gffITEM.gff')
+				seqPath = os.path.join(workspace, 'seqITEM.fasta')
+				with timer.stage('saveUpload'):
+					saveUpload(gffItem, gffPath)
+					saveUpload(seqItem, seqPath)
+				sizes = {'gff': os.path.getsize(gffPath), 'fasta': os.path.getsize(seqPath)}
+
+				with timer.stage('validate'):
+					if self.results is not None and not self.debug and self.profileDir is None:
+						errorsPath, sortedPath = cachedMain(self.results, gffPath, seqPath, self.outDir, incLine, types, geneticCode, run=self.run)
+					else:
+						errorsPath, sortedPath = resultFiles(self.outDir)
+						self.run(gffPath, seqPath, errorsPath, sortedPath, incLine, types, geneticCode)
+			finally:
+				shutil.rmtree(workspace, ignore_errors=True)
+			timer.log('submission', gff=os.path.basename(gffItem.filename), errorsFile=os.path.basename(errorsPath))
+			outcome = 'ok'
+		except FormError:
+			outcome = 'refused'
+			raise
+		finally:
+			self.metrics['gff_validator_submissions_in_progress'].dec()
+			observeSubmission(self.metrics, outcome, time.time() - begin, sizes)
+
+		item_E = self.resultsUrl + os.path.basename(errorsPath)
+		item_S = self.resultsUrl + os.path.basename(sortedPath)
+		return RESULT_PAGE.format(**locals())
+
+	def run(self, *job):
+		"""
+		Validates a submission, see validate(), in a worker process if there are any.
+		"""
+		profile = None
+		if self.profileDir is not None:
+			handle, profile = tempfile.mkstemp(prefix='profile_', suffix='.pstats', dir=self.profileDir)
+			os.close(handle)
+		options = {'debug': self.debug, 'profile': profile}
+		if self.pool is None:
+			observed = validate(*job, **options)
+		else:
+			observed = self.pool.apply(validate, job, options)
+		observeRun(self.metrics, observed)
+		observeCache(self.metrics, 'lines', observed['lineHits'], observed['lineMisses'])
+
+	def renderMetrics(self):
+		"""
+		Returns the metrics of the server in the Prometheus text format.
+		"""
+		if self.results is not None:
+			observeCache(self.metrics, 'results', self.results.hits, self.results.misses, total=True)
+		return self.metrics.render()
+
+	def result(self, name):
+		"""
+		Returns the contents of an errors or sorted file written to 'outDir' (see
+		resultFiles()). Any other file is not found.
+		"""
+		if not RESULT_NAME.match(name) or not os.path.isfile(os.path.join(self.outDir, name)):
+			raise FormError('404 Not Found', 'ERROR: ' + name + ' not found')
+		try:
+			return open(os.path.join(self.outDir, name)).read()
+		except IOError:
+			raise FormError('404 Not Found', 'ERROR: ' + name + ' not found')
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+	"""
+	wsgiref server answering each request in its own thread, so submissions wait on the
+	worker pool together instead of one after another.
+	"""
+	daemon_threads = True
+
+"""
+Reads the fields of the upload form, as save_file_drop.cgi does.
+
+Raises FormError if either file is missing or the genetic code is unknown.
+
+Parameters:
+-'form': a cgi.FieldStorage of the submission.
+
+Output:
+-'gffItem': the uploaded gff file field.
+-'seqItem': the uploaded fasta file field.
+-'incLine': boolean indicating whether lines should be included in the errors file.
+-'types': the type hierarchy, in the order of the type fields.
+-'geneticCode': number of the genetic code.
+"""
+def readForm(form):
+
+	gffItem = None
+	seqItem = None
+	incLine = False
+	typeArr = []
+	geneticCode = gff_validator.DEFAULT_CODE
+
+	for key in form.keys():
+
+		if key == 'gffFile':
+			gffItem = form[key]
+
+		elif key == 'seqFile':
+			seqItem = form[key]
+
+		elif key == 'optionalErr':
+			incLine = True
+
+		elif key == 'geneticCode':
+			try:
+				geneticCode = int(form.getfirst(key))
+			except ValueError:
+				geneticCode = None
+			if geneticCode not in GENETIC_CODES:
+				raise FormError('400 Bad Request', 'ERROR: unknown genetic code')
+
+		elif key[0:4] == 'type' and key[4:].isdigit():
+			if form.getfirst(key):
+				typeArr.append((int(key[4:]), str(form.getfirst(key))))
+
+	types = [type for number, type in sorted(typeArr)] or DEFAULT_TYPES
+
+	for item in (gffItem, seqItem):
+		if item is None or not item.filename:
+			raise FormError('400 Bad Request', 'ERROR: Problem reading either the gff or fasta file')
+
+	return gffItem, seqItem, incLine, types, geneticCode
+
+"""
+Writes an uploaded file to 'path'.
+
+Raises FormError if the file is bigger than MAX_FILE_SIZE.
+
+Parameters:
+-'item': the uploaded file field.
+-'path': where the file is written.
+"""
+def saveUpload(item, path):
+
+	item.file.seek(0, 2)
+	filesize = item.file.tell()
+	item.file.seek(0)
+
+	if filesize > MAX_FILE_SIZE:
+		raise FormError('413 Request Entity Too Large', 'ERROR: ' + os.path.basename(item.filename) + ' is too big.')
+
+	with open(path, 'wb') as f1:
+		shutil.copyfileobj(item.file, f1)
+
+_genomes = None
+_lineResults = None
+
+"""
+Sets up the genome cache and the line results of a worker process. Genomes are kept in
+memory in front of the on-disk cache in 'cacheDir', or only in memory if 'cacheDir' is
+None.
+"""
+def initWorker(cacheDir=None):
+	global _genomes, _lineResults
+	backing = None
+	if cacheDir is not None:
+		backing = DiskCache(cacheDir)
+	_genomes = MemoryCache(backing=backing)
+	_lineResults = LineResults()
+
+"""
+Validates one submission and writes its error and sorted files. Run in the worker
+processes, with the genome cache and line results set up by initWorker().
+
+Parameters:
+-'gffPath': the uploaded gff file.
+-'seqPath': the uploaded fasta file.
+-'errorsPath': where the errors file is written.
+-'sortedPath': where the sorted gff file is written.
+-'incLine', 'types', 'geneticCode', 'debug', 'profile': see gff_validator_drop.main().
+
+Output:
+-'observed': what is recorded of the run (see metrics.observedMain()), with the hits and
+		misses of the line results during the run ('lineHits', 'lineMisses').
+"""
+def validate(gffPath, seqPath, errorsPath, sortedPath, incLine, types, geneticCode, debug=False, profile=None):
+	hits, misses = _lineResults.hits, _lineResults.misses
+	observed = observedMain(gffPath, seqPath, errorsPath, sortedPath, incLine, types, geneticCode,
+		cache=_genomes, lineResults=_lineResults, debug=debug, profile=profile)
+	observed['lineHits'] = _lineResults.hits - hits
+	observed['lineMisses'] = _lineResults.misses - misses
+	return observed
+
+"""
+Starts the server and answers requests until interrupted.
+
+Parameters:
+-'host', 'port': address the server listens on.
+-'logPath': file the timing of every submission and run is logged to, or None.
+-the others are passed to ValidationApp.
+"""
+def serve(host, port, outDir, workDir=None, cacheDir=None, workers=2, resultsUrl='/results/', resultsDir=None, debug=False, profileDir=None, logPath=None):
+	if logPath is not None:
+		logTo(logPath) ## before the workers are started, so they log to it too
+	app = ValidationApp(outDir, workDir, cacheDir, workers, resultsUrl, resultsDir, debug, profileDir)
+	server = make_server(host, port, app, server_class=ThreadingWSGIServer)
+	print "validation server on http://%s:%d/ with %d workers" % (host, port, workers)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		app.close()
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Serves the gff validator upload form.")
+	parser.add_argument('--host', default='localhost')
+	parser.add_argument('--port', type=int, default=8051)
+	parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+	parser.add_argument('--out-dir', default=DEFAULT_OUT_DIR, help="directory results are written to; the one the web server serves them from behind gff_server.cgi")
+	parser.add_argument('--work-dir', default=None, help="directory uploads are written to while they are validated")
+	parser.add_argument('--cache-dir', default=None, help="directory genomes are cached in")
+	parser.add_argument('--results-url', default='/results/', help="url results are linked under; the web server's url of --out-dir behind gff_server.cgi")
+	parser.add_argument('--results-dir', default=None, help="directory the results of earlier submissions are kept in")
+	parser.add_argument('--debug', action='store_true', help="write the seconds of each stage at the end of the errors files")
+	parser.add_argument('--profile-dir', default=None, help="directory the cProfile stats of every run are written to")
+	parser.add_argument('--log', default=None, help="file the timing of every submission and run is logged to")
+	args = parser.parse_args()
+	serve(args.host, args.port, args.out_dir, args.work_dir, args.cache_dir, args.workers, args.results_url, args.results_dir,
+		args.debug, args.profile_dir, args.log)
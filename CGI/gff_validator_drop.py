@@ -16,18 +16,30 @@ Exception classes:
 Functions:
 
 - 'main()': runs the module and outputs the errors found.
+- 'runChecks()': validates the files, as main() runs it.
 - 'sortGff3()': sorts the lines in the document based on line type.
-- 'fileCheck()': checks each line in for proper format.
+- 'featureSortKey()': builds the key a line is sorted by.
+- 'streamGff3()': validates an already sorted file in one pass.
+- 'fileCheck()': checks each line in for proper format, one sequence at a time.
+- 'sequenceCheck()': checks the lines of one sequence.
+- 'lineCheck()': checks a single line, 'rowCheck()' a row of a FeatureTable.
+- 'columnCheck()': checks the 1st to 8th components of a line one at a time.
 - 'charCheck()': checks a string for specific characters.
 - 'geneCheck()': checks that the sequence given is a gene.
-- 'fastaRead()': reads in a .fasta file to a string.
-- 'translate()': reads a nucleotide sequence and outputs the protein sequence. 
+- 'geneBatchCheck()': runs the geneCheck() checks for every gene of a file at once.
+- 'fastaRead()': reads in a .fasta file of one sequence to a string.
+- 'readGenomes()': reads in every sequence of a .fasta file, by name.
+- 'loadGenomes()': reads in a .fasta file, reusing the genomes cached for the same file.
+- 'genomeCacheCounts()': returns the hits and misses of loadGenomes() in its cache.
 
 How to Use This Module
 ======================
 (see the individual classes, methods, and attributes for details.)
 
-1. Input a file in .gff format and a file in .fasta format to main().
+1. Input a file in .gff format and a file in .fasta format to main(), or run this module
+	with the gff files and a .fasta file on the command line (see gff_batch.py).
+	- the .fasta file may hold several sequences (contigs). Each line is checked against
+	  the sequence named by its 1st component.
 	- optional input: include input lines in output file.
 	- optional input: type hierarchy
 
@@ -39,6 +51,21 @@ How to Use This Module
 import sys
 import re
 import os
+import itertools
+import threading
+import multiprocessing
+from array import array
+
+from errors import FormatError, ErrorCollector, ErrorRecord, errorMessage
+from codons import codonIndex, rememberIndex, DEFAULT_CODE
+from registry import IDRegistry
+from fasta import FastaFile, PackedSequence
+from cache import fileDigest
+from features import FeatureTable, LINE_PATTERN, CONTIG, UNKNOWN, NO_COORDINATE, toCoordinate
+from overlaps import spacingErrors
+from hierarchy import FeatureGraph
+from incremental import LineRecorder, context, replay
+from timing import StageTimer, profileCall
 
 """
 The main method of the module.
@@ -51,27 +78,102 @@ Parameters:
 - 'typeHier': a list indicating the types of each gff line and the order the types should
 				be sorted in. The first type in the list will be ordered before the second, 
 				the second type before the third, etc.
+- 'stream': boolean indicating whether the gff file should first be validated in a single
+				streaming pass (see streamGff3()). Files that turn out not to be sorted
+				are then validated again the usual way.
+- 'geneticCode': number of the genetic code genes are translated with (see codons.py).
+- 'cache': a DiskCache (see cache.py) the genome and its codon index are kept in between
+				runs, or None to read the .fasta file every time.
+- 'workers': number of worker processes the sequences of the file are checked across, 0
+				or 1 to check them in this process (see fileCheck()).
+- 'lineResults': a LineResults (see incremental.py) kept from earlier runs, so lines checked
+				before are not checked again, or None to check every line.
+- 'timer': a StageTimer (see timing.py) the seconds of each stage are added to, or None.
+				Each run logs the seconds of its stages either way.
+- 'debug': boolean indicating whether the seconds of each stage should be written at the
+				end of the error output file.
+- 'profile': path the cProfile stats of the run are written to, or None not to profile it.
+
+Output:
+-'errors': the ErrorCollector holding the errors found (see errors.py).
+"""
+def main(gff, seq, newErrors, newSorted, incLine=False, typeHier=['gene','mRNA','exon'], stream=False, geneticCode=DEFAULT_CODE, cache=None, workers=0, lineResults=None, timer=None, debug=False, profile=None):
+	
+	if timer is None:
+		timer = StageTimer()
+	job = (gff, seq, newErrors, newSorted, incLine, typeHier, stream, geneticCode, cache, workers, lineResults, timer)
+	if profile is not None:
+		errors = profileCall(profile, runChecks, *job)
+	else:
+		errors = runChecks(*job)
+	
+	if debug:
+		newErrors.write("\n".join(timer.lines()) + "\n")
+	timer.log(gff=os.path.basename(gff), errors=len(errors), stream=stream, workers=workers)
+	return errors
+
+"""
+Validates the files and writes the error and sorted files, as main() runs it, timing each
+stage with 'timer'. See main() for the parameters.
 """
-def main(gff, seq, newErrors, newSorted, incLine=False, typeHier=['gene','mRNA','exon']):
+def runChecks(gff, seq, newErrors, newSorted, incLine, typeHier, stream, geneticCode, cache, workers, lineResults, timer):
 		
 	gff3_File = gff
 	seq_File = seq
-	seq = fastaRead(seq_File)
 	
-	global Errors
-	Errors = []
+	errors = ErrorCollector()
+	
+	try:
+		with timer.stage('fastaRead'):
+			genomes = loadGenomes(seq_File, geneticCode, cache)
+	except FormatError as er:
+		errors.add(er.code, er.returnError() + er.message + " Genes were not checked.")
+		genomes = None
+	
+	digest = None
+	if lineResults is not None and genomes is not None:
+		digest = fileDigest(seq_File) ## lines are kept by genome, as the genome cache keeps them
+	
+	if stream:
+		before = len(errors)
+		try:
+			with timer.stage('streamGff3'):
+				streamGff3(gff3_File, genomes, typeHier, newSorted, geneticCode, errors, lineResults, digest)
+		except (StreamOrderError, StreamKillError): ## sortGff3() then finds the same line and kills the run
+			errors.truncate(before)
+			newSorted.seek(0)
+			newSorted.truncate()
+		else:
+			with timer.stage('outFile'):
+				outFile([], {}, newSorted, errors, newErrors, incLine) ## lines are already written
+			return errors
     
-	sorted_File = sortGff3(gff3_File, typeHier)    
-	report = fileCheck(sorted_File[0], sorted_File[1], seq, typeHier)
+	with timer.stage('sortGff3'):
+		sorted_File = sortGff3(gff3_File, typeHier, errors)
+	if sorted_File == "kill":
+		with timer.stage('outFile'):
+			outFile([], {}, newSorted, errors, newErrors, False)
+		return errors
+	
+	with timer.stage('fileCheck'):
+		report = fileCheck(sorted_File[0], sorted_File[1], genomes, typeHier, geneticCode, errors, workers, lineResults, timer, digest)
     	
-	outFile(sorted_File[0], sorted_File[1], newSorted, Errors, newErrors, incLine)
-	return
+	with timer.stage('outFile'):
+		outFile(sorted_File[0], sorted_File[1], newSorted, errors, newErrors, incLine)
+	return errors
 
 """
 Sorts each line in the gff file according to the type hierarchy. The given type (ie 
 'gene', 'mRNA', 'exon' must be identical to the types found in the file. 
 Gene != gene, mrna != mRNA, etc.
 
+Each line is parsed once into a FeatureTable, which fileCheck(), geneTable() and outFile()
+read from afterwards. Lines are grouped by sequence (1st component), in the order the
+sequences first appear in the file, and each sequence is ordered by start coordinate, then
+by type, then by end coordinate (see featureSortKey()). The contig line of a sequence is
+always placed first. Lines sharing a type and start coordinate are all kept, each under
+its own row.
+
 Also checks lines for correct format:
 - each line is tab delimited and has 9 components.
 - each line has a type at the 3rd component.
@@ -83,322 +185,778 @@ Parameters:
 -'types': a list indicating the types of each gff line and the order the types should
 				be sorted in. The first type in the list will be ordered before the second, 
 				the second type before the third, etc.
+-'errors': ErrorCollector the errors found are added to.
 				
 Output:
--'keyList': a list of keys sorted in the order that the lines will be sorted.
--'holder': a dictionary of lines paired with keys in 'keyList'.
+-'keyList': a list of rows of 'table' in the order that the lines will be sorted.
+-'table': FeatureTable of every line of the file (see features.py); table[row] is the
+				line itself.
 """		
-def sortGff3(gff3_File, types = ['gene','mRNA','exon']):
-        from errors import FormatError
+def sortGff3(gff3_File, types = ['gene','mRNA','exon'], errors=None):
     
+	if errors is None:
+		errors = ErrorCollector()
+	table = FeatureTable(types)
+	seqids = [] ## sequences in the order they first appear
+	rows = dict() ## sequence -> its feature lines, two lines sharing a type and start are both kept
+	contigRows = dict() ## sequence -> its contig line
+	
 	f1 = open(gff3_File, "r")
-	holder = dict()
-	counter = dict()
-	contigCount = False
-	lineCount = -1
-	formatCount = 0
-    
-	for line in f1:
-        
-		lineCount += 1
-        
-		try:
-			theLine = line.strip().split("\t")
-			if len(theLine) > 9:
-				raise FormatError("0200")
-			elif len(theLine) < 9:
-				raise FormatError("0100")
-		except FormatError as er:
-			Errors.append("[" + str(lineCount) + "] " + er.returnError())
-			continue
-		except:
-			Errors.append("Validation Error: unkown error. Check line: " + line)
-        
-		if theLine[2] == "contig":
-			continue
-        
-		if theLine[2] not in types:
-			Errors.append("The third component of each line must be one of the types. The types are: " + str(types) + " .")
-			return "kill"
-        
-		holder[theLine[2]+"_"+theLine[3]] = line
-        
-		if theLine[3] in counter:
-			counter[theLine[3]] = counter[theLine[3]] + types.index(theLine[2])
-		else:
-			counter[theLine[3]] = types.index(theLine[2])
+	try:
+		for line in f1:
 			
-	f1.close()
-    
-	counterKeys = counter.keys()
-    
-	expectedNum = ((len(types))*(len(types)-1))/2
-	for key in counterKeys:
-		thisNum = counter[key]
-		try:
-			if thisNum == expectedNum:
+			lineCount = table.append(line) ## rows are numbered as the lines of the file
+			
+			if table.widths[lineCount] > 9:
+				errors.emit("0200", lineCount, source=line)
 				continue
-			else:
-				raise FormatError("0500")
-		except FormatError as er:
-			Errors.append("Coordinate " + key + " " + er.returnError())
-    
-	keyList = holder.keys()  
-	i = 0    
-	length = len(keyList)
-	while i < length:
-		Key = keyList[i].split("_")
-      
-		try:
-			if Key[0] == "contig":
-				if not contigCount:
-					temp = keyList[0]
-					keyList[0] = keyList[i]
-					keyList[i] = temp
-					contigCount = True
-					continue
-				else:
-					raise FormatError("0400") ## should only be one contig per file
-		except FormatError as er:
-			Errors.append("[" + str(i) + "] " + er.returnError())
-			i+=1
-			continue ## may need to look at this closer. Handling when there are multiple contig lines.
-        
-		if contigCount:
-			if i == 1:
-				i+=1
-		else:
-			if i == 0:
-				i+=1
-            
-		preKey = keyList[i-1].split("_")
-        
-		if preKey[1] == Key[1]: ## same start coordinates
-			prePos = int(types.index(preKey[0]))
-			Pos = int(types.index(Key[0]))
-			if Pos < prePos : ## sort based on types list. Start of list > end.
-				temp = keyList[i-1]
-				keyList[i-1] = keyList[i]
-				keyList[i] = temp
-				i-=1
+			elif table.widths[lineCount] < 9:
+				errors.emit("0100", lineCount, source=line)
 				continue
-			else:
-				i+=1
+			
+			seqid = table.seqids[lineCount]
+			if seqid not in rows:
+				seqids.append(seqid)
+				rows[seqid] = []
+			
+			code = table.typeCodes[lineCount]
+			if code == CONTIG:
+				if seqid in contigRows:
+					errors.emit("0400", lineCount, source=line) ## should only be one contig per sequence
+					continue
+				contigRows[seqid] = lineCount
 				continue
-        
-		elif int(preKey[1]) > int(Key[1]): ## preveous key's coords is > current key's coord
-			temp = keyList[i-1]
-			keyList[i-1] = keyList[i]
-			keyList[i] = temp
-			i-=1
-            
-		else:
-			i+=1
+			
+			if code == UNKNOWN:
+				errors.add("0004", "The third component of each line must be one of the types. The types are: " + str(types) + " .")
+				return "kill"
+			
+			rows[seqid].append(lineCount)
+	finally:
+		f1.close()
+    
+	keyList = []
+	for seqid in seqids:
+		if seqid in contigRows:
+			keyList.append(contigRows[seqid]) ## contig line is always pinned first
+		keyList.extend(table.sortedRows(rows[seqid])) ## keys come from the table, no re-parsing while sorting
             
-	return [keyList, holder]
+	return [keyList, table]
+
+"""
+Builds the key a feature line is ordered by: start coordinate, then position of its type
+in the type hierarchy, then end coordinate. Coordinates that are not integers sort after
+every valid coordinate so that fileCheck() can still report them.
+
+Parameters:
+-'theLine': the line split into its 9 components.
+-'types': the type hierarchy.
+
+Output:
+-'key': a (start, type rank, end) tuple.
+"""
+def featureSortKey(theLine, types = ['gene','mRNA','exon']):
+	try:
+		start = int(theLine[3])
+	except ValueError:
+		start = sys.maxint
+	try:
+		end = int(theLine[4])
+	except ValueError:
+		end = sys.maxint
+	return (start, types.index(theLine[2]), end)
+
+"""
+Raised by orderedLines() when a line is found out of sorted order while streaming.
+"""
+class StreamOrderError(Exception):
+	pass
+
+"""
+Raised by orderedLines() on a line whose type is not in the type hierarchy, where
+sortGff3() returns "kill": the run stops and reports only the errors sortGff3() found.
+"""
+class StreamKillError(Exception):
+	pass
+
+"""
+Validates an already sorted gff file in a single pass without holding the file in memory.
+Lines are read, order checked and validated one at a time by a chain of generators
+(readGff3() -> orderedLines() -> lineCheck()) and written straight to the sorted file.
+Only the IDs seen so far and the errors found are kept. The lines of each sequence (1st
+component) are checked against their own genome, as fileCheck() checks them.
+
+Errors are numbered and ordered the same way as sortGff3() and fileCheck() number and order
+them (the format errors first), so a sorted file gives the same report in either mode. Only
+the byte offset of each line is kept, and the lines the errors found at the end of a
+sequence are about are read again from the file to attach them.
+
+Raises StreamOrderError as soon as a line is out of order, and StreamKillError on a line of
+an unknown type. Anything already written to 'nameS' and 'errors' is then incomplete and the
+caller should fall back to sortGff3().
+
+Parameters:
+-'gff3_File': the uploaded gff file.
+-'genomes': dictionary of the sequences of the uploaded fasta file by name (see
+				loadGenomes()), None to skip the gene checks.
+-'types': the type hierarchy.
+-'nameS': sorted gff file the lines are written to.
+-'geneticCode': number of the genetic code genes are translated with.
+-'errors': ErrorCollector the errors found are added to.
+-'lineResults': a LineResults lines already checked are taken from and the others added
+				to (see checkLine()), or None.
+-'digest': SHA-256 of the .fasta file 'genomes' were read from (see cache.fileDigest()),
+				which the results of lines are kept under, or None (see context()).
+
+Output:
+-'errors': the ErrorCollector, with the line each error was found on attached to it.
+"""
+def streamGff3(gff3_File, genomes, types, nameS, geneticCode=DEFAULT_CODE, errors=None, lineResults=None, digest=None):
+
+	if errors is None:
+		errors = ErrorCollector()
+	found = ErrorCollector() ## errors of the line checks, added after the format errors
+	registry = IDRegistry() ## IDs of the sequences already checked
+	seqid = None
+	offsets = array('l') ## byte offset of each line of the file
+	
+	for lineCount, line, lineSeqid, row in orderedLines(readGff3(gff3_File, offsets), types, errors):
+		
+		if seqid is None or lineSeqid != seqid: ## first line of a sequence
+			if seqid is not None:
+				streamEnd(state, genes, Seq, registry, gff3_File, offsets, rows, first)
+			seqid = lineSeqid
+			Seq = genomeFor(genomes, seqid)
+			seqidCheck(seqid, genomes, lineCount, line, found)
+			state = checkState(geneticCode, found, types)
+			if Seq is None:
+				state['biology'] = dict()
+			genes = (array('l'), array('l'), array('l'), []) ## as geneTable() collects them, for spacingErrors()
+			rows = array('l') ## line of the file at each position of the sequence
+			first = lineCount
+			lineContext = context(Seq, seqid, digest, types, geneticCode)
+		
+		rows.append(row)
+		before = len(found)
+		kept = None
+		if lineResults is not None:
+			kept = lineResults.get(lineContext, line)
+		result = checkLine(None, None, line, lineCount, Seq, types, state, kept, lineResults is not None)
+		if result is not None:
+			lineResults.put(lineContext, line, result)
+		found.attach(before, line)
+		
+		gene = geneFields(line, types)
+		if gene is not None:
+			genes[0].append(lineCount)
+			genes[1].append(gene[0])
+			genes[2].append(gene[1])
+			genes[3].append(gene[2])
+		
+		nameS.write(line)
+		nameS.write("\n")
+	
+	if seqid is not None:
+		streamEnd(state, genes, Seq, registry, gff3_File, offsets, rows, first)
+	
+	errors.merge(found)
+	return errors
+
+"""
+Runs the checks streamGff3() leaves until the last line of a sequence: Parents, the gene
+spacing and the IDs also used by the sequences before it. The line each error is about is
+read again from 'gff3_File' and attached to it.
+
+Parameters:
+-'offsets': byte offset of each line of the file, filled by readGff3().
+-'rows': line of the file at each position of the sequence.
+-'first': position of the first line of the sequence.
+"""
+def streamEnd(state, genes, Seq, registry, gff3_File, offsets, rows, first):
+	errors = state['errors']
+	before = len(errors)
+	parentCheck(state)
+	errors.extend(spacingErrors((genes[0], genes[1], genes[2], ''.join(genes[3])), genomeLength(Seq)))
+	sequenceIDCheck(registry, state['registry'], errors)
+	if before == len(errors):
+		return
+	
+	f1 = open(gff3_File, "r")
+	try:
+		for i in xrange(before, len(errors)):
+			line = errors[i].line
+			if line is not None and 0 <= line - first < len(rows):
+				f1.seek(offsets[rows[line - first]])
+				errors.attach(i, f1.readline(), i + 1)
+	finally:
+		f1.close()
+
+"""
+Reads a gff file one line at a time.
+
+Parameters:
+-'gff3_File': the uploaded gff file.
+-'offsets': array the byte offset of each line is added to before the line is passed on,
+				so the line can be read again with seek(), or None.
+
+Output (generator):
+-'(lineCount, line)': line number in the file, starting at 0, and the line itself.
+"""
+def readGff3(gff3_File, offsets=None):
+	f1 = open(gff3_File, "r")
+	offset = 0
+	try:
+		for lineCount, line in enumerate(f1):
+			if offsets is not None:
+				offsets.append(offset)
+				offset += len(line)
+			yield lineCount, line
+	finally:
+		f1.close()
+
+"""
+Streaming counterpart of sortGff3(). Runs the same format and contig checks on lines
+coming from readGff3() and passes on the lines sortGff3() would have kept, as long as they
+are already in the order sortGff3() gives: the lines of each sequence together, each
+sequence in the order featureSortKey() gives. Raises StreamOrderError on a line out of that
+order and StreamKillError on a line of a type not in 'types'.
+
+Parameters:
+-'lines': (lineCount, line) pairs from readGff3().
+-'types': the type hierarchy.
+-'errors': ErrorCollector the errors found are added to, with the line they are about.
+
+Output (generator):
+-'(lineCount, line, seqid, row)': position of the line in the sorted file, starting at 1,
+				the line, its sequence (1st component) and its line number in 'lines'.
+"""
+def orderedLines(lines, types, errors):
+
+	def addError(line, code, lineCount=None):
+		errors.emit(code, lineCount, source=line)
+
+	seqids = set() ## sequences already passed
+	seqid = None
+	contigSeen = False
+	previous = None
+	position = 0
+	
+	for lineCount, line in lines:
+		
+		theLine = line.strip().split("\t")
+		if len(theLine) > 9:
+			addError(line, "0200", lineCount)
+			continue
+		elif len(theLine) < 9:
+			addError(line, "0100", lineCount)
+			continue
+		
+		if theLine[0] != seqid:
+			if theLine[0] in seqids:
+				raise StreamOrderError(lineCount) ## lines of a sequence have to be together
+			seqid = theLine[0]
+			seqids.add(seqid)
+			contigSeen = False
+			previous = None
+		
+		if theLine[2] == "contig":
+			if contigSeen:
+				addError(line, "0400", lineCount) ## should only be one contig per sequence
+				continue
+			if previous is not None:
+				raise StreamOrderError(lineCount) ## contig line has to come first
+			contigSeen = True
+			position += 1
+			yield position, line, seqid, lineCount
+			continue
+		
+		if theLine[2] not in types:
+			raise StreamKillError(lineCount)
+		
+		key = featureSortKey(theLine, types)
+		if previous is not None and key < previous:
+			raise StreamOrderError(lineCount)
+		previous = key
+		
+		position += 1
+		yield position, line, seqid, lineCount
     
 """
-Checks each component of each line of the gff file for proper format. Prints to the global
-list 'Errors' when a component is incorrectly formatted.
+Checks each component of each line of the gff file for proper format. Adds to 'errors'
+when a component is incorrectly formatted.
+
+The lines of each sequence (1st component) are checked on their own (see sequenceCheck()),
+against the genome of that name; with several 'workers' and several sequences, across a
+pool of worker processes (see poolCheck()). The errors of each sequence are added in the
+order of the sequences in the file either way, followed by the IDs it uses that a sequence
+before it already used.
 
 Parameters:
--'keyList': list of sorted keys.
--'holder': dictionary of lines paired with keys in 'keyList'.
--'Seq': string of the nucleotide sequence extracted from uploaded fasta file.
+-'keyList': list of sorted rows of 'table'.
+-'table': FeatureTable returned by sortGff3().
+-'genomes': dictionary of the sequences of the uploaded fasta file by name (see
+				loadGenomes()), None to skip the gene checks.
 -'types': a list indicating the types of each gff line and the order the types should
 				be sorted in. The first type in the list will be ordered before the second, 
 				the second type before the third, etc.
+-'geneticCode': number of the genetic code genes are translated with.
+-'errors': ErrorCollector the errors found are added to.
+-'workers': number of worker processes, 0 or 1 to check every sequence in this process.
+-'lineResults': a LineResults lines already checked are taken from and the others added
+				to (see checkLine()), or None.
+-'timer': StageTimer the seconds taken by the gene checks are added to ('geneCheck'), or
+				None. Sequences checked by worker processes are not timed.
+-'digest': SHA-256 of the .fasta file 'genomes' were read from, see streamGff3().
 
 """    
-def fileCheck(keyList, holder, Seq, types = ['gene','mRNA','exon']):
+def fileCheck(keyList, table, genomes, types = ['gene','mRNA','exon'], geneticCode=DEFAULT_CODE, errors=None, workers=0, lineResults=None, timer=None, digest=None):
 
-	priorID = "N/A"
-	count = 0
-	lineCount = 0
-	namesList=[]
+	if errors is None:
+		errors = ErrorCollector()
+	partitions = table.partitions(keyList)
+	if workers > 1 and len(partitions) > 1:
+		results = poolCheck(keyList, table, genomes, partitions, types, geneticCode, workers, lineResults, digest)
+	else:
+		results = (sequenceCheck(keyList, table, genomes, partition, types, geneticCode, lineResults, timer, digest) for partition in partitions)
 	
-	for key in keyList:
+	registry = IDRegistry() ## IDs of the sequences checked so far
+	for found, IDs, checked in results:
+		for lineContext, line, result in checked:
+			lineResults.put(lineContext, line, result)
+		errors.merge(found)
+		before = len(errors)
+		sequenceIDCheck(registry, IDs, errors)
+		for i in xrange(before, len(errors)):
+			errors.attach(i, table[keyList[errors[i].line - 1]], i + 1)
+                
+	return "clean"
+
+"""
+Checks the lines of one sequence of the gff file, as fileCheck() runs it, each with
+checkLine(). Genes are checked at once by geneBatchCheck(), except those whose line is
+taken from 'lineResults'. Once every line is checked, each feature is checked against its
+parents (see hierarchy.py) and the genes against each other (see overlaps.py).
+
+Parameters:
+-'keyList', 'table', 'genomes', 'types', 'geneticCode', 'lineResults', 'timer', 'digest': see
+				fileCheck().
+-'partition': (seqid, first, end) of the sequence, as FeatureTable.partitions() returns
+				it. Lines are numbered by their position in 'keyList'.
+
+Output:
+-'errors': a new ErrorCollector with the errors found.
+-'registry': the IDRegistry of the IDs the sequence defines.
+-'checked': (context, line, result) for each line checked that is to be added to
+				'lineResults'. They are added by the caller, as this may run in a worker
+				process.
+"""
+def sequenceCheck(keyList, table, genomes, partition, types = ['gene','mRNA','exon'], geneticCode=DEFAULT_CODE, lineResults=None, timer=None, digest=None):
+
+	seqid, first, end = partition
+	rows = keyList[first:end]
+	errors = ErrorCollector()
+	seqidCheck(seqid, genomes, first + 1, table[rows[0]], errors)
+	
+	Seq = genomeFor(genomes, seqid)
+	lineContext = context(Seq, seqid, digest, types, geneticCode)
+	kept = [None] * len(rows)
+	if lineResults is not None:
+		kept = [lineResults.get(lineContext, table[row]) for row in rows]
+	
+	state = checkState(geneticCode, errors, types)
+	genes = geneTable(rows, table, types, first)
+	unchecked = [i for i in xrange(len(genes[0])) if kept[genes[0][i] - first - 1] is None]
+	state['biology'] = dict()
+	if Seq is not None and unchecked:
+		if timer is None:
+			timer = StageTimer()
+		with timer.stage('geneCheck'):
+			state['biology'] = geneBatchCheck(pickGenes(genes, unchecked), Seq, geneticCode)
+	lineCount = first
+	checked = []
+	
+	for i, row in enumerate(rows):
 	    
 		lineCount += 1
-        
-		try:
-			theLine = holder[key].strip().split("\t") ## try here to catch if students not tab deliminating or adding extra lines
-		except:
-			Errors.append("Format Error: each line needs to be tab deliminated.")
-			continue
-        
-		try:
-			if len(theLine) > 9:
-				raise FormatError("0200")
-			elif len(theLine) < 9:
-				raise FormatError("0100")
-		except FormatError as er:
-			Errors.append("[" + str(lineCount) + "] " + er.returnError())
-			continue
-            
-        ### 1ST and 2ND ITEM ### 
-		try:
-			if charCheck(theLine[0]):
-				raise LineError("0002")
-			elif charCheck(theLine[1]):
-				raise LineError("0003")
-		except LineError as er:
-			Errors.append("[" + str(lineCount) +"] " + er.returnError())
-        
-        ### 3RD ITEM ###
-		try:
-			if theLine[2] not in types:
-				raise LineError("0004")  ## types can be changed if more types of line needed
-		except LineError as er:
-			Errors.append("[" + str(lineCount) +"] " + er.returnError())
-        
-        ### 4TH ITEM ###
-		try:
-			if not int(theLine[3]) > 0:
-				raise LineError("0005") ## needs to be greater than 0
-		except LineError as er:
-			Errors.append("[" + str(lineCount) +"] " + er.returnError())
-		except ValueError as er:
-			Errors.append("[" + str(lineCount) +"] " + str(er)) 
-        
-        
-        ### 5TH ITEM ###
-		try:
-			if not int(theLine[4]) > int(theLine[3]):
-				raise LineError("0006") ## needs to be greater than 1st coordinate
-		except LineError as er:
-			Errors.append("[" + str(lineCount) +"] " + er.returnError())
-		except ValueError as er:
-			Errors.append("[" + str(lineCount) +"] " + str(er)) 
-        
-        ### 6TH ITEM ###
-		try:
-			if theLine[5] != ".": ## can also be a number
-				try:
-					int(theLine[5])
-				except ValueError:
-					raise LineError("0007")
-		except LineError as er:
-			Errors.append("[" + str(lineCount) +"] " + er.returnError())
-            
-        ### 7TH ITEM ###
-		try:
-			if theLine[6] != "+":
-				if theLine[6] != "-":
-					raise LineError("0008")  ## + or - strand
-		except LineError as er:
-			Errors.append("[" + str(lineCount) +"] " + er.returnError())
-                
-         ### 8TH ITEM ### 
+		before = len(errors)
+		result = checkLine(table, row, table[row], lineCount, Seq, types, state, kept[i], lineResults is not None)
+		if result is not None:
+			checked.append((lineContext, table[row], result))
+		errors.attach(before, table[row])
+	
+	before = len(errors)
+	parentCheck(state)
+	errors.extend(spacingErrors(genes, genomeLength(Seq)))
+	for i in xrange(before, len(errors)):
+		errors.attach(i, table[keyList[errors[i].line - 1]], i + 1) ## the line naming the Parent or the gene
+	
+	return errors, state['registry'], checked
+
+"""
+Checks a line with rowCheck() if the table marks its row well formed, with lineCheck()
+otherwise, or adds the result kept for it from an earlier run (see replay()) if there is
+one and the IDs it defines are not used yet.
+
+Parameters:
+-'table', 'row': the FeatureTable and row of the line, or None for a line not in one.
+-'line', 'lineCount', 'Seq', 'types', 'state': see lineCheck().
+-'kept': the result kept for the line, or None.
+-'record': True to record the result of a line that is checked (see LineRecorder).
+
+Output:
+-'result': the result of the line if it was checked and recorded and can be kept, None
+				otherwise.
+"""
+def checkLine(table, row, line, lineCount, Seq, types, state, kept=None, record=False):
+	if kept is not None and replay(kept, lineCount, state):
+		return None
+	
+	recorder = None
+	if record:
+		recorder = LineRecorder(state)
+	if table is not None and table.wellFormed[row]:
+		rowCheck(table, row, lineCount, Seq, types, state)
+	else:
+		lineCheck(line, lineCount, Seq, types, state)
+	if recorder is not None:
+		return recorder.finish()
+	return None
+
+"""
+Returns the genes at 'positions' of a (lines, starts, ends, strands) tuple of geneTable().
+"""
+def pickGenes(genes, positions):
+	lines, starts, ends, strands = genes
+	return (array('l', [lines[i] for i in positions]), array('l', [starts[i] for i in positions]),
+			array('l', [ends[i] for i in positions]), ''.join([strands[i] for i in positions]))
+
+_poolJobs = dict() ## job number -> arguments of sequenceCheck() the worker processes inherit
+_jobNumbers = itertools.count()
+
+"""
+Runs sequenceCheck() for each sequence of a file across a pool of worker processes. The
+file and genomes are left where the workers inherit them when the pool is started, so
+only the sequence each worker checks and the errors it found are sent between processes.
+
+Parameters:
+-'partitions': the sequences, as FeatureTable.partitions() returns them.
+-'workers': number of worker processes.
+-the others: see fileCheck().
+
+Output:
+-'results': the output of sequenceCheck() for each sequence, in the order given.
+"""
+def poolCheck(keyList, table, genomes, partitions, types, geneticCode, workers, lineResults=None, digest=None):
+	job = next(_jobNumbers)
+	_poolJobs[job] = (keyList, table, genomes, types, geneticCode, lineResults, digest)
+	try:
+		pool = multiprocessing.Pool(min(workers, len(partitions)))
 		try:
-			if theLine[7] != ".":
-				raise LineError("0009")
-		except LineError as er:
-			Errors.append("[" + str(lineCount) +"] " + er.returnError())
-                
+			return pool.map(poolSequenceCheck, [(job, partition) for partition in partitions], chunksize=1)
+		finally:
+			pool.close()
+			pool.join()
+	finally:
+		del _poolJobs[job]
+
+"""
+Runs sequenceCheck() for one sequence, run by the workers of poolCheck(). Takes a single
+tuple so it can be mapped over.
+"""
+def poolSequenceCheck(task):
+	job, partition = task
+	keyList, table, genomes, types, geneticCode, lineResults, digest = _poolJobs[job]
+	return sequenceCheck(keyList, table, genomes, partition, types, geneticCode, lineResults, None, digest)
+
+"""
+Returns the genome the lines of a sequence (1st component 'seqid') are checked against:
+the sequence of that name in 'genomes', or the only one if the fasta file holds a single
+sequence. Returns None if 'genomes' is None or holds no such sequence.
+"""
+def genomeFor(genomes, seqid):
+	if genomes is None:
+		return None
+	Seq = genomes.get(seqid)
+	if Seq is None and len(genomes) == 1:
+		Seq = genomes.values()[0]
+	return Seq
+
+"""
+Reports a sequence (1st component 'seqid') that is not the name of a sequence of the fasta
+file, on the first line of the sequence. Nothing is reported if 'genomes' is None.
+"""
+def seqidCheck(seqid, genomes, lineCount, line, errors):
+	if genomes is not None and seqid not in genomes:
+		errors.emit("0014", lineCount, " Sequence: " + seqid + ".", source=line)
+
+"""
+Adds the IDs of a sequence to 'registry', the IDs of the sequences of the file before it,
+and reports the IDs one of them already used (see IDRegistry.merge()).
+"""
+def sequenceIDCheck(registry, other, errors):
+	for lineCount, ID, first in registry.merge(other):
+		errors.emit("0012", lineCount, " First used on line " + str(first) + ".") ## each id can only be used once
+
+"""
+Reports every Parent= that names an ID not defined anywhere in the file, then checks the
+features against their parents (see FeatureGraph.check()). Called once all lines have been
+through lineCheck() with 'state'.
+
+Parameters:
+-'state': dictionary returned by checkState().
+"""
+def parentCheck(state):
+	for lineCount, ID in state['registry'].unresolved():
+		state['errors'].emit("0026", lineCount, " Parent: " + ID)
+	state['errors'].extend(state['graph'].check())
+
+"""
+Returns the state lineCheck() carries from one line to the next: the IDs used so far (see
+registry.py), the features linked by ID and Parent so far (see hierarchy.py), the genetic
+code genes are translated with and the ErrorCollector errors are added to (a new one if
+'errors' is None). 'biology' can be set to the output of geneBatchCheck() so genes are not
+checked one line at a time.
+"""
+def checkState(geneticCode=DEFAULT_CODE, errors=None, types=['gene','mRNA','exon']):
+	if errors is None:
+		errors = ErrorCollector()
+	return {'registry': IDRegistry(), 'graph': FeatureGraph(types), 'geneticCode': geneticCode, 'biology': None, 'errors': errors}
+
+"""
+Checks each component of a single line of the gff file for proper format. Lines must be
+given in sorted order with the same 'state' so the type hierarchy and ID checks can look
+back at earlier lines. Adds to state['errors'] when a component is incorrectly formatted.
+
+Well formed lines are checked up to the 9th component by a single match of LINE_PATTERN;
+only lines it does not match are split and checked by columnCheck().
+
+Parameters:
+-'line': the line being checked.
+-'lineCount': line number used in the error messages.
+-'Seq': string of the nucleotide sequence extracted from uploaded fasta file.
+-'types': the type hierarchy.
+-'state': dictionary returned by checkState(), shared by every line of one file.
+"""
+def lineCheck(line, lineCount, Seq, types, state):
+
+	errors = state['errors']
+
+	fields = LINE_PATTERN.match(line.strip())
+	if fields is not None: ## 1ST to 8TH ITEM well formed, only the values are left to check
+		seqid, source, type, start, end, strand, attributes = fields.groups()
+		if type == "contig":
+			return
+		if type not in types:
+			errors.emit("0004", lineCount)
+		coord1 = int(start)
+		coord2 = int(end)
+		rangeCheck(coord1, coord2, lineCount, errors)
+		problem = None
+	else:
+		theLine = line.strip().split("\t")
+		if len(theLine) > 9:
+			errors.emit("0200", lineCount)
+			return
+		elif len(theLine) < 9:
+			errors.emit("0100", lineCount)
+			return
+		if theLine[2] == "contig":
+			return
+		coord1, coord2, problem1, problem2 = columnCheck(theLine, lineCount, types, errors)
+		type, strand, attributes = theLine[2], theLine[6], theLine[8]
+		problem = problem1 or problem2
+	
+	attributeCheck(type, coord1, coord2, problem, strand, attributes, lineCount, Seq, types, state)
+
+"""
+Checks a row of a FeatureTable the table marks well formed, as lineCheck() checks its line,
+from the values parsed when the table was built.
+
+Parameters:
+-'table': the FeatureTable.
+-'row': the row being checked.
+-the others: see lineCheck().
+"""
+def rowCheck(table, row, lineCount, Seq, types, state):
+	if table.typeCodes[row] == CONTIG:
+		return
+	coord1 = table.starts[row]
+	coord2 = table.ends[row]
+	rangeCheck(coord1, coord2, lineCount, state['errors'])
+	attributeCheck(table.typeName(row), coord1, coord2, None, table.strands[row], table.attributeText(row), lineCount, Seq, types, state)
+
+"""
+Checks the coordinates of a line whose 4th and 5th components are integers.
+"""
+def rangeCheck(coord1, coord2, lineCount, errors):
+	if not coord1 > 0:
+		errors.emit("0005", lineCount) ## needs to be greater than 0
+	if not coord2 > coord1:
+		errors.emit("0006", lineCount) ## needs to be greater than 1st coordinate
+
+"""
+Checks the 9th component of a line and runs the gene checks on lines of the first type.
+Adds to state['errors'] when the component is incorrectly formatted.
+
+Parameters:
+-'type', 'coord1', 'coord2', 'strand', 'attributes': the 3rd, 4th, 5th, 7th and 9th
+				components of the line, the coordinates as integers.
+-'problem': why the coordinates are not integers, or None. Genes are not checked if so.
+-the others: see lineCheck().
+"""
+def attributeCheck(type, coord1, coord2, problem, strand, attributes, lineCount, Seq, types, state):
+
+	registry = state['registry']
+	errors = state['errors']
+	if problem:
+		coord1 = coord2 = None
         
         ### 9TH ITEM ###        
-		if theLine[2] == types[0]: ######################## FOR types[0] (Where the gene is checked) #############
-			geneCheck(int(theLine[3]),int(theLine[4]),Seq,lineCount)
-			last = theLine[8]
-            
-			try:
-				if charCheck(last) :
-					raise LineError("0011")
-			except LineError as er:
-				Errors.append("[" + str(lineCount) +"] " + er.returnError())
+	if type == types[0]: ######################## FOR types[0] (Where the gene is checked) #############
+		if state['biology'] is not None:
+			errors.extend(state['biology'].get(lineCount, []))
+		elif not problem and max(coord1, coord2) < NO_COORDINATE: ## otherwise already reported for the 4th and 5th item, or left out as geneTable() leaves it
+			geneCheck(coord1,coord2,Seq,lineCount,state['geneticCode'],strand,errors)
             
-			count=1
+		if charCheck(attributes):
+			errors.emit("0011", lineCount)
             
-			last = theLine[8].split(";")
+		last = attributes.split(";")
             
-			_Name = False
-			_ID = False
-			try:
-				for x in range(0, len(last)):
-					if last[x].find("=") < 0:
-						continue
-					elif last[x].find("ID=") == 0:
-						_ID = True
-						priorID = last[x][3:]
-						if namesList.count(priorID) > 0:
-							raise LineError("0012") ## each id can only be used once 
-						else:
-							namesList.append(priorID)
-					elif last[x].find("Name=") == 0:
-						_Name = True
-					else:
-						raise ValidationError("1000")
-						continue
-			except LineError as er:
-				Errors.append("[" + str(lineCount) +"] " + er.returnError())
-			except ValidationError as er:
-				Errors.append("[" + str(lineCount) +"] " + er.returnError() + " = spurious info. Recheck requirements of 9th component")
+		_Name = False
+		_ID = False
+		priorID = None
+		for x in range(0, len(last)):
+			if last[x].find("=") < 0:
+				continue
+			elif last[x].find("ID=") == 0:
+				_ID = True
+				priorID = last[x][3:]
+				first = registry.define(priorID, lineCount)
+				if first is not None:
+					errors.emit("0012", lineCount, " First used on line " + str(first) + ".") ## each id can only be used once
+					break
+			elif last[x].find("Name=") == 0:
+				_Name = True
+			else:
+				errors.emit("1000", lineCount, " = spurious info. Recheck requirements of 9th component", 9)
+				break
             
-			try:
-				if not _Name or not _ID:
-					raise LineError("0013")  ## has to have a Name and an ID
-			except LineError as er:
-				Errors.append("[" + str(lineCount) +"] " + er.returnError())
+		if not _Name or not _ID:
+			errors.emit("0013", lineCount)  ## has to have a Name and an ID
+		
+		state['graph'].add(lineCount, type, coord1, coord2, priorID)
                 
                 
                                          ###################### FOR ALL OTHER TYPES ##################
-		else:                      
-			typesPos = int(types.index(theLine[2]))
+	else:                      
+		typesPos = int(types.index(type))
             
-			try:
-				if not count == typesPos:
-					raise LineError("0021") ## Either the file is not sorted properly or not all types are present for each gene
-					continue
-			except LineError as er:
-				Errors.append("[" + str(lineCount) +"] " + er.returnError())
-                
-			count += 1
-			last = theLine[8]
-            
-			try:
-				if charCheck(last):
-					raise LineError("0022")
-			except LineError as er:
-				Errors.append("[" + str(lineCount) +"] " + er.returnError())
+		if charCheck(attributes):
+			errors.emit("0022", lineCount)
             
-			tempID = "N/A"
-			last = theLine[8].split(";")
+		tempID = None
+		last = attributes.split(";")
             
-			_Parent = False
-			_ID = False
-			try:
-				for x in range(0, len(last)):
-					if last[x].find("=") < 0:
-						continue
-					elif last[x].find("ID=") == 0:
-						_ID = True
-						tempID = last[x][3:]
-						if namesList.count(tempID) > 0:
-							raise LineError("0023") ## each id can only be used once 
-						else:
-							namesList.append(tempID)
-					elif last[x].find("Parent=") == 0:
-						_Parent = True
-					else:
-						raise ValidationError("1000") ## Catch everything else.
-			except LineError as er:
-				Errors.append("[" + str(lineCount) +"] " + er.returnError())
-			except ValidationError as er:
-				Errors.append("[" + str(lineCount) +"] " + er.returnError() + " = spurious info. Recheck requirements of 9th component")
+		_Parent = False
+		_ID = False
+		spurious = False
+		for x in range(0, len(last)):
+			if last[x].find("=") < 0:
 				continue
+			elif last[x].find("ID=") == 0:
+				_ID = True
+				tempID = last[x][3:]
+				first = registry.define(tempID, lineCount)
+				if first is not None:
+					errors.emit("0023", lineCount, " First used on line " + str(first) + ".") ## each id can only be used once
+					break
+			elif last[x].find("Parent=") == 0:
+				_Parent = True
+				registry.refer(last[x][7:], lineCount)
+			else:
+				errors.emit("1000", lineCount, " = spurious info. Recheck requirements of 9th component", 9) ## Catch everything else.
+				spurious = True
+				break
             
-			try:
-				if count == len(types):
-					if not _Parent:
-						raise LineError("0024") ## for last type must at least have a Parent
-				else:
-					if not _Parent or not _ID:
-						raise LineError("0025") ## need an ID and Parent
-			except LineError as er:
-				Errors.append("[" + str(lineCount) +"] " + er.returnError())
+		if not spurious: ## otherwise the rest of the 9th component was not read
+			if typesPos == len(types) - 1:
+				if not _Parent:
+					errors.emit("0024", lineCount) ## for last type must at least have a Parent
+			elif not _Parent or not _ID:
+				errors.emit("0025", lineCount) ## need an ID and Parent
+		
+		## every Parent= of the line, also those after an error stopped the loop above
+		parents = ",".join([item[7:] for item in last if item.find("Parent=") == 0])
+		state['graph'].add(lineCount, type, coord1, coord2, tempID, parents)
                 
-	return "clean"
+	return
+
+"""
+Checks the 1st to 8th components of a line LINE_PATTERN did not match, one at a time.
+Adds to 'errors' for each component incorrectly formatted.
+
+Parameters:
+-'theLine': the nine components of the line.
+-'lineCount': line number used in the error messages.
+-'types': the type hierarchy.
+-'errors': ErrorCollector the errors found are added to.
+
+Output:
+-'(coord1, coord2, problem1, problem2)': the coordinates (see parseInt()).
+"""
+def columnCheck(theLine, lineCount, types, errors):
+            
+        ### 1ST and 2ND ITEM ### 
+	if charCheck(theLine[0]):
+		errors.emit("0002", lineCount)
+	elif charCheck(theLine[1]):
+		errors.emit("0003", lineCount)
+        
+        ### 3RD ITEM ###
+	if theLine[2] not in types:
+		errors.emit("0004", lineCount)  ## types can be changed if more types of line needed
+        
+        ### 4TH ITEM ###
+	coord1, problem1 = parseInt(theLine[3])
+	if problem1:
+		errors.add("0005", problem1, lineCount)
+	elif not coord1 > 0:
+		errors.emit("0005", lineCount) ## needs to be greater than 0
+        
+        ### 5TH ITEM ###
+	coord2, problem2 = parseInt(theLine[4])
+	if problem2 or problem1:
+		errors.add("0006", problem2 or problem1, lineCount)
+	elif not coord2 > coord1:
+		errors.emit("0006", lineCount) ## needs to be greater than 1st coordinate
+        
+        ### 6TH ITEM ###
+	if theLine[5] != "." and parseInt(theLine[5])[1]: ## can also be a number
+		errors.emit("0007", lineCount)
+            
+        ### 7TH ITEM ###
+	if theLine[6] != "+" and theLine[6] != "-":
+		errors.emit("0008", lineCount)  ## + or - strand
+                
+         ### 8TH ITEM ### 
+	if theLine[7] != ".":
+		errors.emit("0009", lineCount)
+	
+	return coord1, coord2, problem1, problem2
+
+"""
+Converts a coordinate or score to an integer.
+
+Output:
+-'(number, problem)': the integer and None, or None and the reason the text is not an
+				integer.
+"""
+def parseInt(text):
+	try:
+		return int(text), None
+	except ValueError as er:
+		return None, str(er)
     
 """
 Checks a string for characters not a-zA-Z0-9.=; and returns true if such a character is
@@ -412,53 +970,176 @@ def charCheck(str, search=re.compile(r'[^a-zA-Z0-9.=;]').search):
     
 """
 Checks if coordinates of sequence given is a proper gene. Writes errors to global list
-'Errors'.
+'errors'. Genes on the minus strand are read on the minus strand.
 
 Proper gene:
-- can be translated to a protein.
-- has a stop codon.
+- only contains A, C, G and T.
+- ends with a stop codon.
 - no internal stop codon.
 - begins with a start codon.
 
+The codons are looked up in the CodonIndex of 'Seq' (see codons.py), which is built the
+first time a gene of 'Seq' is checked and reused for the genes after it.
+
 Parameters:
 -'coord1': start coordinate of gene.
 -'coord2': second coordinate of gene.
 -'Seq': string nucleotide sequence.
 -'count': line in the file the gene is from.
+-'geneticCode': number of the genetic code the gene is translated with.
+-'strand': '+' or '-', strand the gene is on.
+-'errors': ErrorCollector the errors found are added to.
 """
-def geneCheck(coord1, coord2, Seq, count):
-	gene = Seq[coord1-1:coord2]
-	try:
-		if len(gene)%3 != 0:
-			raise BiologyError("0050") ## divisible by three
-	except BiologyError as er:
-		Errors.append("[" + str(count) +"] " + er.returnError())
-    
-	try:
-		protein = translate(gene) ## errors in translating the gene
-	except:
-		Errors.append("[" + str(count) + "]  Biology Error: unable to translate sequence. Ensure sequence provided is a nucleotide sequence.")
-		return
+def geneCheck(coord1, coord2, Seq, count, geneticCode=DEFAULT_CODE, strand="+", errors=None):
+	if errors is None:
+		errors = ErrorCollector()
+	errors.extend(geneErrors(codonIndex(Seq, geneticCode), coord1, coord2, strand, count))
+	return
+
+"""
+Runs the geneCheck() checks for a whole file of genes at once, against one CodonIndex of
+the genome.
+
+Parameters:
+-'genes': (lines, starts, ends, strands) from geneTable().
+-'Seq': string nucleotide sequence.
+-'geneticCode': number of the genetic code genes are translated with.
+
+Output:
+-'results': dictionary of line numbers paired with the list of ErrorRecords found for that
+				gene.
+"""
+def geneBatchCheck(genes, Seq, geneticCode=DEFAULT_CODE):
+	lines, starts, ends, strands = genes
+	index = codonIndex(Seq, geneticCode)
+	results = dict()
+	
+	for i in xrange(len(lines)):
+		results[lines[i]] = geneErrors(index, starts[i], ends[i], strands[i], lines[i])
+	
+	return results
+
+"""
+Collects the genes (lines of the first type) of a sorted file into parallel arrays for
+geneBatchCheck(). Lines that lineCheck() would not run the gene check on are left out.
+
+Parameters:
+-'keyList': list of sorted rows of 'table'.
+-'table': FeatureTable returned by sortGff3().
+-'types': the type hierarchy.
+-'offset': number of sorted lines before the first row of 'keyList'.
+
+Output:
+-'(lines, starts, ends, strands)': line numbers (counted as in fileCheck()), start and end
+				coordinates, and a string with the strand of each gene.
+"""
+def geneTable(keyList, table, types = ['gene','mRNA','exon'], offset=0):
+	lines = array('l')
+	starts = array('l')
+	ends = array('l')
+	strands = []
+	lineCount = offset
+	
+	for row in keyList:
+		lineCount += 1
+		if table.widths[row] != 9 or table.typeName(row) != types[0]:
+			continue
+		if table.starts[row] == NO_COORDINATE or table.ends[row] == NO_COORDINATE:
+			continue
+		lines.append(lineCount)
+		starts.append(table.starts[row])
+		ends.append(table.ends[row])
+		strands.append(table.strands[row])
+	
+	return lines, starts, ends, ''.join(strands)
 
-	Start = True
-	startCodon = Seq[coord1-1:coord1+2]
-	if startCodon == "ATG" or startCodon == "TTG" or startCodon == "GTG":
-		Start = False
+"""
+Returns the (start, end, strand) of a gene line, or None if geneTable() would leave the
+line out. Used when lines are not in a FeatureTable.
+
+Parameters:
+-'line': the line.
+-'types': the type hierarchy.
+"""
+def geneFields(line, types = ['gene','mRNA','exon']):
+	theLine = line.strip().split("\t")
+	if len(theLine) != 9 or theLine[2] != types[0]:
+		return None
+	start, end = toCoordinate(theLine[3]), toCoordinate(theLine[4])
+	if start == NO_COORDINATE or end == NO_COORDINATE:
+		return None
+	return start, end, theLine[6][:1] or "."
+
+"""
+Returns the length of the genome, or None if it could not be read.
+"""
+def genomeLength(Seq):
+	if Seq is None:
+		return None
+	return len(Seq)
+
+"""
+Returns the errors found for a single gene as a list of ErrorRecords, see geneCheck(). When a gene has no stop
+codon, internal stop codons or no start codon, the error says where the nearest one in
+frame is.
+
+Parameters:
+-'index': CodonIndex of the genome.
+-'coord1': start coordinate of gene.
+-'coord2': second coordinate of gene.
+-'strand': '+' or '-', strand the gene is on.
+-'count': line in the file the gene is from.
+"""
+def geneErrors(index, coord1, coord2, strand, count):
+	found = []
+	first, end = index.span(coord1, coord2, strand)
+	length = max(end - first, 0)
+	last = first + length - length%3 - 3 ## start of the last whole codon
+	
+	if length%3 != 0:
+		found.append(ErrorRecord(count, None, "0050", 'error', errorMessage("0050"), None)) ## divisible by three
     
-	try:
-		if protein.count("*") == 0:
-			raise BiologyError("0030") ## no stop codon
-		if protein.count("*") > 1:
-			raise BiologyError("0040") ## internal stop codons
-		if Start:
-			raise BiologyError("0020") ## has to start with M
-	except BiologyError as er:
-		Errors.append("[" + str(count) +"] " + er.returnError())
+	if index.hasUnknown(first, last+3, strand): ## errors in translating the gene
+		found.append(ErrorRecord(count, None, "0010", 'error', " Biology Error: unable to translate sequence. Ensure sequence provided is a nucleotide sequence.", None))
+		return found
+	
+	internal = index.stopsBetween(first, last, strand)
+	if not internal and (last < first or not index.isStop(last, strand)):
+		code, hint = "0030", stopHint(index, index.nextStop(first, strand), strand) ## no stop codon
+	elif internal:
+		code, hint = "0040", stopHint(index, internal[0], strand) ## internal stop codons
+	elif not index.isStart(first, strand):
+		code, hint = "0020", startHint(index, index.nearestStart(first, strand), strand) ## has to start with M
+	else:
+		return found
+	found.append(ErrorRecord(count, None, code, 'error', errorMessage(code) + hint, None))
     
-	return
+	return found
+
+"""
+Describes where a stop codon found in a CodonIndex ends, as the coordinate the gene would
+need to end at. Returns an empty string if 'position' is None.
+"""
+def stopHint(index, position, strand):
+	if position is None:
+		return ""
+	return " Nearest in-frame stop codon ends at " + str(index.toGenome(position+2, strand)) + "."
+
+"""
+Describes where a start codon found in a CodonIndex begins, as the coordinate the gene
+would need to start at. Returns an empty string if 'position' is None.
+"""
+def startHint(index, position, strand):
+	if position is None:
+		return ""
+	return " Nearest in-frame start codon begins at " + str(index.toGenome(position, strand)) + "."
     
 """
-Reads in a nucleotide sequence from a text file in .fasta format.
+Reads in a nucleotide sequence from a text file in .fasta format. The file is read through
+a FastaFile (see fasta.py) and must hold exactly one sequence.
+
+Raises FormatError "0600" if the file holds more than one sequence and "0700" if it can not
+be read or holds no sequence.
 
 Parameters:
 -'fasta_File': uploaded text file in .fasta format
@@ -468,69 +1149,125 @@ Output:
 """
 def fastaRead(fasta_File):
 
-	seq = []
 	try:
-		f1 = open(fasta_File, "r")
-	except:
-		return "Error: unable to read fasta file."
-    
-	#for line in fasta_File:
-	for line in f1:
+		f1 = FastaFile(fasta_File)
+	except (IOError, OSError):
+		raise FormatError("0700")
 	
-		line = line.rstrip()
-		if line.startswith(">"):
-			continue
-		else:
-			seq.append(line)
+	try:
+		names = f1.names()
+		if len(names) > 1 or f1.duplicates:
+			raise FormatError("0600")
+		if not names or not f1.length(names[0]):
+			raise FormatError("0700")
+		return f1.sequence(names[0])
+	finally:
+		f1.close()
+
+"""
+Reads in every sequence of a .fasta file, for files of several contigs. Sequences are
+looked up by name, the first word of their header line (see FastaFile); sequences without
+any bases are left out.
 
-	f1.close()
-	return ''.join(seq)
+Raises FormatError "0700" if the file can not be read or holds no bases, and "0800" if two
+sequences have the same name.
 
+Parameters:
+-'fasta_File': uploaded text file in .fasta format
+
+Output:
+-'genomes': dictionary of the names of the sequences paired with the sequences.
 """
-Translates a nucleotide sequence into a protein sequence. Uses a dictionary of nucleotides
-paired with the protein they translate for.
+def readGenomes(fasta_File):
+
+	try:
+		f1 = FastaFile(fasta_File)
+	except (IOError, OSError):
+		raise FormatError("0700")
+	
+	try:
+		if f1.duplicates:
+			raise FormatError("0800", " Sequence: " + f1.duplicates[0] + ".")
+		genomes = dict()
+		for name in f1.names():
+			if f1.length(name):
+				genomes[name] = f1.sequence(name)
+		if not genomes:
+			raise FormatError("0700")
+		return genomes
+	finally:
+		f1.close()
+
+_genomeLookups = {'hit': 0, 'miss': 0} ## lookups of loadGenomes() in a cache, in this process
+_genomeLock = threading.Lock()
+
+"""
+Reads in a .fasta file like readGenomes(), keeping the genomes and their CodonIndexes in
+'cache' under the SHA-256 of the file. The next time a file with the same contents is read
+the genomes are unpacked from the cache and their indexes reused, without parsing the file
+or searching it for codons again. Indexes are added to the entry as other genetic codes
+are asked for.
 
 Parameters:
--'nucSeq': string of nucleotides.
+-'fasta_File': the uploaded .fasta file.
+-'geneticCode': number of the genetic code the CodonIndexes are built for.
+-'cache': a DiskCache, or None to just read the file.
 
 Output:
--'protSeq': string of proteins.
+-'genomes': dictionary of the names of the sequences paired with the sequences.
 """
-def translate(nucSeq):
-    
-	codonLib = {'TTT':'F','TTC':'F','TTA':'L','TTG':'L','CTT':'L','CTC':'L','CTA':'L','CTG':'L','ATT':'I','ATC':'I','ATA':'I','ATG':'M','GTT':'V','GTC':'V',
-	'GTA':'V','GTG':'V','TCT':'S','TCC':'S','TCA':'S','TCG':'S','CCT':'P','CCC':'P','CCA':'P','CCG':'P','ACT':'T','ACC':'T','ACA':'T','ACG':'T','GCT':'A',
-	'GCC':'A','GCA':'A','GCG':'A','TAT':'Y','TAC':'Y','TAA':'*','TAG':'*','CAT':'H','CAC':'H','CAA':'Q','CAG':'Q','AAT':'N','AAC':'N','AAA':'K','AAG':'K',
-	'GAT':'D','GAC':'D','GAA':'E','GAG':'E','TGT':'C','TGC':'C','TGA':'*','TGG':'W','CGT':'R','CGC':'R','CGA':'R','CGG':'R','AGT':'S','AGC':'S','AGA':'R',
-	'AGG':'R','GGT':'G','GGC':'G','GGA':'G','GGG':'G'}
-    
-	cntLoc = 0
-	cntCodon = 0
-	codon = ''
-	protSeq = ''
-	while cntLoc < len(nucSeq):
-		codon = codon + nucSeq[cntLoc]
-		cntCodon += 1
-		if cntCodon == 3:
-			temp = codonLib[codon]
-			protSeq = protSeq + temp
-			codon = ''
-			cntCodon = 0
-		cntLoc += 1
-        
-	return protSeq
+def loadGenomes(fasta_File, geneticCode=DEFAULT_CODE, cache=None):
+
+	if cache is None:
+		return readGenomes(fasta_File)
+
+	try:
+		digest = fileDigest(fasta_File)
+	except (IOError, OSError):
+		raise FormatError("0700")
+
+	entry = cache.get(digest)
+	result = 'hit'
+	if entry is None or 'genomes' not in entry: ## or cached by an older version of the validator
+		result = 'miss'
+		entry = {'genomes': {}, 'indexes': {}}
+		for name, Seq in readGenomes(fasta_File).items():
+			entry['genomes'][name] = PackedSequence(Seq)
+	genomes = dict([(name, str(packed)) for name, packed in entry['genomes'].items()])
+
+	indexes = entry['indexes'].get(geneticCode)
+	if indexes is None:
+		entry['indexes'][geneticCode] = dict([(name, codonIndex(Seq, geneticCode)) for name, Seq in genomes.items()])
+		cache.put(digest, entry)
+	else:
+		for i, name in enumerate(genomes):
+			rememberIndex(genomes[name], indexes[name], keep=i > 0)
+	with _genomeLock:
+		_genomeLookups[result] += 1
+	return genomes
+
+"""
+Returns the lookups of loadGenomes() in a cache in this process so far, as (hits, misses).
+A file whose genomes were found is a hit even if its CodonIndexes for the genetic code
+asked for had to be built.
+"""
+def genomeCacheCounts():
+	with _genomeLock:
+		return _genomeLookups['hit'], _genomeLookups['miss']
 
 """
 Writes a sorted gff file and an errors text file.
 
 Parameters:
--'keyS': list of sorted keys.
--'holderS': dictionary of lines from the gff file paired with keys in 'keyS'.
+-'keyS': list of sorted rows of 'holderS'.
+-'holderS': FeatureTable returned by sortGff3(), or any other mapping of keys in 'keyS' to
+				lines.
 -'nameS': name of new sorted gff file. Also location where the file is written.
--'errors': list of all errors found in uploaded files to be written to text file.
+-'errors': ErrorCollector of all errors found in uploaded files to be written to text file.
 -'nameE': name of new errors text file. Also location where the file is written.
--'incLine': boolean indicating whether lines from the sorted file should be included in 
-				errors file.
+-'incLine': boolean indicating whether the line each error is about should be included in 
+				errors file. Lines are the ones attached to 'errors' (see ErrorCollector.source()),
+				so no error needs a search of 'keyS'.
 """
 def outFile(keyS, holderS, nameS, errors, nameE, incLine):
 
@@ -538,23 +1275,17 @@ def outFile(keyS, holderS, nameS, errors, nameE, incLine):
 	outS = nameS
 	
 	if incLine:
-		for item in errors:
-			if "Coordinate" in item:
-				tempE = item.split(" ")[1]
-				for key in keyS:
-					if tempE == key.split("_")[1]:
-						outE.write(holderS[key])
-						break
-			else:
-				tempE = int(item[1])
-				outE.write(holderS[keyS[tempE]])
+		for i, record in enumerate(errors):
+			source = errors.source(i)
+			if source is not None:
+				outE.write(source)
 			
-			outE.write(item)
+			outE.write(str(record))
 			outE.write("\n")
 			outE.write("\n")
 	else:
-		for item in errors:
-			outE.write(item)
+		for record in errors:
+			outE.write(str(record))
 			outE.write("\n")
 	
 	for key in keyS:
@@ -565,7 +1296,8 @@ def outFile(keyS, holderS, nameS, errors, nameE, incLine):
     
 
 if __name__ == "__main__":
-	main()
+	import gff_batch
+	sys.exit(gff_batch.cli(sys.argv[1:]))
  
     
     
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+"""
+Graph of the features of a gff file linked by their ID= and Parent= attributes, used by the
+validator to check the type hierarchy (gene -> mRNA -> exon by default) feature by feature
+instead of by the lines sharing a start coordinate, so genes with several exons are checked
+as well.
+
+Classes:
+
+- 'FeatureGraph': features of a file linked to their parents.
+"""
+
+from array import array
+
+from errors import ErrorRecord, errorMessage
+
+NO_PARENT = -1		## parent of a feature without a Parent=, or whose parent ID is not defined
+
+class FeatureGraph(object):
+	"""
+	Features of a gff file linked to their parents. Features are added one line at a time
+	(see add()) and linked once the whole file has been read (see check()), so a Parent= may
+	name a feature further down the file. Every lookup is a dictionary lookup and every
+	check a single pass over the features, so checking takes time linear in their number.
+
+	Parameters:
+	-'types': the type hierarchy.
+	"""
+
+	def __init__(self, types=['gene','mRNA','exon']):
+		self.types = types
+		self.lines = array('l')
+		self.codes = array('b')		## position of the type in 'types'
+		self.starts = []			## None for a coordinate that is not an integer
+		self.ends = []
+		self.parentIDs = []			## IDs named by Parent=, an empty list if there is none
+		self._nodes = dict()		## ID -> feature that defined it first
+
+	def __len__(self):
+		return len(self.lines)
+
+	def add(self, lineCount, type, coord1, coord2, ID=None, parents=None):
+		"""
+		Adds a feature.
+
+		Parameters:
+		-'lineCount': line the feature is on.
+		-'type': its type, one of 'types'.
+		-'coord1', 'coord2': its coordinates, or None if they are not integers.
+		-'ID': value of its ID= attribute, or None.
+		-'parents': value of its Parent= attribute (IDs separated by commas), or None.
+		"""
+		node = len(self.lines)
+		self.lines.append(lineCount)
+		self.codes.append(self.types.index(type))
+		self.starts.append(coord1)
+		self.ends.append(coord2)
+		self.parentIDs.append(parents.split(",") if parents else [])
+		if ID is not None and ID not in self._nodes:
+			self._nodes[ID] = node
+
+	def parents(self, node):
+		"""
+		Returns the features named by the Parent= of a feature that are defined in the file.
+		"""
+		found = []
+		for ID in self.parentIDs[node]:
+			parent = self._nodes.get(ID, NO_PARENT)
+			if parent != NO_PARENT:
+				found.append(parent)
+		return found
+
+	def check(self):
+		"""
+		Checks every feature against its parents. Parent= IDs that are not defined are left
+		to IDRegistry.unresolved() (see registry.py).
+
+		- 0028: a parent is not of the type just above the feature in the hierarchy.
+		- 0029: the feature is not within the coordinates of a parent.
+		- 0031: following the parents of the feature leads back to it.
+		- 0027: a feature, of any type but the last, is not the parent of a feature of the
+				next type.
+
+		Output:
+		-'records': list of ErrorRecords, ordered by line.
+		"""
+		found = dict() ## feature -> its errors
+		linked = array('b', [0]) * len(self) ## 1 once a feature of the next type names it
+
+		for node in xrange(len(self)):
+			for parent in self.parents(node):
+				if self.codes[parent] != self.codes[node] - 1:
+					self._report(found, node, "0028", " Parent: " + self.types[self.codes[parent]] + " on line " + str(self.lines[parent]) + ".")
+				else:
+					linked[parent] = 1
+				if not self._within(node, parent):
+					self._report(found, node, "0029", " Parent on line " + str(self.lines[parent]) + ".")
+
+		for node in self._cycles():
+			self._report(found, node, "0031")
+
+		last = len(self.types) - 1
+		for node in xrange(len(self)):
+			if self.codes[node] < last and not linked[node]:
+				self._report(found, node, "0027", " Missing: " + self.types[self.codes[node] + 1] + ".")
+
+		records = []
+		for node in sorted(found, key=lambda node: (self.lines[node], node)):
+			records.extend(found[node])
+		return records
+
+	def _within(self, node, parent):
+		coords = (self.starts[node], self.ends[node], self.starts[parent], self.ends[parent])
+		if None in coords:
+			return True ## already reported for the 4th and 5th component
+		return coords[0] >= coords[2] and coords[1] <= coords[3]
+
+	def _cycles(self):
+		"""
+		Returns the features whose parents lead back to them: the features of the strongly
+		connected components (Tarjan's algorithm, without recursion) with more than one
+		feature, or with a feature that is its own parent.
+		"""
+		links = [self.parents(node) for node in xrange(len(self))]
+		index = array('l', [-1]) * len(self) ## order each feature was reached in
+		low = array('l', [0]) * len(self)	## earliest feature reachable from it still on the stack
+		onStack = array('b', [0]) * len(self)
+		stack = []
+		reached = 0
+		inCycle = []
+
+		for root in xrange(len(self)):
+			if index[root] != -1:
+				continue
+			index[root] = low[root] = reached
+			reached += 1
+			stack.append(root)
+			onStack[root] = 1
+			work = [(root, 0)] ## feature and the next of its parents to follow
+			while work:
+				node, i = work[-1]
+				if i < len(links[node]):
+					work[-1] = (node, i + 1)
+					parent = links[node][i]
+					if index[parent] == -1:
+						index[parent] = low[parent] = reached
+						reached += 1
+						stack.append(parent)
+						onStack[parent] = 1
+						work.append((parent, 0))
+					elif onStack[parent]:
+						low[node] = min(low[node], index[parent])
+					continue
+				work.pop()
+				if work:
+					low[work[-1][0]] = min(low[work[-1][0]], low[node])
+				if low[node] == index[node]:
+					component = []
+					while True:
+						member = stack.pop()
+						onStack[member] = 0
+						component.append(member)
+						if member == node:
+							break
+					if len(component) > 1 or node in links[node]:
+						inCycle.extend(component)
+		return inCycle
+
+	def _report(self, found, node, code, detail=""):
+		found.setdefault(node, []).append(ErrorRecord(self.lines[node], 9, code, 'error', errorMessage(code) + detail, None))
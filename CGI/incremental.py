@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+"""
+Results of checking gff lines, kept from one validation run to the next so a file submitted
+again with a few lines changed only has those lines checked again.
+
+A line's result is what checking it found without looking at any other line: its errors
+(without the line number), the IDs it defines, the Parents it refers to and the feature it
+adds to the FeatureGraph (see hierarchy.py). IDs used twice, Parents not found, the type
+hierarchy and the spacing of the genes depend on the other lines, so they are checked again
+every run, from the results of every line.
+
+Classes:
+
+- 'LineResults': results of the lines checked most recently, by line and genome.
+- 'LineRecorder': records the result of a line while it is checked.
+
+Functions:
+
+- 'context()': returns what a line is checked against, part of the key of its result.
+- 'replay()': adds a kept result to the state of a run, as checking the line would.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from errors import ErrorRecord, errorKind
+
+DEFAULT_MAX_LINES = 100000
+
+class LineResults(object):
+	"""
+	Results of the 'maxLines' lines used most recently, by the line as read and the
+	context() it was checked in. A line checked against another genome, type hierarchy or
+	genetic code is checked again. Can be shared by runs in several threads.
+
+	'hits' and 'misses' count the lines whose result was found and not found.
+
+	Parameters:
+	-'maxLines': number of results kept.
+	"""
+
+	def __init__(self, maxLines=DEFAULT_MAX_LINES):
+		self.maxLines = maxLines
+		self.hits = 0
+		self.misses = 0
+		self._results = OrderedDict()	## (context, line) -> result, least recently used first
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._results)
+
+	def get(self, context, line):
+		"""
+		Returns the result of a line, or None if it is not kept.
+		"""
+		key = (context, line)
+		with self._lock:
+			result = self._results.pop(key, None)
+			if result is None:
+				self.misses += 1
+				return None
+			self._results[key] = result ## now the most recently used
+			self.hits += 1
+			return result
+
+	def put(self, context, line, result):
+		"""
+		Keeps the result of a line, then drops the least recently used results past
+		'maxLines'.
+		"""
+		key = (context, line)
+		with self._lock:
+			self._results.pop(key, None)
+			self._results[key] = result
+			while len(self._results) > self.maxLines:
+				self._results.popitem(last=False)
+
+"""
+Returns what the lines of a sequence are checked against: the genome, the type hierarchy
+and the genetic code. The genome is told apart by the SHA-256 of the .fasta file it was
+read from, as the genome cache keys it (see cache.fileDigest()), and its name; or by the
+SHA-256 of the sequence itself when the file's is not given.
+
+Parameters:
+-'Seq': string nucleotide sequence, or None if genes are not checked.
+-'seqid': name of the sequence the lines are checked against.
+-'digest': SHA-256 of the .fasta file 'Seq' was read from, or None.
+-'types': the type hierarchy.
+-'geneticCode': number of the genetic code genes are translated with.
+"""
+def context(Seq, seqid, digest, types, geneticCode):
+	genome = None
+	if Seq is not None:
+		if digest is None:
+			genome = hashlib.sha256(Seq).hexdigest()
+		else:
+			genome = (digest, seqid)
+	return genome, tuple(types), geneticCode
+
+class LineRecorder(object):
+	"""
+	Stands in for both the IDRegistry and the FeatureGraph of a checkState() while one
+	line is checked, passing every call on and noting what the line defined, referred to
+	and added, then builds its result (see finish()).
+
+	Parameters:
+	-'state': dictionary returned by checkState().
+	"""
+
+	def __init__(self, state):
+		self.state = state
+		self.registry = state['registry']
+		self.graph = state['graph']
+		self.before = len(state['errors'])
+		self.IDs = []
+		self.refers = []
+		self.feature = None
+		self.clash = False
+		state['registry'] = state['graph'] = self
+
+	def define(self, ID, lineCount):
+		first = self.registry.define(ID, lineCount)
+		if first is not None:
+			self.clash = True
+		self.IDs.append(ID)
+		return first
+
+	def refer(self, parents, lineCount):
+		self.refers.append(parents)
+		self.registry.refer(parents, lineCount)
+
+	def add(self, lineCount, type, coord1, coord2, ID=None, parents=None):
+		self.feature = (type, coord1, coord2, ID, parents)
+		self.graph.add(lineCount, type, coord1, coord2, ID, parents)
+
+	def finish(self):
+		"""
+		Puts the IDRegistry and FeatureGraph back in the state and returns the result of
+		the line, or None if it defined an ID already used: what it found then depends on
+		the lines before it.
+		"""
+		self.state['registry'] = self.registry
+		self.state['graph'] = self.graph
+		if self.clash:
+			return None
+		found = [(record.code, record.column, record.severity, record.message) for record in self.state['errors'].records(self.before)]
+		return tuple(found), tuple(self.IDs), tuple(self.refers), self.feature
+
+"""
+Adds the result of a line to the state of a run, numbered 'lineCount', as checking the
+line again would. Returns False, adding nothing, if the line defines an ID an earlier line
+of this run already used; the line must then be checked again. Its gene check errors are
+then left in state['biology'], if set, so they need not be found again.
+
+Parameters:
+-'result': the result of the line, as LineRecorder.finish() built it.
+-'lineCount': line number used in the error messages.
+-'state': dictionary returned by checkState().
+"""
+def replay(result, lineCount, state):
+	found, IDs, refers, feature = result
+	registry = state['registry']
+	for ID in IDs:
+		if ID in registry:
+			if state['biology'] is not None:
+				state['biology'][lineCount] = [ErrorRecord(lineCount, column, code, severity, message, None)
+						for code, column, severity, message in found if errorKind(code) == 'Biology']
+			return False
+
+	for ID in IDs:
+		registry.define(ID, lineCount)
+	for parents in refers:
+		registry.refer(parents, lineCount)
+	if feature is not None:
+		state['graph'].add(lineCount, *feature)
+	errors = state['errors']
+	for code, column, severity, message in found:
+		errors.add(code, message, lineCount, column, severity)
+	return True
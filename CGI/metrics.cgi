@@ -0,0 +1,21 @@
+#!/usr/bin/python
+
+"""
+Serves the metrics recorded by save_file_drop.cgi in the Prometheus text format (see
+metrics.py). Point a Prometheus server on the same machine at
+http://localhost/cgi-bin/metrics.cgi
+"""
+
+import os, sys
+from metrics import MetricsFile, CONTENT_TYPE
+
+CACHE_DIR = os.environ.get('GFF_VALIDATOR_CACHE', '/Library/WebServer/cache/')
+METRICS_PATH = os.environ.get('GFF_VALIDATOR_METRICS', os.path.join(CACHE_DIR, 'metrics.state'))
+
+def main():
+
+	body = MetricsFile(METRICS_PATH).read().render()
+	sys.stdout.write('Content-Type: %s\r\n\r\n' % CONTENT_TYPE)
+	sys.stdout.write(body)
+
+main()
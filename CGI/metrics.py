@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+
+"""
+Metrics of the validation service in the Prometheus text format, so a Prometheus server on
+the same machine can scrape them: how many submissions are being validated, how long they
+and each stage of a run take, how often each error code is found, how big the uploads are
+and how often the caches are hit.
+
+Recording a value is a dictionary update under a lock, or a bisection for a histogram, so
+the metrics stay on under load. The long running server keeps them in memory and serves
+them at /metrics (see gff_server.py). Each run of save_file_drop.cgi is a new process, so
+the cgi keeps them in a MetricsFile instead, served by metrics.cgi.
+
+Classes:
+
+- 'Registry': the metrics of a service, rendered together.
+- 'Counter', 'Gauge', 'Histogram': the kinds of metric.
+- 'MetricsFile': a Registry kept in a file shared by several processes.
+
+Functions:
+
+- 'validatorMetrics()': returns a Registry with the metrics of the validator.
+- 'observedMain()': validates a submission and returns what is recorded of the run.
+- 'observeSubmission()': records a submission in a Registry.
+- 'observeRun()': records a validation run in a Registry.
+- 'observeCache()': records the hits and misses of a cache in a Registry.
+"""
+
+import os
+import errno
+import fcntl
+import bisect
+import tempfile
+import threading
+import cPickle as pickle
+
+import gff_validator_drop as gff_validator
+from errors import errorKind
+from timing import StageTimer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+## seconds, from a cached result to a large genome
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+## bytes, 1 kB to 16 MB by powers of 4
+SIZE_BUCKETS = tuple([1024 * 4 ** i for i in xrange(8)])
+
+class Metric(object):
+	"""
+	A metric: a value for each combination of the values of its labels.
+
+	Parameters:
+	-'name': name of the metric.
+	-'help': line describing it.
+	-'labels': names of its labels.
+	"""
+
+	kind = 'untyped'
+
+	def __init__(self, name, help, labels=()):
+		self.name = name
+		self.help = help
+		self.labels = tuple(labels)
+		self._values = dict()	## values of the labels -> value
+		self._lock = threading.Lock()
+
+	def __getstate__(self):
+		state = dict(self.__dict__)
+		del state['_lock'] ## metrics are pickled to keep them in a MetricsFile
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._lock = threading.Lock()
+
+	def value(self, **labels):
+		"""
+		Returns the value for 'labels', or 0 if none was recorded.
+		"""
+		return self._values.get(self._key(labels), 0)
+
+	def samples(self):
+		"""
+		Returns (name, labels, value) for each value recorded, labels as (name, value) pairs.
+		"""
+		with self._lock:
+			return [(self.name, zip(self.labels, key), value) for key, value in sorted(self._values.items())]
+
+	def _key(self, labels):
+		return tuple([str(labels[name]) for name in self.labels])
+
+class Counter(Metric):
+	"""
+	A count that only goes up, such as the errors found with each code.
+	"""
+
+	kind = 'counter'
+
+	def inc(self, amount=1, **labels):
+		key = self._key(labels)
+		with self._lock:
+			self._values[key] = self._values.get(key, 0) + amount
+
+	def set(self, value, **labels):
+		"""
+		Sets the count, for counts kept elsewhere such as the hits of a cache.
+		"""
+		with self._lock:
+			self._values[self._key(labels)] = value
+
+class Gauge(Counter):
+	"""
+	A value that goes up and down, such as the submissions being validated.
+	"""
+
+	kind = 'gauge'
+
+	def dec(self, amount=1, **labels):
+		self.inc(-amount, **labels)
+
+class Histogram(Metric):
+	"""
+	Counts of the values observed by the bucket they fall in, with their number and sum.
+
+	Parameters:
+	-'buckets': upper bounds of the buckets, in increasing order.
+	"""
+
+	kind = 'histogram'
+
+	def __init__(self, name, help, buckets, labels=()):
+		Metric.__init__(self, name, help, labels)
+		self.buckets = tuple(buckets)
+
+	def observe(self, value, **labels):
+		key = self._key(labels)
+		i = bisect.bisect_left(self.buckets, value) ## values on a bound fall in its bucket
+		with self._lock:
+			counts = self._values.get(key)
+			if counts is None:
+				counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+			counts[0][i] += 1
+			counts[1] += value
+
+	def value(self, **labels):
+		"""
+		Returns the number of values observed for 'labels'.
+		"""
+		counts = self._values.get(self._key(labels))
+		if counts is None:
+			return 0
+		return sum(counts[0])
+
+	def samples(self):
+		found = []
+		with self._lock:
+			for key, (counts, total) in sorted(self._values.items()):
+				labels = zip(self.labels, key)
+				cumulative = 0
+				for bound, count in zip(self.buckets + (float('inf'),), counts):
+					cumulative += count
+					found.append((self.name + '_bucket', labels + [('le', formatValue(bound))], cumulative))
+				found.append((self.name + '_sum', labels, total))
+				found.append((self.name + '_count', labels, cumulative))
+		return found
+
+class Registry(object):
+	"""
+	The metrics of a service, by name, rendered together in the order they were made.
+	"""
+
+	def __init__(self):
+		self.metrics = []
+		self._byName = dict()
+
+	def __getitem__(self, name):
+		return self._byName[name]
+
+	def counter(self, name, help, labels=()):
+		return self._make(Counter(name, help, labels))
+
+	def gauge(self, name, help, labels=()):
+		return self._make(Gauge(name, help, labels))
+
+	def histogram(self, name, help, buckets, labels=()):
+		return self._make(Histogram(name, help, buckets, labels))
+
+	def render(self):
+		"""
+		Returns every metric in the Prometheus text format.
+		"""
+		lines = []
+		for metric in self.metrics:
+			lines.append("# HELP %s %s" % (metric.name, metric.help.replace("\\", "\\\\").replace("\n", "\\n")))
+			lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+			for name, labels, value in metric.samples():
+				if labels:
+					name += "{" + ",".join(['%s="%s"' % (label, escapeLabel(text)) for label, text in labels]) + "}"
+				lines.append(name + " " + formatValue(value))
+		return "\n".join(lines) + "\n"
+
+	def _make(self, metric):
+		if metric.name in self._byName:
+			raise ValueError("metric " + metric.name + " already registered")
+		self.metrics.append(metric)
+		self._byName[metric.name] = metric
+		return metric
+
+class MetricsFile(object):
+	"""
+	A Registry kept in a file, so metrics recorded by separate processes (each run of a cgi
+	script) add up. Each update reads the Registry, changes it and writes it back while
+	holding a lock on the file.
+
+	Parameters:
+	-'path': the file, created with validatorMetrics() the first time it is updated. Its
+			directory is created if it does not exist.
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		try:
+			os.makedirs(os.path.dirname(os.path.abspath(path)))
+		except OSError as er:
+			if er.errno != errno.EEXIST:
+				raise
+
+	def read(self):
+		"""
+		Returns the Registry kept in the file, or a new one if there is none yet.
+		"""
+		with open(self._lockPath(), 'a') as lock:
+			fcntl.flock(lock, fcntl.LOCK_SH)
+			return self._load()
+
+	def update(self, function):
+		"""
+		Calls 'function' with the Registry kept in the file and writes it back.
+		"""
+		with open(self._lockPath(), 'a') as lock:
+			fcntl.flock(lock, fcntl.LOCK_EX)
+			registry = self._load()
+			function(registry)
+			handle, temp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(os.path.abspath(self.path)))
+			with os.fdopen(handle, "wb") as f1:
+				pickle.dump(registry, f1, pickle.HIGHEST_PROTOCOL)
+			os.rename(temp, self.path)
+
+	def _load(self):
+		try:
+			with open(self.path, "rb") as f1:
+				return pickle.load(f1)
+		except (IOError, OSError, EOFError, pickle.UnpicklingError):
+			return validatorMetrics()
+
+	def _lockPath(self):
+		return self.path + ".lock"
+
+"""
+Returns a value as written in the Prometheus text format.
+"""
+def formatValue(value):
+	if value == float('inf'):
+		return "+Inf"
+	if isinstance(value, float):
+		return repr(value)
+	return str(value)
+
+"""
+Returns the value of a label with backslashes, quotes and newlines escaped.
+"""
+def escapeLabel(text):
+	return text.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+"""
+Returns a new Registry with the metrics of the validator:
+
+- gff_validator_submissions_total: submissions answered, by outcome ('ok', 'refused' for a
+		form that could not be validated, 'failed' for a crash).
+- gff_validator_submissions_in_progress: submissions being saved or validated, waiting
+		for a worker or not.
+- gff_validator_submission_seconds: seconds from a submission being read to its answer.
+- gff_validator_stage_seconds: wall clock seconds of each stage of a run (see timing.py).
+- gff_validator_errors_total: errors found, by code and kind (see errors.py).
+- gff_validator_input_bytes: size of the uploaded files, by file ('gff' or 'fasta').
+- gff_validator_cache_requests_total: lookups in a cache, by cache ('results' for the
+		ResultCache, 'lines' for the LineResults, 'genomes' for the genome cache of
+		loadGenomes()) and result ('hit' or 'miss').
+- gff_validator_cache_hit_ratio: share of the lookups in a cache that were hits.
+"""
+def validatorMetrics():
+	registry = Registry()
+	registry.counter('gff_validator_submissions_total', "Submissions answered, by outcome.", ['outcome'])
+	registry.gauge('gff_validator_submissions_in_progress', "Submissions being saved or validated.")
+	registry.histogram('gff_validator_submission_seconds', "Seconds from a submission being read to its answer.", LATENCY_BUCKETS)
+	registry.histogram('gff_validator_stage_seconds', "Wall clock seconds of each stage of a validation run.", LATENCY_BUCKETS, ['stage'])
+	registry.counter('gff_validator_errors_total', "Errors found, by code.", ['code', 'kind'])
+	registry.histogram('gff_validator_input_bytes', "Size of the uploaded files.", SIZE_BUCKETS, ['file'])
+	registry.counter('gff_validator_cache_requests_total', "Lookups in a cache, by result.", ['cache', 'result'])
+	registry.gauge('gff_validator_cache_hit_ratio', "Share of the lookups in a cache that were hits.", ['cache'])
+	return registry
+
+"""
+Validates a submission as gff_validator_drop.main() does, writing the errors and sorted
+files at 'errorsPath' and 'sortedPath', and returns what is recorded of the run: a
+dictionary of the seconds of each stage ('stages', see StageTimer.stages()), of the
+number of errors with each code ('codes') and of the hits and misses of the run in the
+genome cache ('genomeHits', 'genomeMisses', see gff_validator_drop.genomeCacheCounts()).
+
+Parameters:
+-the first seven: as 'run' is called by results.cachedMain().
+-the others are passed to main().
+"""
+def observedMain(gffPath, seqPath, errorsPath, sortedPath, incLine, types, geneticCode, **options):
+	timer = StageTimer()
+	hits, misses = gff_validator.genomeCacheCounts()
+	with open(errorsPath, 'w') as newErrors:
+		with open(sortedPath, 'w') as newSorted:
+			errors = gff_validator.main(gffPath, seqPath, newErrors, newSorted, incLine, types, geneticCode=geneticCode, timer=timer, **options)
+	after = gff_validator.genomeCacheCounts()
+	return {'stages': timer.stages(), 'codes': errors.codes(), 'genomeHits': after[0] - hits, 'genomeMisses': after[1] - misses}
+
+"""
+Records a submission answered: its outcome, the seconds it took and the size of its files.
+
+Parameters:
+-'registry': Registry made by validatorMetrics().
+-'outcome': 'ok', 'refused' or 'failed'.
+-'seconds': seconds from the submission being read to its answer.
+-'sizes': dictionary of 'gff' and 'fasta' paired with the size of the uploaded files, of
+		those that were saved.
+"""
+def observeSubmission(registry, outcome, seconds, sizes={}):
+	registry['gff_validator_submissions_total'].inc(outcome=outcome)
+	registry['gff_validator_submission_seconds'].observe(seconds)
+	for name, size in sizes.iteritems():
+		registry['gff_validator_input_bytes'].observe(size, file=name)
+
+"""
+Records a validation run: the seconds of each stage, the errors found with each code and
+the lookups in the genome cache.
+
+Parameters:
+-'registry': Registry made by validatorMetrics().
+-'observed': dictionary returned by observedMain(), or None for a submission answered
+		without a run.
+"""
+def observeRun(registry, observed):
+	if observed is None:
+		return
+	for stage, seconds in observed['stages'].iteritems():
+		registry['gff_validator_stage_seconds'].observe(seconds['wall'], stage=stage)
+	for code, count in observed['codes'].iteritems():
+		registry['gff_validator_errors_total'].inc(count, code=code, kind=errorKind(code))
+	if observed.get('genomeHits') or observed.get('genomeMisses'):
+		observeCache(registry, 'genomes', observed['genomeHits'], observed['genomeMisses'])
+
+"""
+Records the hits and misses of a cache, then its hit ratio.
+
+Parameters:
+-'registry': Registry made by validatorMetrics().
+-'cache': name of the cache, 'results', 'lines' or 'genomes'.
+-'hits', 'misses': hits and misses to add, or the totals if 'total' is True.
+"""
+def observeCache(registry, cache, hits, misses, total=False):
+	requests = registry['gff_validator_cache_requests_total']
+	if total:
+		requests.set(hits, cache=cache, result='hit')
+		requests.set(misses, cache=cache, result='miss')
+	else:
+		requests.inc(hits, cache=cache, result='hit')
+		requests.inc(misses, cache=cache, result='miss')
+	hits = requests.value(cache=cache, result='hit')
+	lookups = hits + requests.value(cache=cache, result='miss')
+	if lookups:
+		registry['gff_validator_cache_hit_ratio'].set(float(hits) / lookups, cache=cache)
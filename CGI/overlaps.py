@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+"""
+Checks of how the genes of a gff file sit next to each other on the genome: genes on the
+same strand overlapping by more than a few bases, genes annotated twice and long stretches
+of the genome without any gene.
+
+Classes:
+
+- 'OverlapIndex': genes sorted by start coordinate, searched for overlaps through a tree of
+	their largest end coordinates.
+
+Functions:
+
+- 'spacingErrors()': returns the errors found for the genes of a file.
+"""
+
+import sys
+import bisect
+from array import array
+
+from errors import ErrorRecord, errorMessage
+
+MAX_OVERLAP = 30	## bases genes on the same strand may overlap by, as stop and start codons do
+MAX_GAP = 1000		## bases of the genome that may lie between genes, more than most intergenic regions of a phage
+
+class OverlapIndex(object):
+	"""
+	Genes sorted by start coordinate, with a segment tree over them holding the largest end
+	coordinate of the genes under each node. Genes overlapping a span start at or before its
+	end (found by bisection) and end at or after its start; a search goes down only into the
+	nodes whose largest end reaches the start of the span, so it takes O(log n) steps for
+	each gene found however long the genes before it are.
+
+	Parameters:
+	-'starts', 'ends': coordinates of the genes.
+	-'ids': a value for each gene returned by overlapping(), such as its line number.
+	"""
+
+	def __init__(self, starts, ends, ids):
+		order = sorted(xrange(len(starts)), key=lambda i: (starts[i], ends[i], ids[i]))
+		self.starts = array('l', [starts[i] for i in order])
+		self.ends = array('l', [ends[i] for i in order])
+		self.ids = [ids[i] for i in order]
+
+		## node 1 is the root, the children of node k are 2k and 2k + 1 and the genes are
+		## the leaves from 'size' on
+		self.size = 1
+		while self.size < len(order):
+			self.size *= 2
+		self.reach = array('l', [-sys.maxint - 1]) * (2 * self.size)	## largest end under each node
+		self.reach[self.size:self.size + len(order)] = self.ends
+		for node in xrange(self.size - 1, 0, -1):
+			self.reach[node] = max(self.reach[2 * node], self.reach[2 * node + 1])
+
+	def __len__(self):
+		return len(self.starts)
+
+	def overlapping(self, coord1, coord2):
+		"""
+		Returns the positions (in start order) of the genes overlapping coord1 to coord2,
+		last first.
+		"""
+		found = []
+		last = bisect.bisect_right(self.starts, coord2) - 1
+		nodes = [(1, 0)] ## node and the position of its first gene
+		while nodes:
+			node, first = nodes.pop()
+			if first > last or self.reach[node] < coord1:
+				continue
+			if node >= self.size:
+				found.append(first)
+				continue
+			half = (self.size >> (node.bit_length() - 1)) // 2
+			nodes.append((2 * node, first))
+			nodes.append((2 * node + 1, first + half))
+		return found
+
+"""
+Checks the genes of a file against each other. Each overlap and duplicate is reported once,
+on the gene that comes later in start order. Overlaps and gaps are warnings; a duplicate
+gene is an error.
+
+- 0060: a gene overlaps a gene on the same strand by more than 'maxOverlap' bases.
+- 0070: a gene has the same coordinates and strand as another.
+- 0080: more than 'maxGap' bases before a gene, or after the last one, are in no gene.
+
+Parameters:
+-'genes': (lines, starts, ends, strands) as geneTable() returns them.
+-'genomeLength': length of the genome, or None to leave out the stretch after the last gene.
+-'maxOverlap', 'maxGap': see MAX_OVERLAP and MAX_GAP.
+
+Output:
+-'records': list of ErrorRecords, in start order of the genes they are about.
+"""
+def spacingErrors(genes, genomeLength=None, maxOverlap=MAX_OVERLAP, maxGap=MAX_GAP):
+	lines, starts, ends, strands = genes
+	records = []
+	if not len(lines):
+		return records
+
+	indexes = dict()
+	for strand in set(strands):
+		members = [i for i in xrange(len(lines)) if strands[i] == strand]
+		indexes[strand] = OverlapIndex([starts[i] for i in members], [ends[i] for i in members], members)
+
+	found = dict() ## position of a gene -> its errors
+	for strand, index in indexes.iteritems():
+		for position in xrange(len(index)):
+			gene = index.ids[position]
+			coord1, coord2 = index.starts[position], index.ends[position]
+			for other in index.overlapping(coord1, coord2):
+				if other >= position:
+					continue
+				if index.starts[other] == coord1 and index.ends[other] == coord2:
+					code, severity, detail = "0070", 'error', " Same as the gene on line " + str(lines[index.ids[other]]) + "."
+				else:
+					overlap = min(coord2, index.ends[other]) - coord1 + 1
+					if overlap <= maxOverlap:
+						continue
+					code, severity, detail = "0060", 'warning', " Overlaps the gene on line " + str(lines[index.ids[other]]) + " by " + str(overlap) + " bases."
+				found.setdefault(gene, []).append(ErrorRecord(lines[gene], None, code, severity, errorMessage(code) + detail, None))
+
+	order = sorted(xrange(len(lines)), key=lambda i: (starts[i], ends[i], lines[i]))
+	reach = 0 ## last base covered by the genes so far
+	last = order[0]
+	for gene in order:
+		gap = starts[gene] - reach - 1
+		if gap > maxGap:
+			found.setdefault(gene, []).append(ErrorRecord(lines[gene], None, "0080", 'warning', errorMessage("0080") + " " + str(gap) + " bases before this gene.", None))
+		if ends[gene] > reach:
+			reach = ends[gene]
+			last = gene
+	if genomeLength is not None and genomeLength - reach > maxGap:
+		found.setdefault(last, []).append(ErrorRecord(lines[last], None, "0080", 'warning', errorMessage("0080") + " " + str(genomeLength - reach) + " bases after this gene.", None))
+
+	for gene in order:
+		records.extend(found.get(gene, []))
+	return records
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""
+Registry of the IDs defined in a gff file, used by the validator to check that every ID
+is unique and that every Parent= refers to an ID defined somewhere in the file.
+
+Classes:
+
+- 'IDRegistry': IDs paired with the line they were first defined on.
+"""
+
+class IDRegistry(object):
+	"""
+	Keeps the line each ID was first defined on in a dictionary, so defining an ID and
+	checking a reference are both single lookups. References to IDs that have not been
+	defined yet are held until the ID shows up; whatever is left once the whole file has
+	been read is returned by unresolved().
+	"""
+
+	def __init__(self):
+		self._lines = dict()	## ID -> line the ID was first defined on
+		self._pending = dict()	## ID -> lines that referred to it before it was defined
+
+	def __contains__(self, ID):
+		return ID in self._lines
+
+	def __len__(self):
+		return len(self._lines)
+
+	def define(self, ID, lineCount):
+		"""
+		Defines an ID on a line. Returns the line the ID was first defined on if it is
+		already used, None otherwise.
+
+		Parameters:
+		-'ID': the ID being defined.
+		-'lineCount': line the ID is defined on.
+		"""
+		first = self._lines.get(ID)
+		if first is not None:
+			return first
+		self._lines[ID] = lineCount
+		self._pending.pop(ID, None)
+		return None
+
+	def refer(self, parents, lineCount):
+		"""
+		Records a reference to a parent ID. A Parent= value may name several parents
+		separated by commas.
+
+		Parameters:
+		-'parents': value of the Parent= attribute.
+		-'lineCount': line the reference is made on.
+		"""
+		for ID in parents.split(","):
+			if ID not in self._lines:
+				self._pending.setdefault(ID, []).append(lineCount)
+
+	def firstLine(self, ID):
+		"""
+		Returns the line an ID was first defined on, or None if it was never defined.
+
+		Parameters:
+		-'ID': the ID to look up.
+		"""
+		return self._lines.get(ID)
+
+	def merge(self, other):
+		"""
+		Defines the IDs of another IDRegistry, such as the one of another sequence of the
+		same file. Returns (lineCount, ID, first) triples, ordered by line, for the IDs of
+		'other' already defined here, 'first' being the line they were defined on here.
+		"""
+		clashes = []
+		for ID, lineCount in other._lines.items():
+			first = self.define(ID, lineCount)
+			if first is not None:
+				clashes.append((lineCount, ID, first))
+		clashes.sort()
+		return clashes
+
+	def unresolved(self):
+		"""
+		Returns (lineCount, ID) pairs, ordered by line, for every reference to an ID that
+		was never defined.
+		"""
+		missing = []
+		for ID, lines in self._pending.items():
+			for lineCount in lines:
+				missing.append((lineCount, ID))
+		missing.sort()
+		return missing
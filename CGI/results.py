@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+"""
+Results of whole validation runs, kept so a submission of the same gff and fasta files with
+the same options (a double click, a page refreshed, a file checked again) gets the report
+of the first run instead of being validated again.
+
+A result is found by the contents of both files and the options that change the report, so
+a file renamed or uploaded from another machine still finds it. The error and sorted files
+written for a submission are linked again as long as they are still in the results
+directory; once they are removed, new ones are written from the kept report.
+
+Classes:
+
+- 'ResultCache': reports of earlier runs stored on disk, dropped after 'maxAge' seconds.
+
+Functions:
+
+- 'resultKey()': returns the key of the result of a submission.
+- 'resultFiles()': creates the error and sorted files of a submission.
+- 'cachedMain()': validates a submission through a ResultCache.
+"""
+
+import os
+import re
+import time
+import hashlib
+import datetime
+import tempfile
+import threading
+
+import gff_validator_drop as gff_validator
+from cache import DiskCache, fileDigest
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+RESULT_NAME = re.compile(r"(Errors|Sorted)_\w+_DT_[0-9:.\-]+\.txt$")	## names resultFiles() gives
+
+class ResultCache(DiskCache):
+	"""
+	Reports of earlier validation runs, by resultKey(). Each entry is a dictionary of the
+	text of the errors file ('errors'), the text of the sorted file ('sorted') and the names
+	of the files they were written to ('names'). Entries are dropped once 'maxAge' seconds
+	old, or least recently used first once they take more than 'maxBytes' (see DiskCache).
+
+	'hits' and 'misses' count the submissions whose result was found and not found.
+
+	Parameters:
+	-'directory': directory entries are kept in, created if it does not exist.
+	-'maxBytes': total size the entries may take.
+	-'maxAge': seconds an entry is kept after it was stored.
+	"""
+
+	def __init__(self, directory, maxBytes=DEFAULT_MAX_BYTES, maxAge=DEFAULT_MAX_AGE):
+		DiskCache.__init__(self, directory, maxBytes)
+		self.maxAge = maxAge
+		self.hits = 0
+		self.misses = 0
+		self._lock = threading.Lock()
+
+	def get(self, key, default=None):
+		"""
+		Returns the entry stored under 'key', or 'default' if there is none or it is older
+		than 'maxAge'.
+		"""
+		entry = DiskCache.get(self, key)
+		if entry is not None and time.time() - entry['stored'] > self.maxAge:
+			self._remove(self._path(key))
+			entry = None
+		with self._lock:
+			if entry is None:
+				self.misses += 1
+				return default
+			self.hits += 1
+			return entry
+
+	def put(self, key, entry):
+		entry = dict(entry)
+		entry['stored'] = time.time()
+		DiskCache.put(self, key, entry)
+
+	def hitRate(self):
+		"""
+		Returns the share of the submissions whose result was found, or 0.0 before any.
+		"""
+		total = self.hits + self.misses
+		if not total:
+			return 0.0
+		return float(self.hits) / total
+
+"""
+Returns the key of the result of a submission, a hex string: the SHA-256 of the contents of
+both files and of every option that changes what is written.
+
+Parameters:
+-'gffPath': the uploaded gff file.
+-'seqPath': the uploaded fasta file.
+-'incLine', 'types', 'stream', 'geneticCode': see gff_validator_drop.main().
+"""
+def resultKey(gffPath, seqPath, incLine, types, stream=False, geneticCode=gff_validator.DEFAULT_CODE):
+	digest = hashlib.sha256()
+	digest.update(fileDigest(gffPath))
+	digest.update(fileDigest(seqPath))
+	digest.update(repr((bool(incLine), list(types), bool(stream), geneticCode)))
+	return digest.hexdigest()
+
+"""
+Creates the errors and sorted files of a submission in 'outDir', named by the time they
+were made, and returns their paths.
+"""
+def resultFiles(outDir):
+	suf = '_DT_' + str(datetime.datetime.fromtimestamp(time.time())).replace(" ", "") + '.txt'
+	newErrors = tempfile.NamedTemporaryFile(suffix=suf, prefix='Errors_', dir=outDir, delete=False)
+	newSorted = tempfile.NamedTemporaryFile(suffix=suf, prefix='Sorted_', dir=outDir, delete=False)
+	newErrors.close()
+	newSorted.close()
+	return newErrors.name, newSorted.name
+
+"""
+Writes the errors and sorted files of a submission as run() does, by gff_validator_drop.main()
+if not given.
+"""
+def _runMain(gffPath, seqPath, errorsPath, sortedPath, incLine, types, geneticCode, **options):
+	with open(errorsPath, 'w') as newErrors:
+		with open(sortedPath, 'w') as newSorted:
+			gff_validator.main(gffPath, seqPath, newErrors, newSorted, incLine, types, geneticCode=geneticCode, **options)
+
+"""
+Validates a submission through a ResultCache and returns the paths of its errors and sorted
+files. A submission validated before gets the files written for it then, if they are still
+in 'outDir', or new files with the report kept of it. Any other is validated and its report
+kept.
+
+Parameters:
+-'results': the ResultCache.
+-'gffPath', 'seqPath': the uploaded files.
+-'outDir': directory the errors and sorted files are written to.
+-'incLine', 'types', 'geneticCode', 'stream': see gff_validator_drop.main().
+-'run': function writing the files of a submission, called as
+		run(gffPath, seqPath, errorsPath, sortedPath, incLine, types, geneticCode), such as
+		one handing it to a worker process. Runs main() in this process if None.
+-the others are passed to main(), when 'run' is None.
+
+Output:
+-'errorsPath', 'sortedPath': the errors and sorted files.
+"""
+def cachedMain(results, gffPath, seqPath, outDir, incLine=False, types=['gene','mRNA','exon'], geneticCode=gff_validator.DEFAULT_CODE, stream=False, run=None, **options):
+
+	key = resultKey(gffPath, seqPath, incLine, types, stream, geneticCode)
+	entry = results.get(key)
+
+	if entry is not None:
+		paths = [os.path.join(outDir, name) for name in entry['names']]
+		if all([os.path.exists(path) for path in paths]):
+			return paths[0], paths[1]
+
+	errorsPath, sortedPath = resultFiles(outDir)
+	if entry is not None:
+		open(errorsPath, 'w').write(entry['errors'])
+		open(sortedPath, 'w').write(entry['sorted'])
+	else:
+		if run is None:
+			options['stream'] = stream
+			_runMain(gffPath, seqPath, errorsPath, sortedPath, incLine, types, geneticCode, **options)
+		else:
+			run(gffPath, seqPath, errorsPath, sortedPath, incLine, types, geneticCode)
+		entry = {'errors': open(errorsPath).read(), 'sorted': open(sortedPath).read()}
+
+	entry['names'] = (os.path.basename(errorsPath), os.path.basename(sortedPath))
+	results.put(key, entry)
+	return errorsPath, sortedPath
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""
+Timing of the stages of a validation run, so it can be told where the time of a run goes:
+in the debug section of a report, in one log line per run, or in a profile of the whole run.
+
+Each run logs a line to the 'gff_validator' logger (see LOGGER): a JSON object with the time
+it was made, the process, the file validated, the number of errors found and the wall
+clock and CPU seconds of each stage. The logger has no handler of its own, so nothing is
+written until one is added (see logTo()); lines from every run of a lab session can then be
+read back with json.loads() and added up.
+
+Classes:
+
+- 'StageTimer': wall clock and CPU seconds taken by each stage of a run.
+
+Functions:
+
+- 'cpuTime()': returns the CPU seconds used by this process so far.
+- 'profileCall()': calls a function under cProfile and writes its stats to a file.
+- 'logTo()': writes the log lines of every run to a file.
+"""
+
+import os
+import time
+import json
+import logging
+import resource
+import cProfile
+from contextlib import contextmanager
+
+## stages of main() in the order they run; 'streamGff3' only in the streaming mode and
+## 'geneCheck' within 'fileCheck'
+STAGES = ['fastaRead', 'streamGff3', 'sortGff3', 'fileCheck', 'geneCheck', 'outFile']
+
+LOGGER = logging.getLogger('gff_validator')
+LOGGER.addHandler(logging.NullHandler())
+
+class StageTimer(object):
+	"""
+	Wall clock and CPU seconds taken by each stage of a run. A stage run several times (once
+	for each sequence of a file) is added up. CPU seconds are those of the whole process,
+	including threads other than the one running the stage.
+	"""
+
+	def __init__(self):
+		self.wall = dict()
+		self.cpu = dict()
+		self.order = []		## stages in the order they first ran
+
+	def __len__(self):
+		return len(self.order)
+
+	@contextmanager
+	def stage(self, name):
+		"""
+		Times the block of a 'with' statement as stage 'name'.
+		"""
+		wallBegin = time.time()
+		cpuBegin = cpuTime()
+		try:
+			yield
+		finally:
+			self.add(name, time.time() - wallBegin, cpuTime() - cpuBegin)
+
+	def add(self, name, wall, cpu):
+		"""
+		Adds 'wall' and 'cpu' seconds to stage 'name'.
+		"""
+		if name not in self.wall:
+			self.order.append(name)
+			self.wall[name] = self.cpu[name] = 0.0
+		self.wall[name] += wall
+		self.cpu[name] += cpu
+
+	def stages(self):
+		"""
+		Returns a dictionary of each stage paired with a dictionary of its 'wall' and 'cpu'
+		seconds.
+		"""
+		return dict((name, {'wall': self.wall[name], 'cpu': self.cpu[name]}) for name in self.order)
+
+	def lines(self):
+		"""
+		Returns the debug section of a report: a line for each stage, in the order they ran.
+		"""
+		found = ["Debug: seconds taken by each stage (wall clock, CPU)."]
+		for name in self.order:
+			found.append("%-12s %10.4f %10.4f" % (name, self.wall[name], self.cpu[name]))
+		return found
+
+	def log(self, event='validation', **fields):
+		"""
+		Logs a line for the run with the seconds of each stage and 'fields' (see LOGGER).
+		"""
+		record = {'event': event, 'time': time.time(), 'pid': os.getpid(), 'stages': self.stages()}
+		record.update(fields)
+		LOGGER.info(json.dumps(record, sort_keys=True))
+
+"""
+Returns the CPU seconds (user and system) used by this process so far.
+"""
+def cpuTime():
+	usage = resource.getrusage(resource.RUSAGE_SELF)
+	return usage.ru_utime + usage.ru_stime
+
+"""
+Calls 'function' with the arguments given under cProfile, writes the stats of the call to
+'path' (read them with the pstats module) and returns what the function returned.
+"""
+def profileCall(path, function, *args, **kwargs):
+	profiler = cProfile.Profile()
+	try:
+		return profiler.runcall(function, *args, **kwargs)
+	finally:
+		profiler.dump_stats(path)
+
+"""
+Writes the log lines of every run to the file at 'path', added to the end of the file so
+several processes can write to it. Returns the handler added.
+"""
+def logTo(path):
+	handler = logging.FileHandler(path)
+	handler.setFormatter(logging.Formatter('%(message)s'))
+	LOGGER.addHandler(handler)
+	LOGGER.setLevel(logging.INFO)
+	return handler
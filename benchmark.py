@@ -0,0 +1,441 @@
+import os, sys, time, random, tempfile, shutil, argparse, json, platform
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CGI'))
+
+import gff_validator_drop as validator
+import codons
+import cache
+import errors
+import features
+
+'''
+timing benchmarks for the validator in CGI/
+
+usage: python benchmark.py [number of features ...]
+       python benchmark.py --suite [--scales phage,genome,large] [--error-rate 0.05] [--json results.json]
+
+The suite writes a synthetic genome and its annotation at each scale, times every stage of
+a validation run on them and appends the times to the --json file, so runs can be compared
+over time.
+'''
+
+SIZES = [1000, 10000, 100000]
+
+## name -> (length of the genome, number of feature lines); one gene per len(types) lines
+SCALES = [('phage', 50000, 150), ('genome', 1000000, 10000), ('large', 10000000, 100000)]
+
+STAGES = ['fastaRead', 'sortGff3', 'geneCheck', 'translate', 'fileCheck', 'outFile']
+
+## the ways syntheticGenome() can spoil a gene, each caught by a different check
+FAULTS = ['frame', 'stop', 'strand', 'coordinate', 'parent']
+
+FASTA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'docs', 'Phabio.fasta')
+
+def syntheticGff3(nFeatures, types=['gene','mRNA','exon'], seed=0):
+    """
+    Writes a shuffled gff3 file with nFeatures well formed lines (one line per type for
+    each gene) and returns its path.
+
+    Parameters:
+    - 'nFeatures': number of feature lines to write.
+    - 'types': type hierarchy, one line of each type is written per gene.
+    - 'seed': seed for the shuffle so runs are repeatable.
+    """
+    rand = random.Random(seed)
+    lines = []
+    for gene in range(nFeatures // len(types)):
+        start = 1 + gene * 1000
+        end = start + 899
+        parent = 'Name=gene' + str(gene)
+        for type in types:
+            lines.append("\t".join(['Phabio', 'Group', type, str(start), str(end), '.', '+', '.', 'ID=' + type + str(gene) + ';' + parent]))
+            parent = 'Parent=' + type + str(gene)
+    rand.shuffle(lines)
+
+    handle, path = tempfile.mkstemp(suffix='.gff3')
+    os.write(handle, "##gff-version 3\n")
+    os.write(handle, "\t".join(['Phabio', 'Group', 'contig', '1', str(nFeatures * 1000), '.', '+', '.', 'Name=Phabio']) + "\n")
+    os.write(handle, "\n".join(lines) + "\n")
+    os.close(handle)
+    return path
+
+def syntheticGenome(length, nFeatures, errorRate=0.0, types=['gene','mRNA','exon'], seed=0):
+    """
+    Writes a synthetic genome to a .fasta file and its annotation to a shuffled gff3 file,
+    returns both paths. Genes are open reading frames (a start codon, codons that are not
+    stops, then a stop codon) spread evenly over the genome on alternating strands, with
+    one line of each type per gene, so a file without faults has no error but the one for
+    its "##gff-version 3" line.
+
+    Parameters:
+    - 'length': length of the genome.
+    - 'nFeatures': number of feature lines to write.
+    - 'errorRate': share of the genes spoiled by one of FAULTS, picked at random.
+    - 'types': type hierarchy, one line of each type is written per gene.
+    - 'seed': seed for the sequence, the faults and the shuffle so runs are repeatable.
+    """
+    rand = random.Random(seed)
+    nGenes = max(nFeatures // len(types), 1)
+    spacing = length // nGenes
+    geneLength = min(900, spacing * 9 // 10) // 3 * 3
+    if geneLength < 9:
+        raise ValueError("genome too short for " + str(nGenes) + " genes")
+
+    ## slices of random pools are much faster than a random choice per base
+    bases = ''.join([rand.choice('ACGT') for i in xrange(1 << 16)])
+    table = codons.codonTable()
+    senseCodons = [codon for codon in codons.CODONS if table[codon] != '*']
+    body = ''.join([rand.choice(senseCodons) for i in xrange(1 << 14)])
+
+    def randomBases(n):
+        start = rand.randrange(len(bases) - n) if n < len(bases) else 0
+        return bases[start:start+n]
+
+    sequence = []
+    lines = []
+    for gene in xrange(nGenes):
+        fault = rand.choice(FAULTS) if rand.random() < errorRate else None
+        start = gene * spacing + 1
+        end = start + geneLength - 1
+        strand = "+-"[gene % 2]
+        codonCount = geneLength // 3 - 2
+        first = rand.randrange(len(body) // 3 - codonCount) * 3
+        orf = "ATG" + body[first:first + codonCount*3] + "TAA"
+        if fault == 'stop':
+            middle = geneLength // 6 * 3
+            orf = orf[:middle] + "TGA" + orf[middle+3:]
+        if strand == '-':
+            orf = codons.reverseComplement(orf)
+        sequence.append(orf)
+        sequence.append(randomBases(spacing - geneLength))
+
+        columns = ['Synthetic', 'Group', None, str(start), str(end + (fault == 'frame')), '.', strand, '.']
+        if fault == 'strand':
+            columns[6] = '*'
+        elif fault == 'coordinate':
+            columns[3] = 'x' + columns[3]
+        parent = 'Name=gene' + str(gene)
+        for type in types:
+            columns[2] = type
+            lines.append("\t".join(columns + ['ID=' + type + str(gene) + ';' + parent]))
+            parent = 'Parent=' + type + str(gene)
+            if fault == 'parent':
+                parent += 'x'
+    sequence.append(randomBases(length - nGenes * spacing))
+    rand.shuffle(lines)
+
+    handle, fastaPath = tempfile.mkstemp(suffix='.fasta')
+    os.write(handle, ">Synthetic\n")
+    genome = ''.join(sequence)
+    os.write(handle, "\n".join([genome[i:i+70] for i in xrange(0, len(genome), 70)]) + "\n")
+    os.close(handle)
+
+    handle, gffPath = tempfile.mkstemp(suffix='.gff3')
+    os.write(handle, "##gff-version 3\n")
+    os.write(handle, "\t".join(['Synthetic', 'Group', 'contig', '1', str(length), '.', '+', '.', 'Name=Synthetic']) + "\n")
+    os.write(handle, "\n".join(lines) + "\n")
+    os.close(handle)
+    return fastaPath, gffPath
+
+def benchStages(fastaPath, gffPath, types=['gene','mRNA','exon'], geneticCode=codons.DEFAULT_CODE):
+    """
+    Times each stage of a validation run over a .fasta and a gff file, in the order main()
+    runs them, returns a dictionary of STAGES paired with the seconds each took and the
+    number of errors found.
+
+    - 'geneCheck' builds the codon index of the genome and checks every gene against it.
+    - 'translate' translates every gene on its strand.
+    - 'fileCheck' checks every line; the genes are checked again, against the codon index
+      'geneCheck' built.
+    - 'outFile' writes the sorted file and the errors to os.devnull.
+
+    Parameters:
+    - 'fastaPath', 'gffPath': the files validated.
+    - 'types': the type hierarchy.
+    - 'geneticCode': genetic code genes are translated with.
+    """
+    seconds = dict()
+    collector = errors.ErrorCollector()
+
+    begin = time.time()
+    seq = validator.fastaRead(fastaPath)
+    seconds['fastaRead'] = time.time() - begin
+
+    begin = time.time()
+    keyList, table = validator.sortGff3(gffPath, types, collector)
+    seconds['sortGff3'] = time.time() - begin
+
+    codons._indexCache.clear()
+    genes = validator.geneTable(keyList, table, types)
+    begin = time.time()
+    validator.geneBatchCheck(genes, seq, geneticCode)
+    seconds['geneCheck'] = time.time() - begin
+
+    lines, starts, ends, strands = genes
+    begin = time.time()
+    for i in xrange(len(lines)):
+        gene = seq[starts[i]-1:ends[i]]
+        if strands[i] == '-':
+            gene = codons.reverseComplement(gene)
+        codons.translate(gene, geneticCode)
+    seconds['translate'] = time.time() - begin
+
+    begin = time.time()
+    validator.fileCheck(keyList, table, {'Synthetic': seq}, types, geneticCode, collector)
+    seconds['fileCheck'] = time.time() - begin
+
+    with open(os.devnull, 'w') as newSorted:
+        with open(os.devnull, 'w') as newErrors:
+            begin = time.time()
+            validator.outFile(keyList, table, newSorted, collector, newErrors, False)
+            seconds['outFile'] = time.time() - begin
+
+    return seconds, len(collector)
+
+def suite(scales, errorRate=0.0, seed=0):
+    """
+    Runs benchStages() over a synthetic genome at each scale, returns a record of the run:
+    when and where it ran, and for each scale its size, the errors found and the seconds
+    each stage took.
+
+    Parameters:
+    - 'scales': (name, length of the genome, number of feature lines) of each scale.
+    - 'errorRate', 'seed': see syntheticGenome().
+    """
+    run = {'time': time.strftime("%Y-%m-%dT%H:%M:%S"), 'python': platform.python_version(),
+           'machine': platform.machine(), 'errorRate': errorRate, 'scales': []}
+    for name, length, nFeatures in scales:
+        fastaPath, gffPath = syntheticGenome(length, nFeatures, errorRate, seed=seed)
+        try:
+            seconds, found = benchStages(fastaPath, gffPath)
+        finally:
+            os.remove(fastaPath)
+            os.remove(gffPath)
+        run['scales'].append({'name': name, 'genomeLength': length, 'features': nFeatures,
+                              'errors': found, 'seconds': seconds})
+    return run
+
+def recordRun(run, path):
+    """
+    Appends a run returned by suite() to the list of runs kept in the JSON file 'path',
+    which is created if it does not exist.
+    """
+    runs = []
+    if os.path.exists(path):
+        with open(path) as f1:
+            runs = json.load(f1)
+    runs.append(run)
+    with open(path, 'w') as f1:
+        json.dump(runs, f1, indent=1, sort_keys=True)
+
+def benchSort(nFeatures):
+    """
+    Times sortGff3 over a shuffled file of nFeatures lines, returns seconds taken.
+
+    Parameters:
+    - 'nFeatures': number of feature lines in the file.
+    """
+    path = syntheticGff3(nFeatures)
+    try:
+        begin = time.time()
+        validator.sortGff3(path)
+        return time.time() - begin
+    finally:
+        os.remove(path)
+
+def benchTranslate(geneLength=900, repeat=10):
+    """
+    Times translating the whole Phabio genome cut into genes of geneLength bases, returns
+    the number of genes and the seconds taken for one pass over all of them.
+
+    Parameters:
+    - 'geneLength': length of each gene.
+    - 'repeat': number of passes, the best one is reported.
+    """
+    seq = validator.fastaRead(FASTA)
+    genes = [seq[i:i+geneLength] for i in range(0, len(seq) - geneLength, geneLength)]
+    best = None
+    for run in range(repeat):
+        begin = time.time()
+        for gene in genes:
+            codons.translate(gene)
+        seconds = time.time() - begin
+        if best is None or seconds < best:
+            best = seconds
+    return len(genes), best
+
+def benchGeneCheck(geneLength=900):
+    """
+    Times building the codon index of the Phabio genome and checking it cut into genes of
+    geneLength bases on both strands, returns the number of genes and the seconds taken by
+    each step.
+
+    Parameters:
+    - 'geneLength': length of each gene.
+    """
+    seq = validator.fastaRead(FASTA)
+    lines, starts, ends = validator.array('l'), validator.array('l'), validator.array('l')
+    strands = []
+    for i, start in enumerate(range(1, len(seq) - geneLength, geneLength)):
+        lines.append(i + 1)
+        starts.append(start)
+        ends.append(start + geneLength - 1)
+        strands.append("+-"[i % 2])
+
+    begin = time.time()
+    codons.codonIndex(seq)
+    indexSeconds = time.time() - begin
+
+    begin = time.time()
+    validator.geneBatchCheck((lines, starts, ends, ''.join(strands)), seq)
+    checkSeconds = time.time() - begin
+    return len(lines), indexSeconds, checkSeconds
+
+def benchGenomeCache(geneticCode=codons.DEFAULT_CODE):
+    """
+    Times loading the Phabio genome and its codon index without a cache, into an empty
+    cache and from the cache, returns the seconds taken by each.
+
+    Parameters:
+    - 'geneticCode': genetic code the codon index is built for.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        times = []
+        for store in (None, cache.DiskCache(directory), cache.DiskCache(directory)):
+            codons._indexCache.clear()
+            begin = time.time()
+            for seq in validator.loadGenomes(FASTA, geneticCode, store).values():
+                codons.codonIndex(seq, geneticCode)
+            times.append(time.time() - begin)
+        return times
+    finally:
+        shutil.rmtree(directory)
+
+class LegacyLineError(Exception):
+    """
+    LineError as errors.py built it before the catalog: a dictionary of every message
+    filled in again for each error raised. Kept here to compare against.
+    """
+    def __init__(self, code, message=""):
+        self._dict = dict()
+        self._dict['0000'] = "Usage Error: code not used. Use printDict() to see dictionary of errors"
+        self._dict['1000'] = "Validation Error: unknown"
+        for key, value in errors.LineError._dict.iteritems():
+            self._dict[key] = value
+        self.code = str(code)
+        self.message = message
+        super(LegacyLineError, self).__init__(code, message)
+
+    def returnError(self):
+        try:
+            return self._dict[self.code]
+        except:
+            return self._dict['0000']
+
+def benchErrors(nErrors=100000):
+    """
+    Times reporting nErrors line errors by raising and catching an exception that builds
+    its dictionary of messages, as the validator used to, and by emitting them into an
+    ErrorCollector from the shared catalog. Returns the seconds taken by each.
+
+    Parameters:
+    - 'nErrors': number of errors reported.
+    """
+    found = []
+    begin = time.time()
+    for lineCount in xrange(nErrors):
+        try:
+            raise LegacyLineError("0008")
+        except LegacyLineError as er:
+            found.append("[" + str(lineCount) + "] " + er.returnError())
+    legacySeconds = time.time() - begin
+
+    collector = errors.ErrorCollector()
+    begin = time.time()
+    for lineCount in xrange(nErrors):
+        collector.emit("0008", lineCount)
+    emitSeconds = time.time() - begin
+    return legacySeconds, emitSeconds
+
+def benchLineCheck(nLines=100000):
+    """
+    Times fileCheck over nLines sorted, well formed lines without the gene checks, once
+    with each line matched by LINE_PATTERN and once with every line split and checked one
+    component at a time by columnCheck(), as it was before. Returns the seconds taken by each.
+
+    Parameters:
+    - 'nLines': number of feature lines checked.
+    """
+    path = syntheticGff3(nLines)
+    pattern = features.LINE_PATTERN
+    times = []
+    try:
+        for linePattern in (validator.re.compile(r'(?!)'), pattern): ## never matches, then the real one
+            features.LINE_PATTERN = validator.LINE_PATTERN = linePattern
+            try:
+                keyList, table = validator.sortGff3(path)
+                begin = time.time()
+                validator.fileCheck(keyList, table, None)
+                times.append(time.time() - begin)
+            finally:
+                features.LINE_PATTERN = validator.LINE_PATTERN = pattern
+    finally:
+        os.remove(path)
+    return times
+
+def printRun(run):
+    print "%-8s %10s %9s %7s" % ("scale", "genome", "features", "errors") + "".join(["%11s" % stage for stage in STAGES])
+    for scale in run['scales']:
+        print "%-8s %10d %9d %7d" % (scale['name'], scale['genomeLength'], scale['features'], scale['errors']) + \
+            "".join(["%10.3fs" % scale['seconds'][stage] for stage in STAGES])
+
+def main(sizes):
+    print "%-12s %12s %16s" % ("features", "sortGff3 (s)", "us per feature")
+    for size in sizes:
+        seconds = benchSort(size)
+        print "%-12d %12.3f %16.2f" % (size, seconds, seconds * 1e6 / size)
+
+    genes, seconds = benchTranslate()
+    print
+    print "translate: %d genes of the Phabio genome in %.2f ms" % (genes, seconds * 1000)
+
+    genes, indexSeconds, checkSeconds = benchGeneCheck()
+    print "codon index: built in %.2f ms, %d genes checked in %.2f ms" % (indexSeconds * 1000, genes, checkSeconds * 1000)
+
+    splitSeconds, matchSeconds = benchLineCheck()
+    print "100000 lines: %.1f ms checked column by column, %.1f ms with one match per line" % (splitSeconds * 1000, matchSeconds * 1000)
+
+    legacySeconds, emitSeconds = benchErrors()
+    print "100000 errors: %.1f ms raising exceptions, %.1f ms emitting from the catalog" % (legacySeconds * 1000, emitSeconds * 1000)
+
+    uncached, miss, hit = benchGenomeCache()
+    print "genome: read in %.2f ms, %.2f ms into an empty cache, %.2f ms from the cache" % (uncached * 1000, miss * 1000, hit * 1000)
+
+def cli(argv):
+    parser = argparse.ArgumentParser(description="Times the validator in CGI/.")
+    parser.add_argument('sizes', nargs='*', type=int, help="numbers of features sortGff3 is timed over")
+    parser.add_argument('--suite', action='store_true', help="time each stage over synthetic genomes")
+    parser.add_argument('--scales', default=",".join([scale[0] for scale in SCALES]), help="scales the suite runs, separated by commas")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of the synthetic genes with a fault")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="file the suite results are appended to")
+    args = parser.parse_args(argv)
+
+    if not args.suite:
+        main(args.sizes or SIZES)
+        return 0
+
+    scales = dict([(scale[0], scale) for scale in SCALES])
+    names = args.scales.split(",")
+    for name in names:
+        if name not in scales:
+            parser.error("unknown scale " + name + ", scales are " + ", ".join([scale[0] for scale in SCALES]))
+    run = suite([scales[name] for name in names], args.error_rate, args.seed)
+    printRun(run)
+    if args.json:
+        recordRun(run, args.json)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(cli(sys.argv[1:]))
@@ -2,18 +2,73 @@
 
 import cgi, os, sys, re
 import cgitb
-import gff_validator
+import gff_validator_drop as gff_validator
 import datetime
 import time
+import shutil
 import tempfile
+from cache import DiskCache
+from results import ResultCache, cachedMain, resultFiles
+from timing import StageTimer, logTo
+from metrics import MetricsFile, observedMain, observeSubmission, observeRun, observeCache
+from codons import GENETIC_CODES
 
 MAX_FILE_SIZE = 100000
+TMP_DIR = os.environ.get('GFF_VALIDATOR_TMP', '/Library/WebServer/tmp/')
+OUT_DIR = os.environ.get('GFF_VALIDATOR_OUT', '/Library/WebServer/trash/')
+OUT_URL = os.environ.get('GFF_VALIDATOR_OUT_URL', 'http://localhost/trash/')
+CACHE_DIR = os.environ.get('GFF_VALIDATOR_CACHE', '/Library/WebServer/cache/')
+RESULTS_DIR = os.environ.get('GFF_VALIDATOR_RESULTS', os.path.join(CACHE_DIR, 'results'))
+DEBUG = bool(os.environ.get('GFF_VALIDATOR_DEBUG'))		## seconds of each stage at the end of the errors file
+PROFILE_DIR = os.environ.get('GFF_VALIDATOR_PROFILE')	## directory cProfile stats of each run are written to
+LOG_PATH = os.environ.get('GFF_VALIDATOR_LOG')			## file the timing of each run is logged to
+METRICS_PATH = os.environ.get('GFF_VALIDATOR_METRICS', os.path.join(CACHE_DIR, 'metrics.state'))	## served by metrics.cgi
 
 def main():
 
+	if LOG_PATH:
+		logTo(LOG_PATH)
+	## metrics are kept best effort: a submission is validated even if they can not be written
+	try:
+		metrics = MetricsFile(METRICS_PATH)
+		metrics.update(lambda registry: registry['gff_validator_submissions_in_progress'].inc())
+	except (IOError, OSError):
+		metrics = None
+	begin = time.time()
+	outcome = 'failed'
+	observed = dict()
+	
+	## each submission gets its own directory, so submissions running at the same time
+	## do not overwrite each other's files
+	workspace = tempfile.mkdtemp(prefix='gff_', dir=TMP_DIR)
+	try:
+		observed = validate(workspace)
+		outcome = 'ok'
+	except SystemExit:
+		outcome = 'refused'
+		raise
+	finally:
+		shutil.rmtree(workspace, ignore_errors=True)
+		if metrics is not None:
+			try:
+				metrics.update(lambda registry: finished(registry, outcome, time.time() - begin, observed))
+			except (IOError, OSError):
+				pass
+
+def finished(registry, outcome, seconds, observed):
+	registry['gff_validator_submissions_in_progress'].dec()
+	observeSubmission(registry, outcome, seconds, observed.get('sizes', {}))
+	observeRun(registry, observed.get('run'))
+	if 'results' in observed:
+		observeCache(registry, 'results', *observed['results'])
+
+def validate(workspace):
+
+	timer = StageTimer()
 	status = "good"	
 	incLine = False
 	typeArr = []
+	geneticCode = gff_validator.DEFAULT_CODE
 	
 	form = cgi.FieldStorage()
 	keyList = form.keys()
@@ -28,6 +83,15 @@ def main():
 		elif key == 'optionalErr':
 			incLine = True
 			
+		elif key == 'geneticCode':
+			try:
+				geneticCode = int(form[key].value)
+			except ValueError:
+				geneticCode = None
+			if geneticCode not in GENETIC_CODES:
+				print('ERROR: unknown genetic code')
+				sys.exit(-1)
+			
 		elif key[0:4] == 'type':
 			typeArr.append((str(key)[4:5], str(form[key].value)))
 	
@@ -47,10 +111,8 @@ def main():
 		if filesize > MAX_FILE_SIZE:
 			sys.exit('GFF file to big.')
 	
-		fnA = os.path.basename(gffItem.filename.replace("\\", "/" ))
-		dest_dir = '/Library/WebServer/tmp/'
-		open(dest_dir + fnA, 'w').write(gffItem.file.read())
-		os.rename(dest_dir + fnA, dest_dir + 'gffITEM.gff')
+		gffPath = os.path.join(workspace, 'gffITEM.gff')
+		open(gffPath, 'w').write(gffItem.file.read())
 	else:
 		status = "bad"
 
@@ -65,12 +127,8 @@ def main():
 			sys.exit('FASTA file to big.')
 
 		
-		fnB = os.path.basename(seqItem.filename.replace("\\", "/" ))
-		dest_dir = '/Library/WebServer/tmp/'
-		open(dest_dir + fnB, 'w').write(seqItem.file.read())
-		os.rename(dest_dir + fnB, dest_dir + 'seqITEM.fasta')
-		
-		#open('/tmp/' + fnB, 'w').write(seqItem.file.read())	
+		seqPath = os.path.join(workspace, 'seqITEM.fasta')
+		open(seqPath, 'w').write(seqItem.file.read())
 	else:
 		status = "bad"
 	
@@ -78,19 +136,29 @@ def main():
 		print('ERROR: Problem reading either the gff or fasta file')
 		sys.exit(-1)
 	
-	suf = '_DT_' + str(datetime.datetime.fromtimestamp(time.time())) +'.txt'
-	dir = '/Library/WebServer/trash/'
-	
-	newErrors = tempfile.NamedTemporaryFile(suffix=suf, prefix='Errors_', dir=dir, delete=False)
-	newSorted = tempfile.NamedTemporaryFile(suffix=suf, prefix='Sorted_', dir=dir, delete=False)
-			
-	gff_validator.main('/Library/WebServer/tmp/gffITEM.gff','/Library/WebServer/tmp/seqITEM.fasta', newErrors, newSorted, incLine, typeArr)
-		
-	newErrors.close()
-	newSorted.close()
-	
-	item_E = "http://localhost/" + newErrors.name[19:]
-	item_S = "http://localhost/" + newSorted.name[19:]
+	observed = {'sizes': {'gff': os.path.getsize(gffPath), 'fasta': os.path.getsize(seqPath)}}
+	profile = None
+	if PROFILE_DIR:
+		handle, profile = tempfile.mkstemp(prefix='profile_', suffix='.pstats', dir=PROFILE_DIR)
+		os.close(handle)
+	
+	def run(*job):
+		observed['run'] = observedMain(*job, cache=DiskCache(CACHE_DIR), debug=DEBUG, profile=profile)
+	
+	with timer.stage('validate'):
+		if DEBUG or PROFILE_DIR:
+			## timed or profiled runs are validated again, even if seen before
+			errorsPath, sortedPath = resultFiles(OUT_DIR)
+			run(gffPath, seqPath, errorsPath, sortedPath, incLine, typeArr, geneticCode)
+		else:
+			## the same files submitted again with the same options get the results of the first run
+			results = ResultCache(RESULTS_DIR)
+			errorsPath, sortedPath = cachedMain(results, gffPath, seqPath, OUT_DIR, incLine, typeArr, geneticCode, run=run)
+			observed['results'] = (results.hits, results.misses)
+	timer.log('submission', gff=os.path.basename(gffItem.filename), errorsFile=os.path.basename(errorsPath))
+	
+	item_E = OUT_URL + os.path.basename(errorsPath)
+	item_S = OUT_URL + os.path.basename(sortedPath)
 		
 	new_html = '''
 	<!DOCTYPE html>
@@ -112,6 +180,7 @@ def main():
 	'''
 	
 	print(new_html.format(**locals()))
+	return observed
 	
 	   
 def sortArray(inArray):
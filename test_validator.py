@@ -0,0 +1,1206 @@
+import os, sys, glob, json, time, pstats, shutil, tempfile, threading, subprocess, itertools, StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CGI'))
+
+import gff_validator_drop as validator
+import codons
+import registry
+import fasta
+import features
+import overlaps
+import hierarchy
+import incremental
+import results
+import timing
+import metrics
+import cache
+import gff_server
+import gff_batch
+import benchmark
+
+'''
+checks for the validator used by the CGI scripts in CGI/
+
+each test writes a small gff file and runs it through the validator, errors are collected
+in a new ErrorCollector for every run.
+'''
+
+DOCS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'docs')
+
+def writeGff(lines):
+    'writes lines to a temporary gff file and returns the path'
+    handle, path = tempfile.mkstemp(suffix='.gff3')
+    os.write(handle, "\n".join(lines) + "\n")
+    os.close(handle)
+    return path
+
+def writeFasta(text):
+    'writes text to a temporary fasta file and returns the path'
+    handle, path = tempfile.mkstemp(suffix='.fasta')
+    os.write(handle, text)
+    os.close(handle)
+    return path
+
+def multipart(fields, files):
+    'encodes form fields and (name, filename, contents) files as a multipart/form-data body'
+    boundary = '----validatorTestBoundary'
+    parts = []
+    for name, value in fields:
+        parts.append('--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' % (boundary, name, value))
+    for name, filename, contents in files:
+        parts.append('--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\n'
+                     'Content-Type: application/octet-stream\r\n\r\n%s\r\n' % (boundary, name, filename, contents))
+    parts.append('--%s--\r\n' % boundary)
+    return 'multipart/form-data; boundary=' + boundary, ''.join(parts)
+
+def callApp(app, method='GET', path='/', fields=[], files=[]):
+    'calls a WSGI application, returns the status and body of its answer'
+    environ = {'REQUEST_METHOD': method, 'PATH_INFO': path, 'wsgi.input': StringIO.StringIO('')}
+    if method == 'POST':
+        contentType, body = multipart(fields, files)
+        environ.update({'CONTENT_TYPE': contentType, 'CONTENT_LENGTH': str(len(body)),
+                        'wsgi.input': StringIO.StringIO(body)})
+    answer = {}
+    def start_response(status, headers):
+        answer['status'] = status
+    body = ''.join(app(environ, start_response))
+    return answer['status'], body
+
+def submission(gffName='Phabio_biology.gff3', fields=[]):
+    'form fields and files submitting a docs gff file with the Phabio genome'
+    files = [('gffFile', gffName, open(os.path.join(DOCS, gffName)).read()),
+             ('seqFile', 'Phabio.fasta', open(os.path.join(DOCS, 'Phabio.fasta')).read())]
+    return {'fields': fields or [('type1', '')], 'files': files}
+
+def runSort(lines, types=['gene','mRNA','exon']):
+    'runs sortGff3 over lines, returns the sorted lines and the errors found'
+    errors = validator.ErrorCollector()
+    path = writeGff(lines)
+    try:
+        keyList, holder = validator.sortGff3(path, types, errors)
+    finally:
+        os.remove(path)
+    return [holder[key].strip() for key in keyList], errors.lines()
+
+def runMain(gffPath, **options):
+    'runs main over gffPath against the Phabio genome, returns the error and sorted file text'
+    newErrors = StringIO.StringIO()
+    newSorted = StringIO.StringIO()
+    validator.main(gffPath, os.path.join(DOCS, 'Phabio.fasta'), newErrors, newSorted, **options)
+    return newErrors.getvalue(), newSorted.getvalue()
+
+def feature(type, start, end, attributes='.', strand='+'):
+    'builds a tab delimited gff line'
+    return "\t".join(['Phabio', 'Group', type, str(start), str(end), '.', strand, '.', attributes])
+
+
+def test_sortGff3_1():
+    'lines are ordered by start coordinate'
+    lines = [feature('gene', 500, 800), feature('gene', 10, 300)]
+    result, errors = runSort(lines)
+    assert result == [lines[1], lines[0]]
+
+def test_sortGff3_2():
+    'lines with the same start are ordered by the type hierarchy'
+    lines = [feature('exon', 10, 300), feature('gene', 10, 300), feature('mRNA', 10, 300)]
+    result, errors = runSort(lines)
+    assert result == [lines[1], lines[2], lines[0]]
+
+def test_sortGff3_3():
+    'contig line is pinned first even when it comes late in the file'
+    lines = [feature('gene', 1, 300), feature('mRNA', 1, 300), feature('exon', 1, 300), feature('contig', 1, 5000)]
+    result, errors = runSort(lines)
+    assert result[0] == lines[3]
+
+def test_sortGff3_4():
+    'a second contig line is reported'
+    lines = [feature('contig', 1, 5000), feature('contig', 1, 6000)]
+    result, errors = runSort(lines)
+    assert len(result) == 1
+    assert errors == ["[1] Format Error: multiple contigs. There should only be one contig line per sequence."]
+
+def test_sortGff3_5():
+    'non numeric start coordinates sort last instead of crashing'
+    lines = [feature('gene', 'abc', 300), feature('gene', 10, 300)]
+    result, errors = runSort(lines)
+    assert result == [lines[1], lines[0]]
+
+def test_sortGff3_6():
+    'example unsorted file comes back contig first, then gene/mRNA/exon per start'
+    keyList, holder = validator.sortGff3(os.path.join(DOCS, 'Phabio_unsorted.gff3'))
+    result = [holder[key].split("\t")[2] + " " + holder[key].split("\t")[3] for key in keyList]
+    expected = ['contig 1']
+    for start in ['43', '445', '671', '24951']:
+        expected += ['gene ' + start, 'mRNA ' + start, 'exon ' + start]
+    assert result == expected
+
+def test_sortGff3_7():
+    'genes sharing a start coordinate are all kept, as whole sets of types'
+    lines = [feature('gene', 10, 300, strand='+'), feature('mRNA', 10, 300), feature('exon', 10, 300),
+             feature('gene', 10, 200, strand='-'), feature('mRNA', 10, 200), feature('exon', 10, 200)]
+    result, errors = runSort(lines)
+    assert sorted(result) == sorted(lines)
+    assert errors == []
+
+def test_sortGff3_8():
+    'sorting keeps lines missing a type, the hierarchy is left to fileCheck'
+    lines = [feature('mRNA', 10, 300), feature('exon', 10, 300), feature('gene', 400, 900), feature('gene', 400, 900, strand='-'),
+             feature('mRNA', 400, 900), feature('exon', 400, 900)]
+    result, errors = runSort(lines)
+    assert len(result) == 6
+    assert errors == []
+
+def test_sortGff3_9():
+    'lines are grouped by sequence in the order the sequences appear, each with its contig line first'
+    lines = [feature('gene', 500, 800), 'b' + feature('gene', 10, 300), 'b' + feature('contig', 1, 5000), feature('gene', 10, 300),
+             feature('contig', 1, 5000), 'b' + feature('contig', 1, 6000)]
+    errors = validator.ErrorCollector()
+    path = writeGff(lines)
+    try:
+        keyList, table = validator.sortGff3(path, errors=errors)
+    finally:
+        os.remove(path)
+    assert [table[row].strip() for row in keyList] == [lines[4], lines[3], lines[0], lines[2], lines[1]]
+    assert table.partitions(keyList) == [('Phabio', 0, 3), ('bPhabio', 3, 5)]
+    assert [record.line for record in errors] == [5]
+
+def test_featureSortKey_1():
+    'key is (start, type rank, end)'
+    result = validator.featureSortKey(feature('mRNA', 10, 300).split("\t"))
+    assert result == (10, 1, 300)
+
+def test_stream_1():
+    'streaming a sorted file finds the same errors and sorted lines as the buffered path'
+    path = os.path.join(DOCS, 'Phabio_full.of.mistakes.gff3')
+    errorsA, sortedA = runMain(path)
+    errorsB, sortedB = runMain(path, stream=True)
+    assert errorsA == errorsB
+    assert sortedA == sortedB
+
+def test_stream_2():
+    'streaming an unsorted file falls back to the buffered path'
+    path = os.path.join(DOCS, 'Phabio_unsorted.gff3')
+    assert runMain(path, stream=True) == runMain(path)
+
+def test_stream_3():
+    'a contig line after the features counts as out of order'
+    path = os.path.join(DOCS, 'Phabio_lateContig.gff3')
+    assert runMain(path, stream=True) == runMain(path)
+
+def test_stream_4():
+    'the type hierarchy is checked the same when streaming'
+    path = writeGff([feature('contig', 1, 5000), feature('gene', 10, 300, 'ID=g1;Name=g1'), feature('mRNA', 10, 300, 'ID=m1;Parent=g1'),
+                     feature('exon', 10, 300, 'ID=e1;Parent=m1'), feature('gene', 400, 900, 'ID=g2;Name=g2')])
+    try:
+        errors, sortedText = runMain(path, stream=True)
+        assert (errors, sortedText) == runMain(path)
+    finally:
+        os.remove(path)
+    assert "[2] Line Error: 9th component = no line" not in errors
+    assert "[5] Line Error: 9th component = no line of the next type names this ID as its Parent. Default types are [gene, mRNA, exon]. Missing: mRNA." in errors
+
+def test_stream_5():
+    'every docs file gives the same report and sorted file streamed or not, lines included or not'
+    for path in sorted(glob.glob(os.path.join(DOCS, '*.gff3'))):
+        for incLine in (False, True):
+            assert runMain(path, incLine=incLine, stream=True) == runMain(path, incLine=incLine), (path, incLine)
+    errors, sortedText = runMain(os.path.join(DOCS, 'Phabio_invalidType.gff3'), stream=True)
+    assert sortedText == '' and len(errors.splitlines()) == 2
+
+def test_stream_6():
+    'a gene coordinate too big for the coordinate arrays is left out of the gene checks, streamed or not'
+    huge = '99999999999999999999999'
+    path = writeGff([feature('contig', 1, 5000), feature('gene', 100, 400, 'ID=g1; Name=g1'),
+                     feature('mRNA', 100, 400, 'ID=m1; Parent=g1'), feature('exon', 100, 400, 'ID=e1; Parent=m1'),
+                     feature('gene', 1000, huge, 'ID=g2; Name=g2')])
+    try:
+        for incLine in (False, True):
+            assert runMain(path, incLine=incLine, stream=True) == runMain(path, incLine=incLine)
+    finally:
+        os.remove(path)
+    assert validator.geneFields(feature('gene', 1000, huge)) is None
+
+def test_readGff3_1():
+    'the offsets readGff3 keeps read each line back from the file'
+    lines = [feature('contig', 1, 5000), feature('gene', 100, 400, 'ID=g1; Name=g1'), '', feature('mRNA', 100, 400, 'ID=m1; Parent=g1')]
+    path = writeGff(lines)
+    try:
+        offsets = validator.array('l')
+        read = list(validator.readGff3(path, offsets))
+        assert len(offsets) == len(read) == 4
+        f1 = open(path)
+        for (lineCount, line), offset in zip(read, offsets):
+            f1.seek(offset)
+            assert f1.readline() == line == lines[lineCount] + "\n"
+        f1.close()
+    finally:
+        os.remove(path)
+
+def test_FeatureTable_1():
+    'lines are parsed once into columns, the 9th component kept as an offset into the line'
+    table = features.FeatureTable()
+    rows = [table.append(line + "\n") for line in [feature('contig', 1, 5000), '  ' + feature('mRNA', 10, 300, 'ID=a; x', '-'),
+                                                      feature('gene', 'abc', 300, 'ID=b', 'x'), feature('CDS', 5, 9), 'Phabio\tGroup']]
+    assert rows == [0, 1, 2, 3, 4] and len(table) == 5
+    assert [table.typeName(row) for row in rows] == ['contig', 'mRNA', 'gene', None, None]
+    assert list(table.wellFormed) == [1, 1, 0, 0, 0]
+    assert list(table.widths) == [9, 9, 9, 9, 2]
+    assert table.attributeText(1) == 'ID=a; x' and table.attributeText(2) == 'ID=b'
+    assert table.strands.tostring()[:3] == '+-x'
+    assert table.starts[2] == features.NO_COORDINATE
+    assert table[1] == '  ' + feature('mRNA', 10, 300, 'ID=a; x', '-') + "\n"
+
+def test_FeatureTable_2():
+    'rows sort as featureSortKey orders their lines'
+    lines = [feature('exon', 10, 300), feature('gene', 'abc', 300), feature('gene', 10, 300), feature('mRNA', 10, 200), feature('gene', 5, 30)]
+    table = features.FeatureTable()
+    for line in lines:
+        table.append(line)
+    expected = sorted(lines, key=lambda line: validator.featureSortKey(line.split("\t")))
+    assert [table[row] for row in table.sortedRows(range(len(lines)))] == expected
+
+def test_OverlapIndex_1():
+    'overlapping() finds every gene sharing a base with a span, and only those'
+    starts = [10, 50, 60, 400, 420, 900]
+    ends = [1000, 80, 70, 500, 430, 950]
+    index = overlaps.OverlapIndex(starts, ends, range(6))
+    for coord1, coord2 in [(1, 5), (75, 90), (100, 399), (425, 425), (940, 2000), (1001, 2000)]:
+        found = sorted([index.ids[i] for i in index.overlapping(coord1, coord2)])
+        assert found == [i for i in range(6) if starts[i] <= coord2 and ends[i] >= coord1]
+
+def test_OverlapIndex_2():
+    'a long gene early on is found by every search it overlaps, and the others still match a scan'
+    import random
+    rand = random.Random(7)
+    starts = [1] + [rand.randint(2, 50000) for i in range(500)]
+    ends = [60000] + [start + rand.randint(100, 2000) for start in starts[1:]]
+    index = overlaps.OverlapIndex(starts, ends, range(len(starts)))
+    for i in range(200):
+        coord1 = rand.randint(1, 52000)
+        coord2 = coord1 + rand.randint(0, 300)
+        found = [index.ids[position] for position in index.overlapping(coord1, coord2)]
+        assert sorted(found) == [i for i in range(len(starts)) if starts[i] <= coord2 and ends[i] >= coord1]
+        assert found[-1] == 0 and sorted(index.overlapping(coord1, coord2), reverse=True) == index.overlapping(coord1, coord2)
+
+def test_spacingErrors_1():
+    'long same strand overlaps, duplicate genes and long gaps are reported on the later gene'
+    genes = (validator.array('l', [1, 4, 7, 10, 13]), validator.array('l', [100, 200, 200, 380, 1500]),
+             validator.array('l', [400, 300, 300, 700, 1800]), '++-++')
+    records = overlaps.spacingErrors(genes, 2000, maxOverlap=30, maxGap=500)
+    assert [(record.line, record.code, record.severity) for record in records] == \
+        [(4, '0060', 'warning'), (13, '0080', 'warning')] ## line 10 overlaps line 1 by only 21 bases
+    assert records[0].message.endswith("Overlaps the gene on line 1 by 101 bases.")
+    assert records[1].message.endswith("799 bases before this gene.")
+    genes = (genes[0], genes[1], genes[2], '+++++')
+    records = overlaps.spacingErrors(genes, 3000, maxOverlap=30, maxGap=500)
+    assert ('0070', "Same as the gene on line 4.") in [(record.code, record.message[-27:]) for record in records]
+    assert records[-1].message.endswith("1200 bases after this gene.")
+
+def test_FeatureGraph_1():
+    'features are checked against the type and coordinates of their parents'
+    graph = hierarchy.FeatureGraph()
+    graph.add(1, 'gene', 10, 300, 'g1')
+    graph.add(2, 'mRNA', 10, 300, 'm1', 'g1')
+    graph.add(3, 'exon', 10, 100, 'e1', 'm1')
+    graph.add(4, 'exon', 200, 300, 'e2', 'm1')
+    graph.add(5, 'exon', 250, 400, 'e3', 'm1')
+    graph.add(6, 'exon', 10, 300, 'e4', 'g1')
+    graph.add(7, 'exon', None, 300, 'e5', 'm1')
+    result = [(record.line, record.code) for record in graph.check()]
+    assert result == [(5, '0029'), (6, '0028')]
+
+def test_FeatureGraph_2():
+    'parent loops and features without a child of the next type are reported'
+    graph = hierarchy.FeatureGraph()
+    graph.add(1, 'gene', 10, 300, 'g1')
+    graph.add(2, 'mRNA', 10, 300, 'm1', 'm2')
+    graph.add(3, 'mRNA', 10, 300, 'm2', 'm1')
+    graph.add(4, 'mRNA', 10, 300, 'm3', 'm3,missing')
+    graph.add(5, 'exon', 10, 300, 'e1', 'm1,m2,m3')
+    records = graph.check()
+    result = sorted(set((record.line, record.code) for record in records))
+    assert result == [(1, '0027'), (2, '0028'), (2, '0031'), (3, '0028'), (3, '0031'), (4, '0028'), (4, '0031')]
+    assert [record.line for record in records] == sorted(record.line for record in records)
+    assert records[0].message.endswith(" Missing: mRNA.")
+
+def test_translate_1():
+    'translates codon by codon and ignores trailing bases'
+    result = codons.translate('ATGGCCTAAGG')
+    assert result == 'MA*'
+
+def test_translate_2():
+    'lower case sequence translates the same'
+    result = codons.translate('atggcctaa')
+    assert result == 'MA*'
+
+def test_translate_3():
+    'TGA is a stop in the bacterial code and tryptophan in code 4'
+    assert codons.translate('ATGTGA') == 'M*'
+    assert codons.translate('ATGTGA', 4) == 'MW'
+
+def test_translate_4():
+    'codons with other characters raise KeyError'
+    try:
+        codons.translate('ATGNNN')
+    except KeyError:
+        return
+    assert False
+
+def test_codonTable_1():
+    'every code has all 64 codons and unknown codes are refused'
+    for code in codons.GENETIC_CODES:
+        assert len(codons.codonTable(code)) == 64
+    try:
+        codons.codonTable(99)
+    except ValueError:
+        return
+    assert False
+
+def test_IDRegistry_1():
+    'defining an ID twice returns the line it was first defined on'
+    ids = registry.IDRegistry()
+    assert ids.define('gene1', 3) is None
+    assert ids.define('gene1', 9) == 3
+    assert ids.firstLine('gene1') == 3
+
+def test_IDRegistry_2():
+    'references resolve whether the parent is defined before or after them'
+    ids = registry.IDRegistry()
+    ids.define('gene1', 1)
+    ids.refer('gene1', 2)
+    ids.refer('gene2', 3)
+    ids.define('gene2', 4)
+    ids.refer('gene3,gene1', 5)
+    assert ids.unresolved() == [(5, 'gene3')]
+
+def test_fileCheck_duplicateID():
+    'duplicate ID error points back to the line the ID was first used on'
+    path = writeGff([feature('gene', 10, 300, 'ID=g1;Name=g1'), feature('mRNA', 10, 300, 'ID=g1;Parent=g1')])
+    try:
+        errors, sortedText = runMain(path)
+    finally:
+        os.remove(path)
+    assert "[2] Line Error: 9th component = ID already used. Each ID must be unique. First used on line 1." in errors
+
+def test_fileCheck_missingParent():
+    'Parent that is never defined is reported on the line that refers to it'
+    path = writeGff([feature('gene', 10, 300, 'ID=g1;Name=g1'), feature('mRNA', 10, 300, 'ID=m1;Parent=g2'), feature('exon', 10, 300, 'ID=e1;Parent=m1')])
+    try:
+        errors, sortedText = runMain(path)
+    finally:
+        os.remove(path)
+    assert "[2] Line Error: 9th component = Parent not found. Each Parent must be the ID of another line. Parent: g2" in errors
+    assert "Parent: m1" not in errors
+
+def test_geneCheck_minusStrand():
+    'minus strand gene is checked on the reverse complement'
+    seq = validator.fastaRead(os.path.join(DOCS, 'Phabio.fasta'))
+    errors = validator.ErrorCollector()
+    validator.geneCheck(32700, 33152, seq, 1, strand='-', errors=errors)
+    assert len(errors) == 0
+    validator.geneCheck(32700, 33152, seq, 1, strand='+', errors=errors)
+    assert len(errors) != 0
+
+def test_CodonIndex_1():
+    'stop and start codons are found on both strands in their own frame'
+    index = codons.CodonIndex('ATGAAATAGCCCTTA')
+    assert index.isStart(0, '+')
+    assert index.isStop(6, '+')
+    assert not index.isStop(7, '+')
+    assert index.isStop(0, '-')             # TAA on the minus strand, read from the last base
+    assert list(index.stopsBetween(0, 15, '+')) == [6]
+
+def test_CodonIndex_2():
+    'minus strand span and coordinates match reverse complementing the gene'
+    seq = 'ATGAAACCCGGGTTTTAG'
+    index = codons.CodonIndex(seq)
+    rcSeq = codons.reverseComplement(seq)
+    first, last = index.span(4, 9, '-')
+    assert rcSeq[first:last] == codons.reverseComplement(seq[3:9])
+    assert index.toGenome(first, '-') == 9
+
+def test_CodonIndex_3():
+    'bases other than ACGT are found on either strand'
+    index = codons.CodonIndex('ATGNAATAG')
+    assert index.hasUnknown(0, 6, '+')
+    assert not index.hasUnknown(4, 9, '+')
+    assert index.hasUnknown(3, 6, '-')
+    assert not index.hasUnknown(0, 3, '-')
+
+def test_CodonIndex_4():
+    'nearest start codon does not cross an in frame stop codon'
+    index = codons.CodonIndex('ATGTAAGCCGTGAAATAG')
+    assert index.nearestStart(6, '+') == 9
+    assert index.nextStop(6, '+') == 15
+
+def test_geneCheck_hints():
+    'failing genes say where the nearest start and stop codons are'
+    seq = 'CCCATGAAAGGGTAGCCC'
+    errors = validator.ErrorCollector()
+    validator.geneCheck(4, 12, seq, 1, errors=errors)
+    assert errors.lines() == ["[1] Biology Error: No stop codon detected. Nearest in-frame stop codon ends at 15."]
+    errors = validator.ErrorCollector()
+    validator.geneCheck(7, 15, seq, 1, errors=errors)
+    assert errors.lines() == ["[1] Biology Error: Incorrect start codon. Must start with M Nearest in-frame start codon begins at 4."]
+
+def test_geneBatchCheck_1():
+    'batch check gives the same errors as checking genes one at a time'
+    seq = validator.fastaRead(os.path.join(DOCS, 'Phabio.fasta'))
+    keyList, holder = validator.sortGff3(os.path.join(DOCS, 'Phabio_full.of.mistakes.gff3'))
+    genes = validator.geneTable(keyList, holder)
+    results = validator.geneBatchCheck(genes, seq)
+    lines, starts, ends, strands = genes
+    for i in range(len(lines)):
+        errors = validator.ErrorCollector()
+        validator.geneCheck(starts[i], ends[i], seq, lines[i], strand=strands[i], errors=errors)
+        assert results[lines[i]] == list(errors)
+
+def test_multiContig_1():
+    'each sequence is checked against its own genome, the same in every mode'
+    fastaPath = writeFasta(">a\nATGAAATAACCCCCC\n>b one\nCCCATGAAATAA\n")
+    line = lambda seqid, type, start, end, attributes: "\t".join([seqid, 'Group', type, str(start), str(end), '.', '+', '.', attributes])
+    gffPath = writeGff([line('a', 'gene', 1, 9, 'ID=g1;Name=g1'), line('a', 'gene', 4, 12, 'ID=g2;Name=g2'), line('b', 'gene', 4, 12, 'ID=g2;Name=g2b'),
+                        line('b', 'mRNA', 4, 12, 'ID=m2;Parent=g2'), line('c', 'gene', 1, 9, 'ID=g3;Name=g3')])
+    try:
+        reports = []
+        for options in ({}, {'stream': True}, {'workers': 2}):
+            newErrors, newSorted = StringIO.StringIO(), StringIO.StringIO()
+            errors = validator.main(gffPath, fastaPath, newErrors, newSorted, typeHier=['gene', 'mRNA'], **options)
+            reports.append((newErrors.getvalue(), newSorted.getvalue()))
+    finally:
+        os.remove(fastaPath)
+        os.remove(gffPath)
+    assert reports[1] == reports[0] and reports[2] == reports[0]
+    result = [(record.line, record.code) for record in errors if record.code not in ('0027', '0080')]
+    assert result == [(2, '0040'), (3, '0012'), (5, '0014')]
+    assert "[5] Line Error: 1st component = sequence not found in the fasta file. The 1st component must be the name of a sequence. Sequence: c." in reports[0][0]
+    assert "[3] Line Error: 9th component = ID already used. Each ID must be unique. First used on line 2." in reports[0][0]
+
+def test_LineResults_1():
+    'reusing the results of earlier runs gives the same report as checking every line'
+    kept = incremental.LineResults()
+    paths = sorted(glob.glob(os.path.join(DOCS, 'Phabio*.gff3')))
+    for options in ({}, {'stream': True}, {'incLine': True}):
+        for path in paths * 2:
+            assert runMain(path, lineResults=kept, **options) == runMain(path, **options)
+    assert kept.hits > kept.misses > 0
+
+def test_LineResults_2():
+    'a resubmission only has its changed lines checked, the rest of the report follows them'
+    lines = open(os.path.join(DOCS, 'Phabio_full.of.mistakes.gff3')).read().splitlines()
+    kept = incremental.LineResults(maxLines=len(lines) * 2)
+    path = writeGff(lines)
+    try:
+        runMain(path, lineResults=kept)
+        changed = list(lines)
+        changed[5] = changed[5].replace('\t+\t', '\t-\t') ## another gene check
+        changed[8] = changed[8].replace('Parent=', 'Parent=x') ## a child no longer linked to its parent
+        changed.insert(2, changed[30]) ## the IDs of a line used before it
+        open(path, 'w').write("\n".join(changed) + "\n")
+        misses = kept.misses
+        assert runMain(path, lineResults=kept) == runMain(path)
+        assert kept.misses - misses == 2
+    finally:
+        os.remove(path)
+
+def test_LineResults_3():
+    'results kept for one fasta file are not replayed against another, even with the same genome length'
+    gff = os.path.join(DOCS, 'Phabio_biology.gff3')
+    seq = open(os.path.join(DOCS, 'Phabio.fasta')).read().splitlines()
+    seq[1] = seq[1][:10] + ('A' if seq[1][10] != 'A' else 'C') + seq[1][11:]
+    path = writeFasta("\n".join(seq) + "\n")
+    kept = incremental.LineResults()
+    try:
+        validator.main(gff, os.path.join(DOCS, 'Phabio.fasta'), StringIO.StringIO(), StringIO.StringIO(), lineResults=kept)
+        misses = kept.misses
+        newErrors = StringIO.StringIO()
+        validator.main(gff, path, newErrors, StringIO.StringIO(), lineResults=kept)
+        assert kept.misses - misses == misses
+        expected = StringIO.StringIO()
+        validator.main(gff, path, expected, StringIO.StringIO())
+        assert newErrors.getvalue() == expected.getvalue()
+    finally:
+        os.remove(path)
+    assert incremental.context('ACGT', 'a', None, ['gene'], 11) != incremental.context('ACGA', 'a', None, ['gene'], 11)
+
+def test_FastaFile_1():
+    'records are indexed by name and any range can be fetched'
+    path = writeFasta(">a first\nACGTA\nCGTAC\nGG\n>b\nTTTT\nNNAC\n")
+    try:
+        records = fasta.FastaFile(path)
+        assert records.names() == ['a', 'b']
+        assert records.sequence('a') == 'ACGTACGTACGG'
+        assert records.fetch('a', 4, 7) == 'TACG'
+        assert records.fetch('b', 3, 100) == 'TTNNAC'
+        records.close()
+    finally:
+        os.remove(path)
+
+def test_FastaFile_2():
+    'uneven lines and windows line ends still read correctly'
+    path = writeFasta(">a\r\nACG\r\nTTTT\r\n\r\nAA\r\n")
+    try:
+        records = fasta.FastaFile(path)
+        assert records.sequence('a') == 'ACGTTTTAA'
+        assert records.fetch('a', 3, 5) == 'GTT'
+        records.close()
+    finally:
+        os.remove(path)
+
+def test_FastaFile_3():
+    'Phabio genome reads the same as joining its lines'
+    path = os.path.join(DOCS, 'Phabio.fasta')
+    expected = ''.join([line.strip() for line in open(path) if not line.startswith('>')])
+    records = fasta.FastaFile(path)
+    assert records.sequence('Phabio_draft') == expected
+    records.close()
+
+def test_FastaFile_4():
+    'a record named again is reported as a duplicate and the first one kept'
+    path = writeFasta(">a\nACGT\n>b\nTTTT\n>a two\nGGGG\n")
+    try:
+        records = fasta.FastaFile(path)
+        assert records.names() == ['a', 'b']
+        assert records.sequence('a') == 'ACGT'
+        assert records.duplicates == ['a']
+        records.close()
+        try:
+            validator.readGenomes(path)
+        except validator.FormatError as er:
+            assert er.code == '0800'
+        else:
+            assert False
+        newErrors = StringIO.StringIO()
+        validator.main(os.path.join(DOCS, 'Phabio_biology.gff3'), path, newErrors, StringIO.StringIO())
+        assert newErrors.getvalue().startswith("Format Error: two sequences in the fasta file have the same name. Sequence: a. Genes were not checked.")
+    finally:
+        os.remove(path)
+
+def test_PackedSequence_1():
+    'packed sequence unpacks to the same bases, including N runs'
+    seq = 'ACGTTGCANNNACGTAC'
+    packed = fasta.PackedSequence(seq)
+    assert len(packed.packed) == 5
+    assert str(packed) == seq
+    assert packed.fetch(8, 12) == 'ANNNA'
+
+def test_fastaRead_1():
+    'more than one sequence raises 0600'
+    path = writeFasta(">a\nACGT\n>b\nACGT\n")
+    try:
+        validator.fastaRead(path)
+    except validator.FormatError as er:
+        assert er.code == '0600'
+        return
+    finally:
+        os.remove(path)
+    assert False
+
+def test_fastaRead_2():
+    'missing file raises 0700 and main reports it instead of checking genes'
+    try:
+        validator.fastaRead('/no/such/file.fasta')
+    except validator.FormatError as er:
+        assert er.code == '0700'
+    else:
+        assert False
+    newErrors = StringIO.StringIO()
+    validator.main(os.path.join(DOCS, 'Phabio_biology.gff3'), '/no/such/file.fasta', newErrors, StringIO.StringIO())
+    assert newErrors.getvalue().startswith("Format Error: unable to read fasta file. Genes were not checked.")
+    assert "Biology Error" not in newErrors.getvalue()
+
+def test_DiskCache_1():
+    'values are stored and read back, entries that can not be read are dropped'
+    directory = tempfile.mkdtemp()
+    try:
+        store = cache.DiskCache(directory)
+        assert store.get('a') is None
+        store.put('a', {'b': [1, 2]})
+        assert 'a' in store
+        assert cache.DiskCache(directory).get('a') == {'b': [1, 2]}
+        open(os.path.join(directory, 'c' + cache.SUFFIX), 'w').write('not a pickle')
+        assert store.get('c', 'missing') == 'missing'
+        assert 'c' not in store
+    finally:
+        shutil.rmtree(directory)
+
+def test_DiskCache_2():
+    'least recently used entries are removed once the cache is over its size'
+    directory = tempfile.mkdtemp()
+    try:
+        store = cache.DiskCache(directory, maxBytes=10 ** 6)
+        for age, key in enumerate(['old', 'used', 'new']):
+            store.put(key, 'x' * 1000)
+            then = time.time() - 100 + age
+            os.utime(store._path(key), (then, then))
+        assert store.get('old') is not None
+        os.utime(store._path('old'), (time.time() - 1, time.time() - 1))
+        store.maxBytes = 2500
+        store.evict()
+        assert 'used' not in store
+        assert 'old' in store and 'new' in store
+    finally:
+        shutil.rmtree(directory)
+
+def test_loadGenome_1():
+    'a genome read once is taken from the cache with its codon index the next time'
+    directory = tempfile.mkdtemp()
+    path = os.path.join(DOCS, 'Phabio.fasta')
+    try:
+        store = cache.DiskCache(directory)
+        seq = validator.loadGenomes(path, 11, store)['Phabio_draft']
+        assert seq == validator.fastaRead(path).upper()
+        entry = store.get(cache.fileDigest(path))
+        assert entry['indexes'].keys() == [11]
+        entry['genomes']['Phabio_draft'] = fasta.PackedSequence('ATGAAATAA')
+        store.put(cache.fileDigest(path), entry)
+        assert validator.loadGenomes(path, 11, store) == {'Phabio_draft': 'ATGAAATAA'}
+        assert codons.codonIndex('ATGAAATAA', 11).length == len(seq)
+    finally:
+        shutil.rmtree(directory)
+
+def test_codonIndex_1():
+    'indexes of several genomes are kept, and one is only returned for the genome it was built from'
+    first, second = 'ATGAAATAAATGCCCTGA', 'ATGTTTTAG'
+    index = codons.codonIndex(first, 11)
+    assert codons.codonIndex(second, 11) is not index
+    assert codons.codonIndex(first, 11) is index
+    codons._indexCache[(11, len(second), hash(second))] = (first, index) ## as if the two hashes were the same
+    assert codons.codonIndex(second, 11).length == len(second)
+
+def test_loadGenome_2():
+    'validating through a cache gives the same report as without one'
+    directory = tempfile.mkdtemp()
+    gff = os.path.join(DOCS, 'Phabio_biology.gff3')
+    try:
+        expected = runMain(gff)
+        store = cache.DiskCache(directory)
+        assert runMain(gff, cache=store) == expected
+        assert runMain(gff, cache=store) == expected
+        assert len(store) == 1
+    finally:
+        shutil.rmtree(directory)
+
+def test_MemoryCache_1():
+    'keeps the most recently used values and reads through to the cache behind it'
+    directory = tempfile.mkdtemp()
+    try:
+        store = cache.MemoryCache(2, cache.DiskCache(directory))
+        for key in ['a', 'b', 'c']:
+            store.put(key, key.upper())
+        assert len(store) == 2 and 'a' in store
+        assert store.get('a') == 'A'
+        store.get('c')
+        assert list(store._values) == ['a', 'c']
+        assert cache.MemoryCache().get('a', 'missing') == 'missing'
+    finally:
+        shutil.rmtree(directory)
+
+def test_MemoryCache_2():
+    'threads reading and storing values at the same time do not break the cache'
+    store = cache.MemoryCache(4)
+    failed = []
+    def use(seed):
+        try:
+            for i in range(2000):
+                key = (seed * 7 + i) % 10
+                if store.get(key) is None:
+                    store.put(key, i)
+        except Exception as er:
+            failed.append(er)
+    interval = sys.getcheckinterval()
+    sys.setcheckinterval(1) ## switch threads as often as possible
+    try:
+        threads = [threading.Thread(target=use, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setcheckinterval(interval)
+    assert not failed and len(store) == 4
+
+def test_ResultCache_1():
+    'entries older than maxAge are dropped, hits and misses are counted'
+    directory = tempfile.mkdtemp()
+    try:
+        store = results.ResultCache(directory, maxAge=60)
+        assert store.get('a') is None and store.hitRate() == 0.0
+        store.put('a', {'errors': 'e', 'sorted': 's', 'names': ('E', 'S')})
+        assert store.get('a')['errors'] == 'e'
+        assert (store.hits, store.misses, store.hitRate()) == (1, 1, 0.5)
+        entry = store.get('a')
+        entry['stored'] -= 61
+        cache.DiskCache.put(store, 'a', entry)
+        assert store.get('a', 'missing') == 'missing'
+        assert 'a' not in store
+    finally:
+        shutil.rmtree(directory)
+
+def test_cachedMain_1():
+    'a submission made again gets the files of the first, or new ones with the same report once they are removed'
+    outDir = tempfile.mkdtemp()
+    gff = os.path.join(DOCS, 'Phabio_biology.gff3')
+    seq = os.path.join(DOCS, 'Phabio.fasta')
+    try:
+        store = results.ResultCache(os.path.join(outDir, 'results'))
+        paths = results.cachedMain(store, gff, seq, outDir, incLine=True)
+        assert tuple(open(path).read() for path in paths) == runMain(gff, incLine=True)
+        assert results.cachedMain(store, gff, seq, outDir, incLine=True) == paths
+        os.remove(paths[0])
+        again = results.cachedMain(store, gff, seq, outDir, incLine=True)
+        assert again != paths and tuple(open(path).read() for path in again) == runMain(gff, incLine=True)
+        other = results.cachedMain(store, gff, seq, outDir)
+        assert tuple(open(path).read() for path in other) == runMain(gff)
+        assert (store.hits, store.misses) == (2, 2)
+    finally:
+        shutil.rmtree(outDir)
+
+def test_ValidationApp_1():
+    'a submission is validated and its results served, the same as running main'
+    outDir = tempfile.mkdtemp()
+    try:
+        app = gff_server.ValidationApp(outDir)
+        status, page = callApp(app, 'POST', '/', **submission(fields=[('type1', ''), ('optionalErr', 'on')]))
+        assert status == '200 OK'
+        links = [line.split('"')[1] for line in page.splitlines() if 'href' in line]
+        assert [link.split('/')[-1][:7] for link in links] == ['Errors_', 'Sorted_']
+        expected = runMain(os.path.join(DOCS, 'Phabio_biology.gff3'), incLine=True)
+        assert (callApp(app, path=links[0])[1], callApp(app, path=links[1])[1]) == expected
+    finally:
+        shutil.rmtree(outDir)
+
+def test_ValidationApp_2():
+    'missing files, unknown genetic codes and paths outside the results are refused'
+    outDir = tempfile.mkdtemp()
+    try:
+        app = gff_server.ValidationApp(outDir)
+        form = submission()
+        assert callApp(app, 'POST', '/', fields=[], files=form['files'][:1])[0].startswith('400')
+        assert callApp(app, 'POST', '/', fields=[('geneticCode', '99')], files=form['files'])[0].startswith('400')
+        assert callApp(app, path='/results/../test_validator.py')[0].startswith('404')
+        open(os.path.join(outDir, 'other_users_file.txt'), 'w').write('private')
+        open(os.path.join(outDir, 'Errors_other.txt'), 'w').write('private')
+        assert callApp(app, path='/results/other_users_file.txt')[0].startswith('404')
+        assert callApp(app, path='/results/Errors_other.txt')[0].startswith('404')
+        links = [line.split('"')[1] for line in callApp(app, 'POST', '/', **form)[1].splitlines() if 'href' in line]
+        assert callApp(gff_server.ValidationApp(outDir), path=links[0])[0] == '200 OK' ## found in outDir, not remembered
+        os.remove(os.path.join(outDir, links[1][len('/results/'):]))
+        assert callApp(app, path=links[1])[0].startswith('404')
+        status, page = callApp(app)
+        assert status == '200 OK' and 'name="gffFile"' in page
+    finally:
+        shutil.rmtree(outDir)
+
+def test_ValidationApp_3():
+    'submissions validated by the worker pool match those validated in process'
+    outDir = tempfile.mkdtemp()
+    cacheDir = tempfile.mkdtemp()
+    app = gff_server.ValidationApp(outDir, cacheDir=cacheDir, workers=2)
+    try:
+        for name in ['Phabio_biology.gff3', 'Phabio_unsorted.gff3']:
+            page = callApp(app, 'POST', '/', **submission(name, [('type1', 'gene'), ('type2', 'mRNA'), ('type3', 'exon')]))[1]
+            links = [line.split('"')[1] for line in page.splitlines() if 'href' in line]
+            assert (callApp(app, path=links[0])[1], callApp(app, path=links[1])[1]) == runMain(os.path.join(DOCS, name))
+        assert len(cache.DiskCache(cacheDir)) == 1
+    finally:
+        app.close()
+        shutil.rmtree(outDir)
+        shutil.rmtree(cacheDir)
+
+def test_ValidationApp_4():
+    'a submission made again is answered with the files of the first'
+    outDir = tempfile.mkdtemp()
+    try:
+        app = gff_server.ValidationApp(outDir, resultsDir=os.path.join(outDir, 'results'))
+        pages = [callApp(app, 'POST', '/', **submission())[1] for i in range(2)]
+        assert pages[0] == pages[1]
+        assert len([name for name in os.listdir(outDir) if name.startswith('Errors_')]) == 1
+        assert (app.results.hits, app.results.misses) == (1, 1)
+    finally:
+        shutil.rmtree(outDir)
+
+def test_ValidationApp_5():
+    'when debugging, submissions seen before are validated again and their reports end with the seconds of each stage'
+    outDir = tempfile.mkdtemp()
+    try:
+        app = gff_server.ValidationApp(outDir, resultsDir=os.path.join(outDir, 'results'), debug=True)
+        for i in range(2):
+            page = callApp(app, 'POST', '/', **submission())[1]
+            links = [line.split('"')[1] for line in page.splitlines() if 'href' in line]
+            assert 'Debug:' in callApp(app, path=links[0])[1]
+        assert len([name for name in os.listdir(outDir) if name.startswith('Errors_')]) == 2
+        assert app.results.hits + app.results.misses == 0
+    finally:
+        shutil.rmtree(outDir)
+
+def test_ValidationApp_6():
+    'the server counts its submissions, their errors by code and its cache hits at /metrics'
+    outDir = tempfile.mkdtemp()
+    try:
+        app = gff_server.ValidationApp(outDir, resultsDir=os.path.join(outDir, 'results'))
+        for i in range(2):
+            callApp(app, 'POST', '/', **submission())
+        callApp(app, 'POST', '/', fields=[('geneticCode', '99')], files=submission()['files'])
+        status, body = callApp(app, path='/metrics')
+        lines = body.splitlines()
+        assert status == '200 OK'
+        assert 'gff_validator_submissions_total{outcome="ok"} 2' in lines
+        assert 'gff_validator_submissions_total{outcome="refused"} 1' in lines
+        assert 'gff_validator_submissions_in_progress 0' in lines
+        assert 'gff_validator_cache_hit_ratio{cache="results"} 0.5' in lines
+        assert 'gff_validator_stage_seconds_count{stage="fileCheck"} 1' in lines
+        assert 'gff_validator_input_bytes_count{file="fasta"} 2' in lines
+        codes = validator.main(os.path.join(DOCS, 'Phabio_biology.gff3'), os.path.join(DOCS, 'Phabio.fasta'), StringIO.StringIO(), StringIO.StringIO()).codes()
+        for code, count in codes.items():
+            assert 'gff_validator_errors_total{code="%s",kind="%s"} %d' % (code, metrics.errorKind(code), count) in lines
+    finally:
+        shutil.rmtree(outDir)
+
+def test_ValidationApp_7():
+    'lookups in the genome cache are counted at /metrics'
+    outDir = tempfile.mkdtemp()
+    try:
+        app = gff_server.ValidationApp(outDir, cacheDir=os.path.join(outDir, 'genomes'))
+        for name in ['Phabio_biology.gff3', 'Phabio_unsorted.gff3', 'Phabio_multiError.gff3']:
+            callApp(app, 'POST', '/', **submission(name))
+        lines = callApp(app, path='/metrics')[1].splitlines()
+        assert 'gff_validator_cache_requests_total{cache="genomes",result="miss"} 1' in lines
+        assert 'gff_validator_cache_requests_total{cache="genomes",result="hit"} 2' in lines
+        assert 'gff_validator_cache_hit_ratio{cache="genomes"} 0.6666666666666666' in lines
+    finally:
+        shutil.rmtree(outDir)
+
+STRESS_FILES = ['Phabio_biology.gff3', 'Phabio_unsorted.gff3', 'Phabio_multiError.gff3', 'Phabio_genestart.gff3',
+                'Phabio_lateContig.gff3', 'Phabio_full.of.mistakes.gff3', 'Phabio_noContig.gff3', 'Phabio_ampersand.gff3'] * 2
+
+def test_save_file_drop_concurrent():
+    'submissions to save_file_drop.cgi running at the same time each get their own results'
+    directory = tempfile.mkdtemp()
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CGI', 'save_file_drop.cgi')
+    env = dict(os.environ, REQUEST_METHOD='POST', GFF_VALIDATOR_TMP=directory, GFF_VALIDATOR_OUT=directory,
+               GFF_VALIDATOR_OUT_URL='', GFF_VALIDATOR_CACHE=os.path.join(directory, 'cache'))
+    try:
+        processes = []
+        for name in STRESS_FILES:
+            contentType, body = multipart(**submission(name))
+            env.update(CONTENT_TYPE=contentType, CONTENT_LENGTH=str(len(body)))
+            process = subprocess.Popen([sys.executable, script], stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+            process.stdin.write(body)
+            process.stdin.close()
+            processes.append(process)
+
+        for name, process in zip(STRESS_FILES, processes):
+            page = process.stdout.read()
+            assert process.wait() == 0
+            links = [line.split('"')[1] for line in page.splitlines() if 'href' in line]
+            assert len(links) == 2, page
+            results = tuple(open(os.path.join(directory, link)).read() for link in links)
+            assert results == runMain(os.path.join(DOCS, name)), name
+        assert len(set(STRESS_FILES)) * 2 + 1 <= len(os.listdir(directory)) <= 2 * len(STRESS_FILES) + 1
+        assert not [entry for entry in os.listdir(directory) if entry.startswith('gff_')]
+        registry = metrics.MetricsFile(os.path.join(directory, 'cache', 'metrics.state')).read()
+        assert registry['gff_validator_submissions_total'].value(outcome='ok') == len(STRESS_FILES)
+        assert registry['gff_validator_submissions_in_progress'].value() == 0
+        page = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(script), 'metrics.cgi')], stdout=subprocess.PIPE, env=env).communicate()[0]
+        assert 'gff_validator_submissions_total{outcome="ok"} %d' % len(STRESS_FILES) in page.splitlines()
+    finally:
+        shutil.rmtree(directory)
+
+def test_save_file_drop_geneticCode():
+    'save_file_drop.cgi refuses a genetic code that is not a number or not known'
+    directory = tempfile.mkdtemp()
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CGI', 'save_file_drop.cgi')
+    env = dict(os.environ, REQUEST_METHOD='POST', GFF_VALIDATOR_TMP=directory, GFF_VALIDATOR_OUT=directory,
+               GFF_VALIDATOR_OUT_URL='', GFF_VALIDATOR_CACHE=os.path.join(directory, 'cache'))
+    try:
+        for code in ['abc', '99']:
+            contentType, body = multipart(**submission(fields=[('type1', ''), ('geneticCode', code)]))
+            env.update(CONTENT_TYPE=contentType, CONTENT_LENGTH=str(len(body)))
+            process = subprocess.Popen([sys.executable, script], stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+            page = process.communicate(body)[0]
+            assert 'ERROR: unknown genetic code' in page
+            assert not [entry for entry in os.listdir(directory) if entry.startswith('Errors_')]
+    finally:
+        shutil.rmtree(directory)
+
+def test_save_file_drop_metrics():
+    'a metrics file that can not be written does not stop a submission'
+    directory = tempfile.mkdtemp()
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CGI', 'save_file_drop.cgi')
+    env = dict(os.environ, REQUEST_METHOD='POST', GFF_VALIDATOR_TMP=directory, GFF_VALIDATOR_OUT=directory,
+               GFF_VALIDATOR_OUT_URL='', GFF_VALIDATOR_CACHE=os.path.join(directory, 'cache'),
+               GFF_VALIDATOR_METRICS=os.path.join(os.devnull, 'metrics.state'))
+    try:
+        contentType, body = multipart(**submission())
+        env.update(CONTENT_TYPE=contentType, CONTENT_LENGTH=str(len(body)))
+        process = subprocess.Popen([sys.executable, script], stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+        page = process.communicate(body)[0]
+        links = [line.split('"')[1] for line in page.splitlines() if 'href' in line]
+        assert len(links) == 2, page
+        assert open(os.path.join(directory, links[0])).read() == runMain(os.path.join(DOCS, 'Phabio_biology.gff3'))[0]
+    finally:
+        shutil.rmtree(directory)
+
+def test_ValidationApp_concurrent():
+    'submissions answered by the server at the same time each get their own results'
+    outDir = tempfile.mkdtemp()
+    app = gff_server.ValidationApp(outDir, workDir=outDir, workers=3)
+    pages = {}
+    def submit(i, name):
+        pages[i] = callApp(app, 'POST', '/', **submission(name))[1]
+    try:
+        threads = [threading.Thread(target=submit, args=(i, name)) for i, name in enumerate(STRESS_FILES)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i, name in enumerate(STRESS_FILES):
+            links = [line.split('"')[1] for line in pages[i].splitlines() if 'href' in line]
+            results = (callApp(app, path=links[0])[1], callApp(app, path=links[1])[1])
+            assert results == runMain(os.path.join(DOCS, name)), name
+        assert not [entry for entry in os.listdir(outDir) if entry.startswith('gff_')]
+    finally:
+        app.close()
+        shutil.rmtree(outDir)
+
+def test_batch_1():
+    'files validated across the pool get the same reports as main, with their errors counted'
+    outDir = tempfile.mkdtemp()
+    fasta = os.path.join(DOCS, 'Phabio.fasta')
+    names = ['Phabio_biology.gff3', 'Phabio_unsorted.gff3', 'Phabio_invalidType.gff3']
+    try:
+        results = gff_batch.batch([(os.path.join(DOCS, name), fasta) for name in names], outDir, workers=2)
+        for name, result in zip(names, results):
+            expected = runMain(os.path.join(DOCS, name))
+            assert (open(result['errorsFile']).read(), open(result['sortedFile']).read()) == expected
+            assert sum([result[kind] for kind in gff_batch.KINDS]) + result['warnings'] == len(expected[0].splitlines())
+        assert results[0]['Biology'] == 5 and results[0]['warnings'] == 4 and results[0]['failed'] is None
+    finally:
+        shutil.rmtree(outDir)
+
+def test_batch_2():
+    'gff files are paired with genomes through a genome map, reports of files with the same name are numbered'
+    directory = tempfile.mkdtemp()
+    try:
+        mapFile = os.path.join(directory, 'genomes.txt')
+        open(mapFile, 'w').write("# pattern fasta\nPhabio_*  %s\n*.gff3 missing.fasta\n" % os.path.join(DOCS, 'Phabio.fasta'))
+        genomes = gff_batch.readGenomeMap(mapFile)
+        assert gff_batch.genomeFor('/x/Phabio_biology.gff3', genomes) == os.path.join(DOCS, 'Phabio.fasta')
+        assert gff_batch.genomeFor('b.gff3', genomes) == os.path.join(directory, 'missing.fasta')
+        assert gff_batch.genomeFor('b.txt', genomes) is None
+        assert gff_batch.reportNames([('a/x.gff3', ''), ('b/x.gff3', ''), ('y.gff', '')]) == ['x', 'x_2', 'y']
+    finally:
+        shutil.rmtree(directory)
+
+def test_cli_1():
+    'the command line writes a report for each gff file and a summary table'
+    outDir = tempfile.mkdtemp()
+    try:
+        status = gff_batch.cli(['--fasta', os.path.join(DOCS, 'a.fasta'), '--out-dir', outDir, '--workers', '0',
+                                os.path.join(DOCS, 'Phabio_biology.gff3'), os.path.join(DOCS, 'b.gff3')])
+        assert status == 0
+        assert sorted(os.listdir(outDir)) == ['Phabio_biology.errors.txt', 'Phabio_biology.sorted.gff3',
+                                              'b.errors.txt', 'b.sorted.gff3', 'summary.tsv']
+        summary = [line.split("\t") for line in open(os.path.join(outDir, 'summary.tsv')).read().splitlines()]
+        assert summary[0] == ['file', 'genome', 'errors', 'format', 'line', 'biology', 'validation', 'warnings', 'status']
+        assert [row[-1] for row in summary[1:]] == ['errors', 'errors']
+    finally:
+        shutil.rmtree(outDir)
+
+def test_summaryTable_1():
+    'warnings are counted apart and do not give a file the errors status'
+    result = {'gff': 'a.gff3', 'fasta': 'a.fasta', 'Format': 0, 'Line': 0, 'Biology': 0, 'Validation': 0, 'warnings': 3, 'failed': None}
+    lines = gff_batch.summaryTable([result, dict(result, Biology=1)]).splitlines()
+    assert lines[1].split("\t")[2:] == ['0', '0', '0', '0', '0', '3', 'ok']
+    assert lines[2].split("\t")[-1] == 'errors'
+    codes = validator.main(os.path.join(DOCS, 'b.gff3'), os.path.join(DOCS, 'a.fasta'), StringIO.StringIO(), StringIO.StringIO()).codes()
+    assert codes['0080'] == 2 ## only the gaps of more than MAX_GAP bases, not the intergenic regions of 578 to 844
+
+def test_syntheticGenome_1():
+    'synthetic genes validate clean, and each fault is caught'
+    for errorRate, expected in ((0.0, set()), (1.0, set(['0005', '0008', '0026', '0040', '0050']))):
+        fastaPath, gffPath = benchmark.syntheticGenome(20000, 60, errorRate)
+        try:
+            errors = validator.main(gffPath, fastaPath, StringIO.StringIO(), StringIO.StringIO())
+        finally:
+            os.remove(fastaPath)
+            os.remove(gffPath)
+        assert set(record.code for record in errors) - set(['0100']) >= expected
+        if not expected:
+            assert [record.code for record in errors] == ['0100']
+
+def test_StageTimer_1():
+    'stages run twice are added up and listed in the order they first ran'
+    timer = timing.StageTimer()
+    with timer.stage('sortGff3'):
+        pass
+    timer.add('fileCheck', 2.0, 1.0)
+    timer.add('sortGff3', 1.0, 0.5)
+    assert timer.order == ['sortGff3', 'fileCheck']
+    assert timer.stages()['fileCheck'] == {'wall': 2.0, 'cpu': 1.0}
+    assert timer.wall['sortGff3'] >= 1.0 and timer.cpu['sortGff3'] >= 0.5
+    assert len(timer.lines()) == 3 and timer.lines()[2].split()[0] == 'fileCheck'
+
+def test_main_timing():
+    'a run logs the seconds of its stages, writes them to the report when debugging and can be profiled'
+    directory = tempfile.mkdtemp()
+    gff = os.path.join(DOCS, 'Phabio_biology.gff3')
+    handler = timing.logTo(os.path.join(directory, 'timing.log'))
+    try:
+        timer = timing.StageTimer()
+        newErrors, newSorted = runMain(gff, timer=timer, debug=True, profile=os.path.join(directory, 'run.pstats'))
+        assert timer.order == ['fastaRead', 'sortGff3', 'geneCheck', 'fileCheck', 'outFile']
+        assert (newErrors, newSorted) != runMain(gff)
+        assert newErrors.startswith(runMain(gff)[0]) and newSorted == runMain(gff)[1]
+        assert newErrors.splitlines()[-6].startswith('Debug:')
+        handler.flush()
+        logged = [json.loads(line) for line in open(os.path.join(directory, 'timing.log'))]
+        assert len(logged) == 4 and logged[0]['gff'] == 'Phabio_biology.gff3'
+        assert sorted(logged[0]['stages']) == sorted(timer.order)
+        assert pstats.Stats(os.path.join(directory, 'run.pstats')).total_calls > 0
+    finally:
+        timing.LOGGER.removeHandler(handler)
+        handler.close()
+        shutil.rmtree(directory)
+
+def test_Registry_1():
+    'metrics are rendered in the Prometheus text format, histogram buckets counted up to each bound'
+    registry = metrics.Registry()
+    registry.counter('requests_total', 'Requests.', ['outcome']).inc(2, outcome='a"b')
+    registry.gauge('running', 'Running.').dec()
+    sizes = registry.histogram('size', 'Sizes.', (1, 10))
+    for value in [1, 5, 50]:
+        sizes.observe(value)
+    assert registry.render().splitlines() == [
+        '# HELP requests_total Requests.', '# TYPE requests_total counter', 'requests_total{outcome="a\\"b"} 2',
+        '# HELP running Running.', '# TYPE running gauge', 'running -1',
+        '# HELP size Sizes.', '# TYPE size histogram', 'size_bucket{le="1"} 1', 'size_bucket{le="10"} 2',
+        'size_bucket{le="+Inf"} 3', 'size_sum 56.0', 'size_count 3']
+
+def test_MetricsFile_1():
+    'updates from separate MetricsFiles of the same path add up'
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'metrics', 'metrics.state')
+    try:
+        assert metrics.MetricsFile(path).read().render() == metrics.validatorMetrics().render()
+        for i in range(3):
+            metrics.MetricsFile(path).update(lambda registry: metrics.observeCache(registry, 'results', i % 2, 1 - i % 2))
+        registry = metrics.MetricsFile(path).read()
+        assert registry['gff_validator_cache_requests_total'].value(cache='results', result='miss') == 2
+        assert abs(registry['gff_validator_cache_hit_ratio'].value(cache='results') - 1 / 3.0) < 1e-9
+    finally:
+        shutil.rmtree(directory)
+
+def test_ErrorCollector_1():
+    'errors are kept as records with their line, column, code and kind'
+    errors = validator.ErrorCollector()
+    errors.add('0012', 'Line Error: 9th component = ID already used.', 4)
+    errors.add('0500', 'Format Error: each set of coordinates.', coordinate='43')
+    errors.add('0700', 'Format Error: unable to read fasta file.', severity='warning')
+    assert errors[0] == (4, 9, '0012', 'error', 'Line Error: 9th component = ID already used.', None)
+    assert [record.kind() for record in errors] == ['Line', 'Format', 'Format']
+    assert errors.lines() == ['[4] Line Error: 9th component = ID already used.',
+                              'Coordinate 43 Format Error: each set of coordinates.',
+                              'Format Error: unable to read fasta file.']
+    assert errors.counts() == {'Line': 1, 'Format': 2}
+    errors.truncate(1)
+    assert len(errors) == 1 and list(errors.records(1)) == []
+
+def test_ErrorCollector_2():
+    'main returns the errors it wrote, with the columns the line errors are about'
+    newErrors = StringIO.StringIO()
+    errors = validator.main(os.path.join(DOCS, 'Phabio_full.of.mistakes.gff3'), os.path.join(DOCS, 'Phabio.fasta'), newErrors, StringIO.StringIO())
+    assert newErrors.getvalue() == "".join([line + "\n" for line in errors.lines()])
+    columns = set([(record.code, record.column) for record in errors if record.kind() == 'Line'])
+    assert columns == set([('0002', 1), ('0006', 5)])
+    errors = validator.main(os.path.join(DOCS, 'Phabio_biology.gff3'), os.path.join(DOCS, 'Phabio.fasta'), newErrors, StringIO.StringIO())
+    assert set([record.column for record in errors if record.code in ('0011', '0013', '0025', '1000')]) == set([9])
+
+def test_main_threads():
+    'validations running in several threads at once keep their errors apart'
+    names = ['Phabio_biology.gff3', 'Phabio_full.of.mistakes.gff3', 'Phabio_unsorted.gff3', 'Phabio_genestart.gff3'] * 3
+    expected = dict([(name, runMain(os.path.join(DOCS, name))) for name in names])
+    results = {}
+    def run(i, name):
+        results[i] = runMain(os.path.join(DOCS, name))
+    threads = [threading.Thread(target=run, args=(i, name)) for i, name in enumerate(names)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for i, name in enumerate(names):
+        assert results[i] == expected[name], name
+
+def test_catalog_1():
+    'every class shares one dictionary of messages and the catalog has all of them'
+    import errors
+    assert errors.LineError("0012")._dict is errors.LineError("0013")._dict
+    for errorClass in (errors.ValidationError, errors.FormatError, errors.LineError, errors.BiologyError):
+        for code, message in errorClass._dict.items():
+            assert errors.errorMessage(code) == errorClass(code).returnError() == message
+    assert validator.FormatError("0012").returnError() == errors.errorMessage("9999") == errors.CATALOG['0000']
+    collector = validator.ErrorCollector()
+    collector.emit("0023", 7, " First used on line 3.")
+    assert collector.lines() == ["[7] Line Error: 9th component = ID already used. Each ID must be unique. First used on line 3."]
+    assert collector[0].column == 9 and collector[0].kind() == 'Line'
+
+def test_incLine_1():
+    'each error of an incLine report follows the line it is about, also past line 9'
+    lines = [feature('contig', 1, 5000)]
+    for start in range(10, 130, 30):
+        lines += [feature('gene', start, start + 20, 'ID=g%d;Name=g%d' % (start, start)),
+                  feature('mRNA', start, start + 20, 'ID=g%d.m;Parent=g%d' % (start, start)),
+                  feature('exon', start, start + 20, 'ID=g%d.e;Parent=g%d.m' % (start, start))]
+    lines[12] = feature('exon', 100, 120, 'ID=g100.e;Parent=nowhere')
+    lines.insert(0, 'header line')
+    path = writeGff(lines)
+    try:
+        report, sortedText = runMain(path, incLine=True)
+        errors = validator.main(path, os.path.join(DOCS, 'Phabio.fasta'), StringIO.StringIO(), StringIO.StringIO())
+    finally:
+        os.remove(path)
+    sortedLines = [line for line in sortedText.splitlines() if line]
+    blocks = report.split("\n\n")[:-1]
+    assert len(blocks) == len(errors)
+    for block, record in zip(blocks, errors):
+        source, text = block.rsplit("\n", 1)
+        assert text == str(record)
+        if record.code == '0100':
+            assert source == 'header line'
+        elif record.coordinate is None and record.code not in ('0020', '0030', '0040'):
+            assert source == sortedLines[record.line - 1]
+    assert "[13] Line Error: 9th component = Parent not found." in report
+    assert lines[13] + "\n[13] Line Error: 9th component = Parent not found." in report
+
+def test_incLine_2():
+    'a hierarchy error follows the line it is about'
+    path = writeGff([feature('contig', 1, 5000), feature('mRNA', 400, 900, 'ID=m1;Parent=g1'), feature('gene', 400, 900, 'ID=g1;Name=g1')])
+    try:
+        report, sortedText = runMain(path, incLine=True)
+    finally:
+        os.remove(path)
+    assert feature('mRNA', 400, 900, 'ID=m1;Parent=g1') + "\n[3] Line Error: 9th component = no line of the next type" in report
+
+def test_lineCheck_pattern():
+    'lines matched by LINE_PATTERN get the same errors as lines checked column by column'
+    variants = [('Phabio', 'Ph_abio', ''), ('Group', 'Gro&up'), ('gene', 'mRNA', 'exon', 'contig'),
+                ('10', '0', '-5', '+10', ' 10', 'x'), ('300', '5', '10', '3e2'), ('.', '7', '-2', '1.5', 'x'),
+                ('+', '-', '.'), ('.', '0')]
+    lines = itertools.product(*variants)
+    lines = ["\t".join(line + ('ID=a;Name=a;Parent=b',)) for line in lines]
+    lines += [feature('gene', 10, 300) + "\textra", "Phabio\tGroup\tgene\t10"]
+    results = []
+    for linePattern in (validator.re.compile(r'(?!)'), validator.LINE_PATTERN):
+        errors = validator.ErrorCollector()
+        pattern, validator.LINE_PATTERN = validator.LINE_PATTERN, linePattern
+        try:
+            for lineCount, line in enumerate(lines):
+                state = validator.checkState(errors=errors)
+                state['biology'] = {}
+                validator.lineCheck(line, lineCount, None, ['gene','mRNA','exon'], state)
+        finally:
+            validator.LINE_PATTERN = pattern
+        results.append(errors.lines())
+    assert results[0] == results[1]
+    assert len(results[0]) > len(lines)